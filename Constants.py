@@ -13,6 +13,17 @@ GAME_WINDOW_SIZE = (600, 600)
 PLACE_WINDOW_SIZE = GAME_WINDOW_SIZE
 TILE_SIZE = (16, 16)
 
+# TIME
+TICKS_PER_DAY = 200  # A player action lasts one tick
+
+# MEMORY
+TOWN_MEMORY_BUDGET = 32 * 1024 * 1024  # Rendered surfaces and layers of the towns visited (see Places.TownCache)
+
+# SAVE
+AUTOSAVE_FILE = "autosave.sav"
+AUTOSAVE_TICKS = 100  # The game is autosaved every AUTOSAVE_TICKS ticks, and when the player changes town
+AUTOSAVE_COMPACTION_INTERVAL = 20  # Number of incremental autosaves before a full one (see SaveGame.AutoSave)
+
 DISPLAY_EVENT = USEREVENT + 1
 DEBUG_EVENT = USEREVENT + 2
 
@@ -28,6 +39,7 @@ ORYX_TILE_SIZE = (24, 24)
 ICON_IMAGE_RESOURCE_FOLDER = str(os.curdir + os.sep + "resources" + os.sep + "img" + os.sep + "GameIcons" + os.sep)
 
 DEFAULT_RESOURCE_STYLE = DAWNLIKE_STYLE
+TILESET_CACHE_FOLDER = None  # Where the scaled autotile sets are kept between runs (see Places.TilesetCache)
 
 KENNEY_IMAGE_RESOURCE_FOLDER = str(
     os.curdir + os.sep + "resources" + os.sep + "img" + os.sep + "Kenney" + os.sep + "UIPack" + os.sep)
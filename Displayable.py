@@ -15,12 +15,19 @@ __author__ = 'staug'
 
 
 class DisplayableObject(object):
-    def __init__(self, movable=True, blocking=False, position_on_tile=(0, 0), graphical_representation=None):
+    def __init__(self, movable=True, blocking=False, position_on_tile=(0, 0), graphical_representation=None,
+                 sprite_definition=None):
+        """
+        :param graphical_representation: the sprite
+        :param sprite_definition: if there is no sprite yet, the definition of the sprite to build later (see
+        build_graphical_representation and make_sprite)
+        """
         self.position_on_tile = position_on_tile
         self.movable = movable
         self.blocking = blocking
 
         self.graphical_representation = None
+        self.sprite_definition = sprite_definition
         self.set_graphical_representation(graphical_representation)
 
 
@@ -28,6 +35,14 @@ class DisplayableObject(object):
         if graphical_representation:
             self.graphical_representation = graphical_representation
             self.graphical_representation.owner = self
+            self.sprite_definition = graphical_representation.definition
+
+    def build_graphical_representation(self):
+        """
+        Build the sprite out of its definition, if it was not built yet
+        """
+        if not self.graphical_representation and self.sprite_definition:
+            self.set_graphical_representation(make_sprite(self.sprite_definition))
 
 
     def set_graphical_surface(self, surface_to_draw, surface_memory):
@@ -47,6 +62,8 @@ class SpriteObject(object):
     """
 
     def __init__(self, style, image_folder, image_file, animation_coordinates_in_file):
+        # What the sprite is made of, to rebuild it (see make_sprite)
+        self.definition = (self.__class__.__name__, style, image_folder, image_file, animation_coordinates_in_file)
         if image_file:
             if style == Constants.DAWNLIKE_STYLE:
                 self.animation = Util.PygAnimation(
@@ -102,6 +119,8 @@ class AnimatedSpriteObject(SpriteObject):
         """
 
         super().__init__(style, animation_folder, None, None)
+        self.definition = (self.__class__.__name__, style, animation_folder, animation_file,
+                           animation_coordinates_in_file)
         if style == Constants.DAWNLIKE_STYLE:
             # Dawnlike settings: 16x16, the first image of the animation is in one file called "0"
             self.animation = Util.PygAnimation(
@@ -111,4 +130,16 @@ class AnimatedSpriteObject(SpriteObject):
                   animation_coordinates_in_file, 0.2, Constants.DAWNLIKE_TILE_SIZE, Constants.TILE_SIZE)]
             )
         else:
-            raise Exception("Origin type unknown" + style)
\ No newline at end of file
+            raise Exception("Origin type unknown" + style)
+
+
+def make_sprite(definition):
+    """
+    Build a sprite out of its definition
+    :param definition: (sprite class name, style, folder, file, coordinates in file), see SpriteObject.definition
+    :return: the SpriteObject or AnimatedSpriteObject
+    """
+    (class_name, style, folder, file, coordinates) = definition
+    if class_name == AnimatedSpriteObject.__name__:
+        return AnimatedSpriteObject(style, folder, file, coordinates)
+    return SpriteObject(style, folder, file, coordinates)
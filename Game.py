@@ -1,15 +1,16 @@
-from Displayable import DisplayableObject
 from Displayable import AnimatedSpriteObject
-from GameObject import GameObject, Door
 
 __author__ = 'Tangil'
 
+import concurrent.futures
 import planes
 import planes.gui
 import planes.gui.tmb
 import random
 import Places
 import Player
+import SaveGame
+import Simulation
 import pygame
 import Util
 from pygame.locals import *
@@ -32,16 +33,46 @@ class Game():
         pass
 
     @classmethod
-    def start_new_game(cls, number_town):
+    def start_new_game(cls, number_town, simulation_workers=0, town_memory_budget=Constants.TOWN_MEMORY_BUDGET,
+                       seed=None, generation_workers=0, prefetch_workers=0):
+        """
+        :param number_town: the number of towns in the world
+        :param simulation_workers: number of worker processes used to simulate the towns off screen (0: serial)
+        :param town_memory_budget: memory allowed for the maps of the towns visited (see Places.TownCache)
+        :param seed: the world seed, random if not given. Every random generator of the world generation and of the
+        simulation is seeded out of it (see Util.derive_seed): the same seed gives the same world.
+        :param generation_workers: number of worker processes generating the maps of all the towns up front (see
+        Places.generate_town_layout). 0: each map is generated on the first visit of its town.
+        :param prefetch_workers: number of worker processes generating the maps of the next towns while the player
+        is in a town (see Places.TownPrefetcher). 0: no prefetch.
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        GameData.world_seed = seed
+        world_rng = random.Random(Util.derive_seed(seed, "world"))
+
         Util.DebugEvent("Initializing Time")
         GameData.time_ticker = Util.Ticker()
 
         Util.DebugEvent("Building new world")
-        GameData.town_graph = Places.TownGraph([Places.Town(random.randint(2, 7)) for x in range(number_town)])
+        GameData.town_cache = Places.TownCache(budget=town_memory_budget)
+        building_numbers = [world_rng.randint(2, 7) for x in range(number_town)]
+        town_seeds = [Util.derive_seed(seed, "town", x) for x in range(number_town)]
+        towns = [Places.Town(building_number, seed=town_seed)
+                 for (building_number, town_seed) in zip(building_numbers, town_seeds)]
+        if generation_workers:
+            Util.DebugEvent("Generating the town maps")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=generation_workers) as executor:
+                for (town, layout) in zip(towns, executor.map(Places.generate_town_layout,
+                                                              [town.size for town in towns], town_seeds,
+                                                              chunksize=max(1, number_town // (
+                                                                  4 * generation_workers)))):
+                    town.layout = layout
+        GameData.town_graph = Places.TownGraph(towns, rng=random.Random(Util.derive_seed(seed, "graph")))
 
         Util.DebugEvent("Choosing the initial town")
-        GameData.current_town = random.choice(GameData.town_graph.towns)
-        GameData.current_town.build_tile_map()
+        GameData.current_town = world_rng.choice(GameData.town_graph.towns)
+        GameData.current_town.materialize()
 
         Util.DebugEvent("Setting up player")
         GameData.player = Player.Player(GameData.current_town,
@@ -49,62 +80,21 @@ class Game():
                                                                                       "Characters", "Player",
                                                                                       (16, 112)),
                                         position_on_tile=GameData.current_town.tile_map.default_start_player_position)
-
-        Util.DebugEvent("Setting up objects in the towns...")
-        for town in GameData.town_graph.towns:
-            for i in range(5):
-                image_coordinate_x = [x * 16 for x in range(0, 7)]
-                image_coordinate_y = [y * 16 for y in (3, 4, 7, 8)]
-                coordinates = (random.choice(image_coordinate_x), random.choice(image_coordinate_y))
-                # npc = Player.TraderNPC(town,
-                # position_on_tile=town.tile_map.get_place_in_building(Places.Building.TRADING_POST),
-                #                        graphical_representation=Player.AnimatedSpriteObject(True, "Characters", "Player", coordinates))
-                npc = Player.NonPlayableCharacter(town,
-                                                  speed=(1, 3),
-                                                  position_on_tile=(i * 1, i * 2),
-                                                  graphical_representation=AnimatedSpriteObject(
-                                                      Constants.DAWNLIKE_STYLE, "Characters", "Player", coordinates))
-
-                GameData.register_object(npc)
-
-            for i in range(25):
-                """
-                 name,
-                 object_type,
-                 weight=None,
-                 volume=None,
-                 regular_value=None,
-                 action_when_player=None,
-                 equipment=None,
-                 usable_part=None,
-                 breakable_parts=None,
-                 part_of_inventory=None,
-                 displayable_object=None):
-                """
-
-                an_object = GameObject("A leftover object " + str(i),
-                                       GameObject.JUNK,
-                                       town=town,
-                                       weight=random.randint(1, 10),
-                                       volume=random.randint(1, 5),
-                                       regular_value=random.randint(2, 10),
-                                       displayable_object=DisplayableObject(movable=False, blocking=False,
-                                                                            position_on_tile=(
-                                                                                random.randint(0,
-                                                                                               town.tile_map.max_x - 1),
-                                                                                random.randint(0,
-                                                                                               town.tile_map.max_y - 1)),
-                                                                            graphical_representation=AnimatedSpriteObject(
-                                                                                Constants.DAWNLIKE_STYLE, "Objects",
-                                                                                "Ground", (16, 48))))
-                GameData.register_object(an_object)
-                # a door is an open object
-            for room in town.tile_map.rooms:
-                for door in room.doors:
-                    GameData.register_object(Door(town, door[1], door[0], closed=True, locked=False))
+        GameData.game_dict.register(GameData.player)
 
         Util.DebugEvent("Setting up objects in the other places (To be done later)...")
 
+        Util.DebugEvent("Starting the simulation of the other towns")
+        GameData.world_simulation = Simulation.WorldSimulation(seed=Util.derive_seed(seed, "simulation"),
+                                                               workers=simulation_workers)
+        GameData.world_simulation.start()
+
+        if GameData.town_prefetcher:
+            GameData.town_prefetcher.shutdown()
+        GameData.town_prefetcher = Places.TownPrefetcher(workers=prefetch_workers) if prefetch_workers else None
+        if GameData.town_prefetcher:
+            GameData.town_prefetcher.prefetch_around(GameData.current_town)
+
     @classmethod
     def get_current_place_original_image(cls):
         return GameData.current_town.tile_map.surface_memory
@@ -112,41 +102,39 @@ class Game():
     @classmethod
     def assign_surface_to_displayable_objects(cls, town, surface_to_draw, surface_memory):
         GameData.player.displayable_object.graphical_representation.set_surface(surface_to_draw, surface_memory)
-        for a_town in GameData.town_graph.towns:
-            if a_town.name == town.name:
-                for an_id in a_town.things_id_list:
-                    GameData.game_dict[an_id].displayable_object.graphical_representation.set_surface(surface_to_draw,
-                                                                                                      surface_memory)
+        for an_id in GameData.game_dict.in_town(town):
+            GameData.game_dict[an_id].displayable_object.graphical_representation.set_surface(surface_to_draw,
+                                                                                              surface_memory)
 
 
     @classmethod
     def kick_off_timer_in_place(cls, town):
-        for a_town in GameData.town_graph.towns:
-            if a_town.name == town.name:
-                for an_id in a_town.things_id_list:
-                    if hasattr(GameData.game_dict[an_id], "speed"):
-                        GameData.time_ticker.schedule_turn(GameData.game_dict[an_id].speed, GameData.game_dict[an_id])
+        """
+        The town becomes simulated tick per tick (see Simulation)
+        """
+        GameData.world_simulation.enter_town(town)
 
 
     @classmethod
     def save_game(cls, file_name):
-        # TODO
         """
-        Save the GameData objects
+        Save the GameData objects (see SaveGame for the format)
         :param file_name: where to store the data
         :return: none
         """
-        pass
+        SaveGame.save(file_name)
 
     @classmethod
-    def load_game(cls, file_name):
-        # TODO
+    def load_game(cls, file_name, simulation_workers=0):
         """
-        Load the GameData objects
+        Load the GameData objects. Only the current town is rendered, the other ones are on their next visit.
+        The surfaces still have to be given to the things of the current town (see
+        assign_surface_to_displayable_objects) and the town kicked off (see kick_off_timer_in_place).
         :param file_name: where to load the data
+        :param simulation_workers: see start_new_game
         :return: none
         """
-        pass
+        SaveGame.load(file_name, simulation_workers=simulation_workers)
 
 
 def test(*args, **kwargs):
@@ -184,6 +172,8 @@ if __name__ == '__main__':
     # END INITIALIZATION
     print("All objects init done - starting time and main loop")
     Game.kick_off_timer_in_place(GameData.current_town)
+    GameData.autosave = SaveGame.AutoSave()
+    GameData.autosave.save()
 
     # pygame.mouse.set_cursor(*pygame.cursors.load_xbm(Constants.KENNEY_IMAGE_RESOURCE_FOLDER + "cursor2.xbm",
     # Constants.KENNEY_IMAGE_RESOURCE_FOLDER + "cursor2-mask.xbm"))
@@ -207,6 +197,10 @@ if __name__ == '__main__':
         for event in events:
             if event.type == pygame.QUIT:
                 print("got pygame.QUIT, terminating")
+                GameData.world_simulation.shutdown()
+                if GameData.town_prefetcher:
+                    GameData.town_prefetcher.shutdown()
+                GameData.autosave.stop()
                 raise SystemExit
             if event.type == Constants.DISPLAY_EVENT:
                 print(event.message)
@@ -239,6 +233,15 @@ if __name__ == '__main__':
                 if event.type == KEYDOWN and event.key == K_i:
                     Util.Event(GameData.player.list_container())
                     player_took_action = True
+                if event.type == KEYDOWN and event.key == K_F2:
+                    # Toggle the profiling of the turns; the report is written when it is stopped
+                    if GameData.time_ticker.profiler:
+                        profiler = GameData.time_ticker.disable_profiling()
+                        profiler.dump_json("turn_profile.json")
+                        for line in profiler.overlay_lines():
+                            Util.DebugEvent(line)
+                    else:
+                        GameData.time_ticker.enable_profiling()
                 if event.type == KEYDOWN and event.key == K_t:
                     main_image.move_camera(y=-1)
                 if event.type == KEYDOWN and event.key == K_g:
@@ -250,6 +253,8 @@ if __name__ == '__main__':
 
         if player_took_action:
             GameData.time_ticker.next_turn()
+            if GameData.time_ticker.ticks % Constants.AUTOSAVE_TICKS == 0:
+                GameData.autosave.save()
 
         for thing in GameData.current_town.things_id_list:
             GameData.game_dict[thing].displayable_object.draw()
@@ -4,13 +4,180 @@ This is a specific module that gather all shared data across the different modul
 It is mainly used as a repository for the objects that the game manipulates.
 """
 
+
+class EntityRegistry(object):
+    """
+    The repository of the game objects. It is used as a dictionary {id: object}, and maintains secondary indexes
+    when objects are registered / unregistered, so that the usual queries cost the size of their result:
+    - by town (maintained through set_town, see Places.Town.register_thing)
+    - by class
+    - by object type (GameObject.JUNK, ...)
+    - actors: the objects having a speed, i.e. that are scheduled in the Ticker, also by town
+    The queries by position are answered by the tile map of the town (see at_position).
+    The secondary indexes are dicts used as ordered sets {id: None}.
+    The registry also tracks the objects changed (registered, moved...) or removed since the last take_changes, for
+    the incremental saves (see SaveGame.AutoSave).
+    """
+
+    def __init__(self):
+        self._entities = {}
+        self._by_town = {}  # {town: {id: None}}
+        self._by_class = {}  # {class: {id: None}}
+        self._by_object_type = {}  # {object_type: {id: None}}
+        self._actors = {}  # {id: None}
+        self._actors_by_town = {}  # {town: {id: None}}
+        self._town_of = {}  # {id: town}, to update the town index
+        self._dirty = {}  # {id: None}, the objects changed since the last take_changes
+        self._removed = {}  # {id: None}, the objects removed since the last take_changes
+
+    def register(self, an_object):
+        """
+        Store the object (indexed with its id attribute) in all the indexes but the town one
+        """
+        if an_object.id in self._entities:
+            self.unregister(an_object.id)
+        self._entities[an_object.id] = an_object
+        self._by_class.setdefault(an_object.__class__, {})[an_object.id] = None
+        if hasattr(an_object, "object_type"):
+            self._by_object_type.setdefault(an_object.object_type, {})[an_object.id] = None
+        if hasattr(an_object, "speed"):
+            self._actors[an_object.id] = None
+            town = self._town_of.get(an_object.id)
+            if town is not None:
+                self._actors_by_town.setdefault(town, {})[an_object.id] = None
+        self._dirty[an_object.id] = None
+        self._removed.pop(an_object.id, None)
+        return
+
+    def unregister(self, an_object):
+        """
+        Remove the object (or the object id) from all the indexes
+        """
+        an_id = an_object if isinstance(an_object, str) else an_object.id
+        an_object = self._entities.pop(an_id, None)
+        if an_object is None:
+            return
+        self.set_town(an_id, None)
+        self._by_class[an_object.__class__].pop(an_id, None)
+        if hasattr(an_object, "object_type"):
+            self._by_object_type[an_object.object_type].pop(an_id, None)
+        self._actors.pop(an_id, None)
+        self._dirty.pop(an_id, None)
+        self._removed[an_id] = None
+        return
+
+    def set_town(self, an_object, town):
+        """
+        Move the object (or the object id) in the town index. A None town removes it from the town index.
+        """
+        an_id = an_object if isinstance(an_object, str) else an_object.id
+        old_town = self._town_of.pop(an_id, None)
+        if old_town is not None:
+            self._by_town[old_town].pop(an_id, None)
+            self._actors_by_town.get(old_town, {}).pop(an_id, None)
+        if town is not None:
+            self._town_of[an_id] = town
+            self._by_town.setdefault(town, {})[an_id] = None
+            if an_id in self._actors:
+                self._actors_by_town.setdefault(town, {})[an_id] = None
+        self.mark_dirty(an_id)
+        return
+
+    def mark_dirty(self, an_object):
+        """
+        Record that the object (or the object id) changed, so that it is part of the next incremental save
+        """
+        an_id = an_object if isinstance(an_object, str) else an_object.id
+        if an_id in self._entities:
+            self._dirty[an_id] = None
+        return
+
+    def take_changes(self):
+        """
+        :return: the ids of the objects changed and the ids of the objects removed since the last call
+        """
+        changes = (list(self._dirty), list(self._removed))
+        self._dirty = {}
+        self._removed = {}
+        return changes
+
+    # Queries
+
+    def in_town(self, town):
+        """
+        :return: the ids of the objects in the town (a live view: do not register / unregister while iterating)
+        """
+        return self._by_town.setdefault(town, {}).keys()
+
+    def town_of(self, an_id):
+        return self._town_of.get(an_id)
+
+    def actors(self, town=None):
+        """
+        :return: the ids of the objects with a speed, limited to a town if given
+        """
+        if town is None:
+            return list(self._actors)
+        return list(self._actors_by_town.get(town, ()))
+
+    @staticmethod
+    def at_position(town, position):
+        """
+        :return: the ids of the objects on a tile of the town. The tile map of the town already keeps them by
+        position (see Places.TileMap.register_thing_at), so there is no index of its own here.
+        """
+        return list(town.tile_map.things_on_tiles.get(position, ()))
+
+    def instances_of(self, a_class):
+        """
+        :return: the ids of the objects of this class, or of one of its subclasses
+        """
+        result = []
+        for indexed_class, ids in self._by_class.items():
+            if issubclass(indexed_class, a_class):
+                result.extend(ids)
+        return result
+
+    def of_type(self, object_type):
+        """
+        :return: the ids of the GameObjects of this object type
+        """
+        return list(self._by_object_type.get(object_type, ()))
+
+    # Dictionary interface
+
+    def __getitem__(self, an_id):
+        return self._entities[an_id]
+
+    def __contains__(self, an_id):
+        return an_id in self._entities
+
+    def __iter__(self):
+        return iter(self._entities)
+
+    def __len__(self):
+        return len(self._entities)
+
+    def get(self, an_id, default=None):
+        return self._entities.get(an_id, default)
+
+    def keys(self):
+        return self._entities.keys()
+
+    def values(self):
+        return self._entities.values()
+
+    def items(self):
+        return self._entities.items()
+
+
 # Game Objects
 """
 This holds all the first line objects that may be callable in the game. First line objects are objets that are callable.
 Any other list holding objects will only use their name.
 The key is the object name. The value is the object itself.
 """
-game_dict = {}
+game_dict = EntityRegistry()
 
 
 def register_object(an_object):
@@ -20,11 +187,11 @@ def register_object(an_object):
     :return: nothing
     """
     assert hasattr(an_object, "name"), "Object {} has no id attribute"
+    game_dict.register(an_object)
     if hasattr(an_object, "town") and an_object.town:
         an_object.town.register_thing(an_object)
     else:
         print("no town attribute for " + str(an_object))
-    game_dict[an_object.id] = an_object
     return
 
 
@@ -34,16 +201,21 @@ def object_exist(name):
     :param name: the object name to test
     :return: True if the object exists, False otherwise
     """
-    if not name in game_dict.keys():
+    if name not in game_dict:
         print("Warning: tried to lookup an object that was not there?")
         return False
     return True
 
 
 player = None
+world_seed = None
 town_graph = None
+town_cache = None
 current_town = None
 time_ticker = None
+world_simulation = None
+town_prefetcher = None
+autosave = None
 
 # Graphical Objects
 display = None  # The parent plane
@@ -1,5 +1,5 @@
 import Constants
-from Displayable import DisplayableObject, SpriteObject
+from Displayable import DisplayableObject, SpriteObject, make_sprite
 
 __author__ = 'Tangil'
 """
@@ -10,6 +10,7 @@ An object may contain a usable part - this creates temporary or permanent boost,
 """
 import random
 
+import GameData
 import Util
 
 
@@ -185,7 +186,15 @@ class Door(GameObject):
     ORIENTATION_HORIZONTAL = "horizontal"
     ORIENTATION_VERTICAL = "vertical"
 
-    def __init__(self, town, orientation, position_on_tile, closed=False, locked=None, style=Constants.DEFAULT_RESOURCE_STYLE):
+    def __init__(self, town, orientation, position_on_tile, closed=False, locked=None, style=Constants.DEFAULT_RESOURCE_STYLE,
+                 lazy_graphics=False):
+        """
+        :param lazy_graphics: if True, the sprite is only built on DisplayableObject.build_graphical_representation
+        """
+        sprite_definition = Door.get_sprite_definition(style, orientation, closed, locked)
+        graphical_representation = None
+        if not lazy_graphics:
+            graphical_representation = make_sprite(sprite_definition)
 
         super().__init__("Door",
                          GameObject.DECORATION,
@@ -193,36 +202,61 @@ class Door(GameObject):
                          action_when_player=door_open,
                          displayable_object=DisplayableObject(movable=False, blocking=False,
                                                               position_on_tile=position_on_tile,
-                                                              graphical_representation=Door.get_graphical_rep(style,
-                                                                                                              orientation,
-                                                                                                              closed,
-                                                                                                              locked))
+                                                              graphical_representation=graphical_representation,
+                                                              sprite_definition=sprite_definition)
         )
         self.locked = locked
         self.style = style
         self.orientation = orientation
         self.closed = closed
 
+    def set_locked(self, locked):
+        """
+        Lock or unlock the door. The navigation graph of the town is told (see Places.NavigationGraph).
+        """
+        self.locked = locked
+        GameData.game_dict.mark_dirty(self)
+        self.update_graphical_representation()
+        if self.town and self.town.tile_map and self.town.tile_map.navigation:
+            self.town.tile_map.navigation.set_door_locked(self.displayable_object.position_on_tile, locked)
+
+    def update_graphical_representation(self):
+        """
+        Change the sprite after the door was open, locked... The new sprite draws on the same surfaces.
+        """
+        if not self.displayable_object.graphical_representation:
+            self.displayable_object.sprite_definition = Door.get_sprite_definition(self.style, self.orientation,
+                                                                                   self.closed, self.locked)
+            return
+        draw = self.displayable_object.graphical_representation.surface_to_draw
+        memory = self.displayable_object.graphical_representation.surface_memory
+        self.displayable_object.set_graphical_representation(Door.get_graphical_rep(self.style, self.orientation,
+                                                                                    self.closed, self.locked))
+        self.displayable_object.graphical_representation.set_surface(draw, memory)
+
     @staticmethod
     def get_graphical_rep(style, orientation, closed, locked):
-        graphical_rep = None
+        return make_sprite(Door.get_sprite_definition(style, orientation, closed, locked))
+
+    @staticmethod
+    def get_sprite_definition(style, orientation, closed, locked):
         assert style == Constants.DAWNLIKE_STYLE, "Door style Oryx not implemented!"
 
         if style == Constants.DAWNLIKE_STYLE:
             if orientation == Door.ORIENTATION_HORIZONTAL:
                 if closed:
                     if locked:
-                        return SpriteObject(style, "Objects", "Door0", (32, 0))
-                    return SpriteObject(style, "Objects", "Door0", (0, 0))
+                        return (SpriteObject.__name__, style, "Objects", "Door0", (32, 0))
+                    return (SpriteObject.__name__, style, "Objects", "Door0", (0, 0))
                 else:
-                    return SpriteObject(style, "Objects", "Door1", (0, 0))
+                    return (SpriteObject.__name__, style, "Objects", "Door1", (0, 0))
             else:
                 if closed:
                     if locked:
-                        return SpriteObject(style, "Objects", "Door0", (48, 0))
-                    return SpriteObject(style, "Objects", "Door0", (16, 0))
+                        return (SpriteObject.__name__, style, "Objects", "Door0", (48, 0))
+                    return (SpriteObject.__name__, style, "Objects", "Door0", (16, 0))
                 else:
-                    return SpriteObject(style, "Objects", "Door1", (16, 0))
+                    return (SpriteObject.__name__, style, "Objects", "Door1", (16, 0))
 
 
 def door_open(**kwargs):
@@ -231,17 +265,8 @@ def door_open(**kwargs):
         return[Constants.PREVENT_MOVEMENT]
     if kwargs["source"].closed:
         kwargs["source"].closed = False
-
-        draw = kwargs["source"].displayable_object.graphical_representation.surface_to_draw
-        memory = kwargs["source"].displayable_object.graphical_representation.surface_memory
-
-        kwargs["source"].displayable_object.set_graphical_representation(Door.get_graphical_rep(
-            kwargs["source"].style,
-            kwargs["source"].orientation,
-            kwargs["source"].closed,
-            kwargs["source"].locked
-        ))
-        kwargs["source"].displayable_object.graphical_representation.set_surface(draw, memory)
+        GameData.game_dict.mark_dirty(kwargs["source"])
+        kwargs["source"].update_graphical_representation()
         Util.Event("This door is now open")
         return []
     else:
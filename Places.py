@@ -7,11 +7,20 @@ Town, places and other map functions
 # TODO: Optimize the walls: some walls show up as regular floor.
 """
 
+import collections
+import collections.abc
+import concurrent.futures
+import hashlib
+import heapq
+import os
 import random
+import zlib
 import Util
+import numpy
 import pygame
 import Constants
 import GameData
+import Player
 
 
 class Building(object):
@@ -38,15 +47,24 @@ class Building(object):
 
 class TradingPost(Building):
 
-    def __init__(self, town):
+    def __init__(self, town, gold=None, goods_available=None, rng=random):
+        """
+        :param gold: the gold of the trading post, random if not given
+        :param goods_available: the goods (GameObject) on sale, random if not given
+        :param rng: the random generator used for what is not given
+        """
         super().__init__(town)
         self.name = Building.TRADING_POST
 
-        self.gold = random.randint(1, 200)
-        self.goods_available = [
-            GameObject(Util.MName().new(), GameObject.JUNK, weight=random.randint(1, 10), volume=random.randint(1, 5),
-                       regular_value=random.randint(2, 10), displayable_object=None)
-                                for x in range(random.randint(1, 5))]
+        if gold is None:
+            gold = rng.randint(1, 200)
+        self.gold = gold
+        if goods_available is None:
+            goods_available = [
+                GameObject(Util.MName().new(rng=rng), GameObject.JUNK, weight=rng.randint(1, 10),
+                           volume=rng.randint(1, 5), regular_value=rng.randint(2, 10), displayable_object=None)
+                for x in range(rng.randint(1, 5))]
+        self.goods_available = goods_available
 
         self.decoration_list = {
             "1x1": [("Decor", True, (0, 64)), ("Decor", True, (16, 64)), ("Decor", True, (32, 64)),
@@ -62,45 +80,196 @@ class TradingPost(Building):
 class Town(object):
     """
     A Town is the main place of the game. A town hosts buildings, hosts NPCs, hosts gameobjects.
+    Everything that is generated in a town comes from random generators seeded out of the town seed, one per
+    subsystem (see random_stream): the same seed always gives the same town, and its map can be made again at will.
     """
 
-    def __init__(self, building_number, make_map=False, render_map=False):
-        self.name = Util.MName().new()
-        self.things_id_list = []
+    def __init__(self, building_number, make_map=False, render_map=False, seed=None, size=None):
+        """
+        :param building_number: drives the size of the town
+        :param seed: the seed of the town, random if not given
+        :param size: the size of the map, given by building_number if not given
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        rng = self.random_stream("town")
+        self.name = Util.MName().new(rng=rng)
         self.available_paths = []
-        self.buildings = [TradingPost(self), TradingPost(self)]
-        size = (50, 50)
-        if 4 < building_number <= 6:
-            size = (65, 65)
+        self.buildings = [TradingPost(self, rng=rng), TradingPost(self, rng=rng)]
+        self.size = (50, 50)
+        if size:
+            self.size = size
+        elif 4 < building_number <= 6:
+            self.size = (65, 65)
         elif 6 < building_number:
-            size = (80, 80)
-        self.tile_map = TownTileMap(self, size, make_map=make_map, render_map=render_map)
+            self.size = (80, 80)
+        # The map is only built when the town is first visited (see materialize), unless asked here
+        self.tile_map = None
+        self.layout = None  # The layout of the map, when it was generated ahead (see generate_town_layout)
+        self.dirty = True  # Changed since the last save (see SaveGame.AutoSave)
+        if make_map or render_map:
+            self.tile_map = TownTileMap(self, self.size, make_map=make_map, render_map=render_map)
         return
 
+    @classmethod
+    def restore(cls, name, size, seed):
+        """
+        Rebuild a town out of its saved data (see SaveGame): the buildings, paths and map are added by the caller
+        """
+        town = cls.__new__(cls)
+        town.seed = seed
+        town.name = name
+        town.available_paths = []
+        town.buildings = []
+        town.size = size
+        town.tile_map = None
+        town.layout = None
+        town.dirty = False
+        return town
+
     def __str__(self):
         return self.name
 
+    def random_stream(self, subsystem):
+        """
+        :param subsystem: what the generator is used for: "town" (name and buildings), "map", "decoration",
+        "population"...
+        :return: a new random generator, always seeded the same way for this town and subsystem
+        """
+        return random.Random(Util.derive_seed(self.seed, subsystem))
+
+    def thing_id(self, kind, number):
+        """
+        :return: an id for a thing generated in this town, the same each time the town is generated
+        """
+        return "{}#{:016x}#{}".format(kind, self.seed, number)
+
     def add_path(self, path):
         self.available_paths.append(path)
         return
 
     def build_tile_map(self):
-        size = (50, 50)
-        if 4 < len(self.buildings) <= 6:
-            size = (65, 65)
-        elif 6 < len(self.buildings):
-            size = (80, 80)
-        self.tile_map = TownTileMap(self, size, make_map=True, render_map=True)
+        # The map is made once it is the town map: the decorations register on it while it is made
+        self.tile_map = TownTileMap(self, self.size)
+        if self.layout:
+            self.tile_map.load_layout(self.layout)
+            self.layout = None
+            self.tile_map.decorate()
+        else:
+            self.tile_map.make_map()
+        self.tile_map.render(Constants.DAWNLIKE_STYLE)
+        return
+
+    @property
+    def materialized(self):
+        return self.tile_map is not None
+
+    def materialize(self):
+        """
+        Make the town ready to be played. On the first visit the map is generated and the town populated; if its
+        layers or its surface were evicted (see TownCache), they are rebuilt.
+        """
+        if not self.tile_map:
+            self.build_tile_map()
+            self.populate()
+            self.dirty = True
+        else:
+            self.tile_map.restore_layers()
+            if not self.tile_map.surface_memory:
+                self.tile_map.render(Constants.DAWNLIKE_STYLE)
+            self.build_graphical_representations()
+        if GameData.town_cache:
+            GameData.town_cache.touch(self)
         return
 
+    def evict(self):
+        """
+        Free the rendered surface and the layers of the map. The things of the town stay where they are, but their
+        sprites let go of the surfaces they were drawn on (the map and its on screen copy), so that nothing keeps
+        them alive. The surfaces are given back when the town is on screen again (see
+        Game.assign_surface_to_displayable_objects).
+        """
+        if self.tile_map:
+            self.tile_map.surface_memory = None
+            self.tile_map.evict_layers()
+        for an_id in GameData.game_dict.in_town(self):
+            a_thing = GameData.game_dict[an_id]
+            displayable_object = getattr(a_thing, "displayable_object", None)
+            if a_thing.town is self and displayable_object and displayable_object.graphical_representation:
+                displayable_object.set_graphical_surface(None, None)
+        return
+
+    def build_graphical_representations(self):
+        """
+        Build the sprites of the things of the town loaded without them (see SaveGame)
+        """
+        for an_id in self.things_id_list:
+            displayable_object = getattr(GameData.game_dict[an_id], "displayable_object", None)
+            if displayable_object:
+                displayable_object.build_graphical_representation()
+        return
+
+    def populate(self):
+        """
+        Put the NPCs, the objects and the doors in the town
+        """
+        rng = self.random_stream("population")
+        for i in range(5):
+            image_coordinate_x = [x * 16 for x in range(0, 7)]
+            image_coordinate_y = [y * 16 for y in (3, 4, 7, 8)]
+            coordinates = (rng.choice(image_coordinate_x), rng.choice(image_coordinate_y))
+            # npc = Player.TraderNPC(town,
+            # position_on_tile=town.tile_map.get_place_in_building(Places.Building.TRADING_POST),
+            #                        graphical_representation=Player.AnimatedSpriteObject(True, "Characters", "Player", coordinates))
+            npc = Player.NonPlayableCharacter(self,
+                                              name=self.thing_id("NPC", i),
+                                              speed=rng.randint(1, 3),
+                                              position_on_tile=(i * 1, i * 2),
+                                              graphical_representation=AnimatedSpriteObject(
+                                                  Constants.DAWNLIKE_STYLE, "Characters", "Player", coordinates))
+            npc.id = npc.name
+
+            GameData.register_object(npc)
+
+        for i in range(25):
+            an_object = GameObject("A leftover object " + str(i),
+                                   GameObject.JUNK,
+                                   town=self,
+                                   weight=rng.randint(1, 10),
+                                   volume=rng.randint(1, 5),
+                                   regular_value=rng.randint(2, 10),
+                                   displayable_object=DisplayableObject(movable=False, blocking=False,
+                                                                        position_on_tile=(
+                                                                            rng.randint(0, self.tile_map.max_x - 1),
+                                                                            rng.randint(0, self.tile_map.max_y - 1)),
+                                                                        graphical_representation=AnimatedSpriteObject(
+                                                                            Constants.DAWNLIKE_STYLE, "Objects",
+                                                                            "Ground", (16, 48))))
+            an_object.id = self.thing_id("Object", i)
+            GameData.register_object(an_object)
+        # a door is an open object
+        for room in self.tile_map.rooms:
+            for door in room.doors:
+                a_door = Door(self, door[1], door[0], closed=True, locked=False)
+                a_door.id = self.thing_id("Door", "{}-{}".format(*door[0]))
+                GameData.register_object(a_door)
+        return
+
+    @property
+    def things_id_list(self):
+        """
+        The ids of the objects in this town (the town index of GameData.game_dict)
+        """
+        return GameData.game_dict.in_town(self)
+
     def register_thing(self, a_thing):
         """
         Add an object (NPC, GameObject...) in the current town list. Only the id of the object is added...
         :param a_thing: the object to add (NPC, GameObject)
         :return: Nothing
         """
-        if not a_thing.id in self.things_id_list:
-            self.things_id_list.append(a_thing.id)
+        GameData.game_dict.set_town(a_thing, self)
         a_thing.town = self
         if hasattr(a_thing, "displayable_object"):
             if a_thing.displayable_object and a_thing.displayable_object.position_on_tile:
@@ -113,8 +282,7 @@ class Town(object):
         :param a_thing: the object to add (NPC, GameObject)
         :return: Nothing
         """
-        if a_thing.id in self.things_id_list:
-            self.things_id_list.remove(a_thing.id)
+        GameData.game_dict.set_town(a_thing, None)
         a_thing.town = None
         if hasattr(a_thing, "displayable_object"):
             if a_thing.displayable_object and a_thing.displayable_object.position_on_tile:
@@ -122,6 +290,20 @@ class Town(object):
         return
 
 
+def generate_town_layout(size, seed):
+    """
+    Generate the map of a town without its decorations. This is a pure function (it may run in another process):
+    the town is made again out of its seed, the result is the same as in the town itself.
+    :param size: the size of the town map
+    :param seed: the seed of the town
+    :return: the layout of the map (see TownTileMap.layout), to be given to Town.layout
+    """
+    town = Town(None, seed=seed, size=size)
+    tile_map = TownTileMap(town, town.size)
+    tile_map.make_map(decorate=False)
+    return tile_map.layout()
+
+
 class Path(object):
     """ A Path links two towns. Note that due to Geography, path from A to B may be different from B to A...
     """
@@ -136,13 +318,18 @@ class Path(object):
 
 class TownGraph(object):
 
-    def __init__(self, towns):
+    def __init__(self, towns, rng=random):
+        """
+        :param towns: the towns to link
+        :param rng: the random generator of the graph
+        """
 
         self.towns = towns
+        self.rng = rng
         if len(towns) <= 3:
-            num_paths = random.randint(len(towns) - 1, (len(towns) * (len(towns) - 1)) / 2)
+            num_paths = rng.randint(len(towns) - 1, (len(towns) * (len(towns) - 1)) // 2)
         else:
-            num_paths = random.randint(len(towns) - 1, len(towns) * 2)
+            num_paths = rng.randint(len(towns) - 1, len(towns) * 2)
 
         # internal purpose...
         self._edges = []
@@ -150,8 +337,20 @@ class TownGraph(object):
         self.build_graph(num_paths)
 
         for edge in self._edges:
-            edge[0].add_path(Path(edge[0], edge[1], random.randint(1, 10)))
-            edge[1].add_path(Path(edge[1], edge[0], random.randint(1, 10)))
+            edge[0].add_path(Path(edge[0], edge[1], rng.randint(1, 10)))
+            edge[1].add_path(Path(edge[1], edge[0], rng.randint(1, 10)))
+
+    @classmethod
+    def restore(cls, towns):
+        """
+        Rebuild the graph out of towns whose paths are already set (see SaveGame)
+        """
+        town_graph = cls.__new__(cls)
+        town_graph.towns = towns
+        town_graph.rng = random
+        town_graph._edges = []
+        town_graph._edge_set = set()
+        return town_graph
 
     def build_graph(self, num_paths):
         # Building algorithm process using random walk from https://gist.github.com/bwbaugh/4602818
@@ -159,14 +358,15 @@ class TownGraph(object):
         source, target = set(self.towns), set()
 
         # Pick a random node, and mark it as visited and the current node.
-        current_node = random.sample(source, 1).pop()
+        # (picked in the towns list: the order of a set of towns changes from one run to another)
+        current_node = self.rng.choice(self.towns)
         source.remove(current_node)
         target.add(current_node)
         # Create a random connected graph.
         while source:
             # Randomly pick the next node from the neighbors of the current node.
             # As we are generating a connected graph, we assume a complete graph.
-            neighbor_node = random.sample(self.towns, 1).pop()
+            neighbor_node = self.rng.choice(self.towns)
             # If the new node hasn't been visited, add the edge from current to new.
             if neighbor_node not in target:
                 edge = (current_node, neighbor_node)
@@ -190,7 +390,7 @@ class TownGraph(object):
 
     def make_random_edge(self):
         """Generate a random edge between any two nodes in the graph."""
-        random_edge = tuple(random.sample(self.towns, 2))
+        random_edge = tuple(self.rng.sample(self.towns, 2))
         return random_edge
 
     def add_random_edges(self, total_edges):
@@ -208,7 +408,115 @@ class TownGraph(object):
         return result
 
 
+class TownCache(object):
+    """
+    Keeps track of the materialized towns, the most recently visited last. When they use more memory than the
+    budget, the rendered surface and the layers of the least recently visited towns are evicted (see Town.evict).
+    They are rebuilt when the town is visited again (see Town.materialize).
+    """
+
+    def __init__(self, budget=Constants.TOWN_MEMORY_BUDGET):
+        """
+        :param budget: the memory budget, in bytes
+        """
+        self.budget = budget
+        self._towns = collections.OrderedDict()  # {town: None}, least recently visited first
+
+    def touch(self, town):
+        """
+        The town is visited: it becomes the most recently used one
+        """
+        self._towns[town] = None
+        self._towns.move_to_end(town)
+        self.enforce_budget()
+        return
+
+    def memory_size(self):
+        return sum(town.tile_map.memory_size() for town in self._towns)
+
+    def enforce_budget(self):
+        memory_size = self.memory_size()
+        for town in list(self._towns):
+            if memory_size <= self.budget:
+                break
+            if town is GameData.current_town or town is next(reversed(self._towns)):
+                continue
+            memory_size -= town.tile_map.memory_size()
+            town.evict()
+            del self._towns[town]
+        return
+
+
+class TownPrefetcher(object):
+    """
+    Generates the maps of the towns the player may travel to next, in worker processes, while the player is in a
+    town: the towns reachable through the available paths are done first, the closest (in days) first. The results
+    are handed to the towns as layouts (see generate_town_layout and Town.build_tile_map), so that arriving in the
+    town only adds the decorations and renders the map.
+    """
+
+    def __init__(self, workers=1):
+        """
+        :param workers: number of worker processes
+        """
+        self.workers = workers
+        self._executor = None
+        self._pending = collections.OrderedDict()  # {town: future}, in the order they were asked
+
+    def prefetch_around(self, town):
+        """
+        Start generating the maps of the towns reachable from town that are not made yet
+        """
+        if not self._executor:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        for path in sorted(town.available_paths, key=lambda a_path: a_path.days):
+            other_town = path.destination_town
+            if other_town.materialized or other_town.layout or other_town in self._pending:
+                continue
+            self._pending[other_town] = self._executor.submit(generate_town_layout, other_town.size, other_town.seed)
+        return
+
+    def collect(self, town=None):
+        """
+        Hand the generated layouts to their towns
+        :param town: a town about to be materialized: if its layout is being generated, wait for it
+        """
+        if town in self._pending:
+            self._pending[town].result()
+        for (a_town, future) in list(self._pending.items()):
+            if future.done():
+                del self._pending[a_town]
+                if not a_town.materialized and not future.cancelled():
+                    a_town.layout = future.result()
+        return
+
+    def cancel(self):
+        """
+        Drop the layouts being generated (the towns are replaced, see SaveGame.load)
+        """
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        return
+
+    def shutdown(self):
+        """
+        Stop the worker processes, if any
+        """
+        self.cancel()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        return
+
+
 class Tile(object):
+    """
+    A view on one tile of a TileMap. The tile data is stored in the layers of the tile map: the views are built when
+    they are needed (see TileGrid) and hold nothing but their position.
+    """
+    __slots__ = ("position", "tile_map_owner")
+
     UNKNOWN = "unknown"
     FLOOR = "floor"
     WALL = "wall"
@@ -218,39 +526,52 @@ class Tile(object):
     WATER = "water"
     ROCK = "rock"
 
-    def __init__(self, position, floor_type, tile_map_owner, decoration_type=None):
-        self.floor_type = floor_type
-        self.room = None
+    BLOCKING_FLOOR_TYPES = (WATER, WALL, ROCK)
+
+    # The floor layer stores the index of the floor type in this tuple
+    FLOOR_TYPES = (UNKNOWN, FLOOR, WALL, PATH, GRASS, DIRT, WATER, ROCK)
+    FLOOR_CODES = {floor_type: code for (code, floor_type) in enumerate(FLOOR_TYPES)}
+
+    def __init__(self, position, tile_map_owner):
         self.position = position
         self.tile_map_owner = tile_map_owner
-        self.name_of_things_on_tile = []
         return
 
+    @property
+    def floor_type(self):
+        return Tile.FLOOR_TYPES[self.tile_map_owner.floor_layer[self.position]]
+
+    @floor_type.setter
+    def floor_type(self, floor_type):
+        self.tile_map_owner.set_floor_type(self.position, floor_type)
+
+    @property
+    def room(self):
+        return self.tile_map_owner.get_room(self.position)
+
+    @room.setter
+    def room(self, room):
+        self.tile_map_owner.set_room(self.position, room)
+
+    @property
+    def name_of_things_on_tile(self):
+        return self.tile_map_owner.things_on_tiles.get(self.position, [])
+
     def register_thing(self, a_thing):
-        if isinstance(a_thing, str):
-            self.name_of_things_on_tile.append(a_thing)
-        else:
-            self.name_of_things_on_tile.append(a_thing.id)
+        self.tile_map_owner.register_thing_at(self.position, a_thing)
         return
 
     def unregister_thing(self, a_thing):
-        if isinstance(a_thing, str):
-            if a_thing in self.name_of_things_on_tile:
-                self.name_of_things_on_tile.remove(a_thing)
-        elif a_thing.id in self.name_of_things_on_tile:
-            self.name_of_things_on_tile.remove(a_thing.id)
+        self.tile_map_owner.unregister_thing_at(self.position, a_thing)
         return
 
     @property
     def blocking(self):
-        for game_id in self.name_of_things_on_tile:
-            if hasattr(GameData.game_dict[game_id], "blocking") and GameData.game_dict[game_id].blocking:
-                return True
-        return self.floor_type in (Tile.WATER, Tile.WALL, Tile.ROCK)
+        return self.tile_map_owner.is_blocking(self.position)
 
     @property
     def has_things(self):
-        return len(self.name_of_things_on_tile) > 0
+        return self.position in self.tile_map_owner.things_on_tiles
 
     def get_object_id(self, object_type=None):
         """
@@ -280,83 +601,1437 @@ class Tile(object):
         return part1+part2
 
 
+class TileGrid(collections.abc.Mapping):
+    """
+    The {(x, y): Tile} mapping of a tile map. The Tile views are built on access.
+    """
+
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+
+    def __getitem__(self, position):
+        if position not in self:
+            raise KeyError(position)
+        return Tile(position, self.tile_map)
+
+    def __contains__(self, position):
+        return 0 <= position[0] < self.tile_map.max_x and 0 <= position[1] < self.tile_map.max_y
+
+    def __iter__(self):
+        for x in range(self.tile_map.max_x):
+            for y in range(self.tile_map.max_y):
+                yield (x, y)
+
+    def __len__(self):
+        return self.tile_map.max_x * self.tile_map.max_y
+
+
 class TileMap(object):
+    """
+    A grid of tiles, stored as a structure of arrays (numpy arrays indexed [x, y]):
+    - floor_layer: the floor type code of each tile (see Tile.FLOOR_TYPES)
+    - room_layer: the index of the room of each tile in room_list, -1 if none
+    - blocking_layer: the number of blocking things on each tile, plus one if its floor is blocking, so that knowing
+      if a tile is blocking is a single read
+    A map that is still as generated (see generated) does not keep its layers when they are evicted: they are made
+    again when restored, by the subclasses that can generate them (see TownTileMap.regenerate_layers).
+    The things on the tiles are kept in a sparse dict {(x, y): [id, ...]}, and in buckets of
+    SPATIAL_BUCKET_SIZE x SPATIAL_BUCKET_SIZE tiles for the neighbourhood queries. The blocking layer and the
+    buckets are updated when the things register / unregister on the tiles (see Tile.register_thing).
+    map gives the usual {(x, y): Tile} access on top of the layers.
+    """
+
+    SPATIAL_BUCKET_SIZE = 8
+
+    # BLOCKING_CODES[floor code] is 1 if the floor type is blocking
+    BLOCKING_CODES = numpy.array([floor_type in Tile.BLOCKING_FLOOR_TYPES for floor_type in Tile.FLOOR_TYPES],
+                                 dtype=numpy.int16)
 
     def __init__(self, size, make_map=False, render_map=False, style=Constants.DAWNLIKE_STYLE):
         self.max_x = size[0]
         self.max_y = size[1]
-        self.map = {}
+        self.map = TileGrid(self)
         self.surface_memory = None
 
-        for x in range(self.max_x):
-            for y in range(self.max_y):
-                self.map[(x, y)] = Tile((x, y), Tile.UNKNOWN, self)
+        self.reset_tiles()
 
         if make_map:
             self.make_map()
         if render_map:
             self.render(style)
 
+    def reset_tiles(self):
+        """
+        Make all the tiles unknown tiles, with nothing on them
+        """
+        self.floor_layer = numpy.zeros((self.max_x, self.max_y), dtype=numpy.uint8)
+        self.room_layer = numpy.full((self.max_x, self.max_y), -1, dtype=numpy.int16)
+        self.blocking_layer = numpy.zeros((self.max_x, self.max_y), dtype=numpy.int16)
+        self.room_list = []
+        self.things_on_tiles = {}  # {(x, y): [id, ...]}, only the tiles with things
+        self._blocking_things = set()  # The ids of the blocking things, counted in the blocking layer
+        self._buckets = {}  # {(bucket_x, bucket_y): {id: position}}
+        self._packed_layers = None  # The compressed layers, when they are evicted
+        self._walkable_bits = None  # The walkable layer (see walkable_layer) as bits, when the layers are evicted
+        self.layers_dirty = True  # The floor or room layer changed since the last save (see SaveGame.AutoSave)
+        self.generated = False  # True if the layers are the ones generated out of the seed (see restore_layers)
+        self.static_blocking_version = 0  # Changes with the static blocking layer (see static_blocking_layer)
+        self.player_distance_map = None  # See distances_to_player
+        self.navigation = None  # See TownTileMap.navigation_graph
+        self.connectivity = None  # See connectivity_index
+
+    def evict_layers(self):
+        """
+        Free the layers. The layers of a generated map are made again when restored; the other ones are kept
+        compressed. The things stay registered; the blocking layer is rebuilt out of them.
+        """
+        if self.floor_layer is None:
+            return
+        self.player_distance_map = None
+        self.navigation = None
+        self.connectivity = None
+        if self.generated:
+            self._walkable_bits = numpy.packbits(self.walkable_layer())
+            self.floor_layer = self.room_layer = self.blocking_layer = None
+        else:
+            self.load_packed_layers(self.packed_layers())
+
+    def load_walkable_bits(self, walkable_bits):
+        """
+        Free the layers of a generated map, that are made again when restored (see SaveGame)
+        :param walkable_bits: the walkable layer, packed as bits (numpy.packbits)
+        """
+        self.floor_layer = self.room_layer = self.blocking_layer = None
+        self._packed_layers = None
+        self._walkable_bits = walkable_bits
+        self.generated = True
+
+    def packed_layers(self):
+        """
+        :return: the floor and room layers, compressed
+        """
+        if not self.layers_loaded:
+            if self._packed_layers is None and self.generated:
+                return TileMap.pack_layers(*self.regenerate_layers())
+            return self._packed_layers
+        return TileMap.pack_layers(self.floor_layer, self.room_layer)
+
+    @staticmethod
+    def pack_layers(floor_layer, room_layer):
+        return zlib.compress(floor_layer.tobytes() + room_layer.tobytes())
+
+    def load_packed_layers(self, packed_layers):
+        """
+        Replace the layers by compressed ones (see packed_layers). They are unpacked by restore_layers.
+        """
+        self._packed_layers = packed_layers
+        self.floor_layer = self.room_layer = self.blocking_layer = None
+
+    def restore_layers(self):
+        if self.floor_layer is not None:
+            return
+        if self._packed_layers is None and self.generated:
+            (self.floor_layer, self.room_layer) = self.regenerate_layers()
+        else:
+            self.floor_layer = self._unpack_floor_layer()
+            self.room_layer = numpy.frombuffer(zlib.decompress(self._packed_layers)[self.max_x * self.max_y:],
+                                               dtype=numpy.int16).reshape((self.max_x, self.max_y)).copy()
+        self._packed_layers = None
+        self._walkable_bits = None
+        self.compute_blocking_layer()
+        self.static_blocking_version += 1
+        self.connectivity = None
+
+    def _unpack_floor_layer(self):
+        return numpy.frombuffer(zlib.decompress(self._packed_layers)[:self.max_x * self.max_y],
+                                dtype=numpy.uint8).reshape((self.max_x, self.max_y)).copy()
+
+    @property
+    def layers_loaded(self):
+        return self.floor_layer is not None
+
+    def compute_blocking_layer(self):
+        """
+        Rebuild the blocking layer out of the floor layer and the blocking things
+        """
+        self.blocking_layer = TileMap.BLOCKING_CODES[self.floor_layer]
+        for bucket in self._buckets.values():
+            for an_id, position in bucket.items():
+                if an_id in self._blocking_things:
+                    self.blocking_layer[position] += 1
+
+    def static_blocking_layer(self):
+        """
+        :return: a boolean array, True where the tile is blocked by its floor or by a thing that does not move
+        """
+        blocking = TileMap.BLOCKING_CODES[self.floor_layer] > 0
+        for bucket in self._buckets.values():
+            for an_id, position in bucket.items():
+                if an_id in self._blocking_things and not getattr(GameData.game_dict.get(an_id), "movable", True):
+                    blocking[position] = True
+        return blocking
+
+    def blocking_things(self):
+        """
+        :return: the (id, position) of the blocking things on the map
+        """
+        return [(an_id, position) for bucket in self._buckets.values() for (an_id, position) in bucket.items()
+                if an_id in self._blocking_things]
+
+    @staticmethod
+    def grid_distances(free, source, diagonal_moves=False):
+        """
+        Breadth first search from source, one ring of the whole grid at a time
+        :param free: a boolean array, True for the tiles that can be walked on
+        :param source: the (x, y) the distances are computed from
+        :param diagonal_moves: True to move in 8 directions, False in 4
+        :return: an int16 array with the number of moves from source to each tile, -1 if it cannot be reached
+        """
+        distances = numpy.full(free.shape, -1, dtype=numpy.int16)
+        distances[source] = 0
+        reached = numpy.zeros(free.shape, dtype=bool)
+        reached[source] = True
+        frontier = reached.copy()
+        distance = 0
+        while frontier.any():
+            distance += 1
+            if diagonal_moves:
+                grown = TownTileMap.count_neighbours(frontier) > 0
+            else:
+                grown = frontier.copy()
+                grown[1:, :] |= frontier[:-1, :]
+                grown[:-1, :] |= frontier[1:, :]
+                grown[:, 1:] |= frontier[:, :-1]
+                grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & free & ~reached
+            reached |= frontier
+            distances[frontier] = distance
+        return distances
+
+    def is_static_blocking(self, position):
+        """
+        :return: True if the tile is blocked by its floor or by a thing that does not move (see static_blocking_layer)
+        """
+        if TileMap.BLOCKING_CODES[self.floor_layer[position]]:
+            return True
+        return any(an_id in self._blocking_things and not getattr(GameData.game_dict.get(an_id), "movable", True)
+                   for an_id in self.things_on_tiles.get(position, []))
+
+    def connectivity_index(self):
+        """
+        :return: the connected regions of the map (see ConnectivityIndex), kept up to date as the tiles change
+        """
+        if self.connectivity is None:
+            self.connectivity = ConnectivityIndex(self)
+        return self.connectivity
+
+    def distances_to_player(self):
+        """
+        :return: the distance map to the player (see DistanceMap), shared by all the NPCs of the map
+        """
+        if self.player_distance_map is None:
+            self.player_distance_map = DistanceMap(self)
+        self.player_distance_map.update(GameData.player.position_on_tile)
+        return self.player_distance_map
+
+    def memory_size(self):
+        """
+        :return: the approximate memory used by the layers and the rendered surface, in bytes
+        """
+        size = 0
+        if self.layers_loaded:
+            size += self.floor_layer.nbytes + self.room_layer.nbytes + self.blocking_layer.nbytes
+        if self.surface_memory:
+            size += self.surface_memory.get_width() * self.surface_memory.get_height() * \
+                self.surface_memory.get_bytesize()
+        return size
+
+    def is_blocking(self, position):
+        return self.blocking_layer[position] > 0
+
+    def set_floor_type(self, position, floor_type):
+        code = Tile.FLOOR_CODES[floor_type]
+        self.blocking_layer[position] += TileMap.BLOCKING_CODES[code] - TileMap.BLOCKING_CODES[
+            self.floor_layer[position]]
+        self.floor_layer[position] = code
+        self.layers_dirty = True
+        self.generated = False
+        self.static_blocking_version += 1
+        if self.connectivity:
+            self.connectivity.update_tile(position)
+
+    def set_floor_layer(self, floor_layer):
+        """
+        Replace the whole floor layer (an array of floor codes), keeping the blocking layer up to date
+        """
+        self.blocking_layer += TileMap.BLOCKING_CODES[floor_layer] - TileMap.BLOCKING_CODES[self.floor_layer]
+        self.floor_layer = floor_layer.astype(numpy.uint8)
+        self.layers_dirty = True
+        self.generated = False
+        self.static_blocking_version += 1
+        if self.connectivity:
+            self.connectivity.stale = True
+
+    def get_room(self, position):
+        index = self.room_layer[position]
+        if index < 0:
+            return None
+        return self.room_list[index]
+
+    def set_room(self, position, room):
+        self.layers_dirty = True
+        self.generated = False
+        if room is None:
+            self.room_layer[position] = -1
+            return
+        for index, a_room in enumerate(self.room_list):
+            if a_room is room:
+                break
+        else:
+            index = len(self.room_list)
+            self.room_list.append(room)
+        self.room_layer[position] = index
+
+    def register_thing_at(self, position, a_thing):
+        """
+        Put a thing (or the id of a thing stored in GameData.game_dict) on a tile
+        """
+        if isinstance(a_thing, str):
+            an_id = a_thing
+            a_thing = GameData.game_dict.get(an_id)
+        else:
+            an_id = a_thing.id
+        self.things_on_tiles.setdefault(position, []).append(an_id)
+        GameData.game_dict.mark_dirty(an_id)
+        if getattr(a_thing, "blocking", False) and an_id not in self._blocking_things:
+            self._blocking_things.add(an_id)
+            if self.layers_loaded:
+                self.blocking_layer[position] += 1
+            if not getattr(a_thing, "movable", True):
+                self.static_blocking_version += 1
+                if self.connectivity:
+                    self.connectivity.update_tile(position)
+        bucket = (position[0] // TileMap.SPATIAL_BUCKET_SIZE, position[1] // TileMap.SPATIAL_BUCKET_SIZE)
+        self._buckets.setdefault(bucket, {})[an_id] = position
+        return
+
+    def unregister_thing_at(self, position, a_thing):
+        """
+        Remove a thing (or the id of a thing) from a tile
+        """
+        an_id = a_thing if isinstance(a_thing, str) else a_thing.id
+        things_on_tile = self.things_on_tiles.get(position, [])
+        if an_id not in things_on_tile:
+            return
+        things_on_tile.remove(an_id)
+        GameData.game_dict.mark_dirty(an_id)
+        if not things_on_tile:
+            del self.things_on_tiles[position]
+        if an_id in self._blocking_things:
+            self._blocking_things.remove(an_id)
+            if self.layers_loaded:
+                self.blocking_layer[position] -= 1
+            if not getattr(GameData.game_dict.get(an_id), "movable", True):
+                self.static_blocking_version += 1
+                if self.connectivity:
+                    self.connectivity.update_tile(position)
+        bucket = (position[0] // TileMap.SPATIAL_BUCKET_SIZE, position[1] // TileMap.SPATIAL_BUCKET_SIZE)
+        self._buckets[bucket].pop(an_id, None)
+        return
+
+    def things_in_radius(self, center, radius):
+        """
+        :return: the list of (id, position) of the things at most at radius tiles from center
+        """
+        result = []
+        square_radius = radius * radius
+        bucket_size = TileMap.SPATIAL_BUCKET_SIZE
+        for bucket_x in range((center[0] - radius) // bucket_size, (center[0] + radius) // bucket_size + 1):
+            for bucket_y in range((center[1] - radius) // bucket_size, (center[1] + radius) // bucket_size + 1):
+                for an_id, position in self._buckets.get((bucket_x, bucket_y), {}).items():
+                    if (position[0] - center[0]) ** 2 + (position[1] - center[1]) ** 2 <= square_radius:
+                        result.append((an_id, position))
+        return result
+
+    def walkable_layer(self):
+        """
+        :return: a boolean array, True where the floor is not blocking (the things are not taken into account)
+        """
+        if not self.layers_loaded and self._packed_layers is None:
+            if self._walkable_bits is None and self.generated:
+                self._walkable_bits = numpy.packbits(TileMap.BLOCKING_CODES[self.regenerate_layers()[0]] == 0)
+            return numpy.unpackbits(self._walkable_bits, count=self.max_x * self.max_y).reshape(
+                (self.max_x, self.max_y)).astype(bool)
+        floor_layer = self.floor_layer if self.layers_loaded else self._unpack_floor_layer()
+        return TileMap.BLOCKING_CODES[floor_layer] == 0
+
     def make_map(self):
         pass
 
     def render(self, style=Constants.DAWNLIKE_STYLE):
         pass
 
+    def tile_weights(self):
+        """
+        The weight of every tile at once, each tile against its own floor type (see compute_tile_weight)
+        :return: a uint8 array: 1 if the tile above has the same floor type, + 2 on the right, + 4 below, + 8 on the
+        left
+        """
+        floor_layer = self.floor_layer
+        weights = numpy.zeros((self.max_x, self.max_y), dtype=numpy.uint8)
+        weights[:, 1:] |= (floor_layer[:, 1:] == floor_layer[:, :-1]).astype(numpy.uint8)
+        weights[:-1, :] |= (floor_layer[:-1, :] == floor_layer[1:, :]).astype(numpy.uint8) << 1
+        weights[:, :-1] |= (floor_layer[:, :-1] == floor_layer[:, 1:]).astype(numpy.uint8) << 2
+        weights[1:, :] |= (floor_layer[1:, :] == floor_layer[:-1, :]).astype(numpy.uint8) << 3
+        return weights
+
     def compute_tile_weight(self, x, y, terrain_type):
+        code = Tile.FLOOR_CODES[terrain_type]
+        floor_layer = self.floor_layer
         count = 0
-        if y - 1 >= 0 and self.map[(x, y - 1)].floor_type == terrain_type:
+        if y - 1 >= 0 and floor_layer[x, y - 1] == code:
             count += 1
-        if x + 1 < self.max_x and self.map[(x + 1, y)].floor_type == terrain_type:
+        if x + 1 < self.max_x and floor_layer[x + 1, y] == code:
             count += 2
-        if y + 1 < self.max_y and self.map[(x, y + 1)].floor_type == terrain_type:
+        if y + 1 < self.max_y and floor_layer[x, y + 1] == code:
             count += 4
-        if x - 1 >= 0 and self.map[(x - 1, y)].floor_type == terrain_type:
+        if x - 1 >= 0 and floor_layer[x - 1, y] == code:
             count += 8
         return count
 
 
+class ConnectivityIndex(object):
+    """
+    The connected regions of the walkable tiles of a tile map, moving in 4 directions, without the static blocking
+    tiles (see TileMap.static_blocking_layer). Each walkable tile has a label; two tiles can reach each other if their
+    labels have the same root in a union-find, so a reachability query is two reads.
+    The labels follow the changes of the tiles (see update_tile): a tile that opens gets a new label, joined to the
+    labels around it. A tile that closes only loses its label when the tiles around it stay connected; else it may
+    split its region, and the labels are computed again on the next query.
+    """
+
+    # The 8 tiles around a tile, each one touching the next (and the last the first) in 4 directions
+    RING = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+        self.labels = None  # int32 array indexed [x, y], -1 for the blocking tiles
+        self.parents = []  # The union-find of the labels
+        self.stale = True  # The labels are to be computed again
+        self.candidates = {}  # {(region, key): flat indexes of the tiles}, see random_place
+
+    def compute(self):
+        """
+        Label the whole map: the runs of walkable tiles along y get a label each, then the runs that touch along x
+        are joined
+        """
+        free = ~self.tile_map.static_blocking_layer()
+        starts = free.copy()
+        starts[:, 1:] &= ~free[:, :-1]
+        runs = numpy.cumsum(starts.ravel()).reshape(free.shape).astype(numpy.int32) - 1
+        self.parents = list(range(int(starts.sum())))
+        touching = free[:-1, :] & free[1:, :]
+        for (label, other_label) in numpy.unique(numpy.stack((runs[:-1, :][touching], runs[1:, :][touching]),
+                                                             axis=1), axis=0).tolist():
+            self.join(label, other_label)
+        roots = numpy.array([self.find(label) for label in range(len(self.parents))] or [0], dtype=numpy.int32)
+        self.labels = numpy.where(free, roots[numpy.maximum(runs, 0)], -1)
+        self.parents = list(range(len(self.parents)))
+        self.stale = False
+        self.candidates = {}
+
+    def find(self, label):
+        root = label
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[label] != root:
+            (self.parents[label], label) = (root, self.parents[label])
+        return root
+
+    def join(self, label, other_label):
+        (root, other_root) = (self.find(label), self.find(other_label))
+        if root != other_root:
+            self.parents[max(root, other_root)] = min(root, other_root)
+
+    def update_tile(self, position):
+        """
+        The floor of a tile or the static things on it changed
+        """
+        if self.stale:
+            return
+        was_free = self.labels[position] >= 0
+        is_free = not self.tile_map.is_static_blocking(position)
+        if is_free != was_free:
+            self.candidates = {}
+        if is_free and not was_free:
+            label = len(self.parents)
+            self.parents.append(label)
+            self.labels[position] = label
+            for neighbour in ((position[0] + 1, position[1]), (position[0] - 1, position[1]),
+                              (position[0], position[1] + 1), (position[0], position[1] - 1)):
+                if neighbour in self.tile_map.map and self.labels[neighbour] >= 0:
+                    self.join(label, int(self.labels[neighbour]))
+        elif was_free and not is_free:
+            if self.splits_region(position):
+                self.stale = True
+            else:
+                self.labels[position] = -1
+
+    def splits_region(self, position):
+        """
+        :return: False if the free tiles around position stay connected without it, going round the tile. True if
+        they may not be (a path further away may still join them: the labels are then computed again to know).
+        """
+        free = [neighbour in self.tile_map.map and self.labels[neighbour] >= 0
+                for neighbour in ((position[0] + var_x, position[1] + var_y) for (var_x, var_y) in self.RING)]
+        if all(free):
+            return False
+        # Count the runs of free tiles going round, starting after a closed tile. A run joins the free sides
+        # (the even places of RING) it holds.
+        start = free.index(False)
+        runs_with_sides = 0
+        in_run = has_side = False
+        for offset in range(1, 9):
+            index = (start + offset) % 8
+            if free[index]:
+                in_run = True
+                has_side = has_side or index % 2 == 0
+            elif in_run:
+                runs_with_sides += has_side
+                in_run = has_side = False
+        return runs_with_sides > 1
+
+    def region(self, position):
+        """
+        :return: the region of the tile (the root of its label), -1 if it is blocking
+        """
+        if self.stale:
+            self.compute()
+        label = int(self.labels[position])
+        return self.find(label) if label >= 0 else -1
+
+    def connected(self, position, other_position):
+        """
+        :return: True if a path joins the two tiles
+        """
+        region = self.region(position)
+        return region >= 0 and region == self.region(other_position)
+
+    def random_place(self, tiles, connected_to, rng=random, key=None):
+        """
+        :param tiles: a boolean array of the tiles to choose from, or a function making it (only called when the
+        tiles are not kept, see key)
+        :param connected_to: the place the tile must be connected to
+        :param key: names tiles (a room...): the tiles of the region are then kept until the labels change, and the
+        next calls with the same key only draw out of them
+        :return: a random tile out of tiles, connected to connected_to and with nothing blocking on it. None if there
+        is none.
+        """
+        region = self.region(connected_to)
+        if region < 0:
+            return None
+        candidates = self.candidates.get((region, key)) if key is not None else None
+        if candidates is None:
+            if callable(tiles):
+                tiles = tiles()
+            roots = numpy.array([self.find(label) for label in range(len(self.parents))] or [0], dtype=numpy.int32)
+            in_region = (self.labels >= 0) & (roots[numpy.maximum(self.labels, 0)] == region)
+            candidates = numpy.flatnonzero(tiles & in_region)
+            if key is not None:
+                self.candidates[(region, key)] = candidates
+        # The things moving around block some of them: a few draws, then the free ones only
+        blocking_layer = self.tile_map.blocking_layer.ravel()
+        for attempt in range(min(len(candidates), 8)):
+            index = candidates[rng.randrange(len(candidates))]
+            if blocking_layer[index] == 0:
+                break
+        else:
+            free_candidates = candidates[blocking_layer[candidates] == 0]
+            if not len(free_candidates):
+                return None
+            index = free_candidates[rng.randrange(len(free_candidates))]
+        return tuple(int(value) for value in numpy.unravel_index(index, self.labels.shape))
+
+
+class DistanceMap(object):
+    """
+    The number of moves (in 8 directions, as Player.Fighter.move) from each tile of a tile map to a target tile,
+    going around the static blocking tiles (see TileMap.static_blocking_layer). It is computed once for a target and
+    shared: all the NPCs chasing the player read their next step out of the same map (see next_step). The NPCs and
+    other moving things are left out, else the map would change at every move of any of them.
+    """
+
+    UNREACHABLE = -1  # See TileMap.grid_distances
+
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+        self.target = None
+        self.version = None  # The static_blocking_version of the tile map the distances were computed for
+        self.distances = None  # int16 array indexed [x, y]
+
+    def update(self, target):
+        """
+        Compute the distances again, if the target moved or the static blocking tiles changed
+        """
+        if target == self.target and self.version == self.tile_map.static_blocking_version:
+            return
+        self.target = target
+        self.version = self.tile_map.static_blocking_version
+        self.distances = TileMap.grid_distances(~self.tile_map.static_blocking_layer(), target, diagonal_moves=True)
+
+    def distance(self, position):
+        return int(self.distances[position])
+
+    def next_step(self, position):
+        """
+        :return: the free neighbour of position that is the closest to the target, None if none gets closer
+        """
+        best = None
+        best_distance = self.distance(position)
+        if best_distance == DistanceMap.UNREACHABLE:
+            return None
+        for (var_x, var_y) in ((0, -1), (1, 0), (0, 1), (-1, 0), (1, -1), (1, 1), (-1, 1), (-1, -1)):
+            neighbour = (position[0] + var_x, position[1] + var_y)
+            if neighbour not in self.tile_map.map:
+                continue
+            distance = self.distance(neighbour)
+            if distance != DistanceMap.UNREACHABLE and distance < best_distance and \
+                    not self.tile_map.is_blocking(neighbour):
+                best = neighbour
+                best_distance = distance
+        return best
+
+
+class Room(object):
+    """
+    A building of a town map: the places it covers and its doors ((x, y), orientation).
+    """
+
+    def __init__(self, town, width, height, building, rng=random):
+        """
+        Draw the shape of a room: a main rectangle and a few additions. The room is at (0, 0) until it is placed
+        (see move_to and RoomPlacer).
+        """
+        self.town = town
+        self.connected_by_path = False
+        self.doors = []
+        self.building = building
+        self.rects = [(0, 0, width, height)]  # The footprint (x, y, width, height), relative to the top left corner
+        self.relative_places = [(x_coord, y_coord) for x_coord in range(width) for y_coord in range(height)]
+        additions = rng.randint(1, 4)
+        for i in range(additions):
+            # Add an extra room: pick a coordinate, and build from that
+            origin = rng.choice(self.relative_places)
+            addition_width = max(width + rng.randint(-3, 0), 3)
+            addition_height = max(height + rng.randint(-3, 0), 3)
+            self.rects.append((origin[0], origin[1], addition_width, addition_height))
+            for x_coord in range(origin[0], addition_width + origin[0]):
+                for y_coord in range(origin[1], addition_height + origin[1]):
+                    self.relative_places.append((x_coord, y_coord))
+        self.places = []
+        self.move_to(0, 0)
+
+    @classmethod
+    def restore(cls, town, building, places, doors):
+        """
+        Rebuild an already placed room (see SaveGame)
+        """
+        room = cls.__new__(cls)
+        room.town = town
+        room.connected_by_path = True
+        room.places = places
+        room.relative_places = places
+        room.rects = []
+        room.doors = doors
+        room.building = building
+        return room
+
+    def move_to(self, top_x, top_y):
+        self.places = [(x + top_x, y + top_y) for (x, y) in self.relative_places]
+
+    def compute_tile_weight(self, x, y, terrain_type_list, map, max_x, max_y):
+        count = 0
+        if y - 1 >= 0 and map[(x, y - 1)].floor_type in terrain_type_list:
+            count += 1
+        if x + 1 < max_x and map[(x + 1, y)].floor_type in terrain_type_list:
+            count += 2
+        if y + 1 < max_y and map[(x, y + 1)].floor_type in terrain_type_list:
+            count += 4
+        if x - 1 >= 0 and map[(x - 1, y)].floor_type in terrain_type_list:
+            count += 8
+        return count
+
+    def carve(self, tile_map, max_x, max_y):
+        for place in self.places:
+            tile_map[place].floor_type = Tile.FLOOR
+            tile_map[place].room = self.building
+        for place in self.places:
+            if self.compute_tile_weight(place[0], place[1], (Tile.FLOOR, Tile.WALL),
+                                        tile_map, max_x, max_y) != 15:
+                tile_map[place].floor_type = Tile.WALL
+
+    def smooth_walls(self, tile_map, max_x, max_y):
+        #TODO smooth wall is buggy
+        additional_walls = []
+        for place in self.places:
+            if tile_map[place].floor_type == Tile.FLOOR and \
+                            self.compute_tile_weight(place[0], place[1], (Tile.WALL),
+                                                     tile_map, max_x, max_y) == 3 and tile_map[
+                        place[0] + 1, place[1] - 1].floor_type == Tile.FLOOR:
+                additional_walls.append(place)
+            elif tile_map[place].floor_type == Tile.FLOOR and \
+                            self.compute_tile_weight(place[0], place[1], (Tile.WALL),
+                                                     tile_map, max_x, max_y) == 6 and tile_map[
+                        place[0] + 1, place[1] + 1].floor_type == Tile.FLOOR:
+                additional_walls.append(place)
+        #for place in additional_walls:
+        #    tile_map[place].floor_type = Tile.WALL
+
+    # The tile in front of a door, out of the room, for each weight of a door tile (see compute_tile_weight)
+    DOOR_OUTSIDE = {7: (-1, 0), 11: (0, 1), 13: (1, 0), 14: (0, -1)}
+
+    def place_door(self, tile_map, max_x, max_y, rng=random):
+        #nb_doors = random.randint(1, 3)
+        nb_doors = 1
+        nb_placed = 0
+        while nb_placed < nb_doors:
+            place = rng.choice(self.places)
+            weight = self.compute_tile_weight(place[0], place[1],
+                                              (Tile.FLOOR, Tile.WALL), tile_map, max_x, max_y)
+            if weight in (7, 11, 14, 13):
+                orientation = Door.ORIENTATION_HORIZONTAL
+                if weight in (7, 13):
+                    orientation = Door.ORIENTATION_VERTICAL
+                self.doors.append((place, orientation))
+                nb_placed += 1
+
+    def door_places(self, tile_map, max_x, max_y):
+        """
+        :return: the list of (place, orientation, place in front of it) where a door can be put: the walls that
+        have the room on three sides
+        """
+        result = []
+        for place in sorted(set(self.places)):
+            if tile_map[place].floor_type != Tile.WALL:
+                continue
+            weight = self.compute_tile_weight(place[0], place[1], (Tile.FLOOR, Tile.WALL), tile_map, max_x, max_y)
+            if weight in Room.DOOR_OUTSIDE:
+                orientation = Door.ORIENTATION_HORIZONTAL
+                if weight in (7, 13):
+                    orientation = Door.ORIENTATION_VERTICAL
+                (var_x, var_y) = Room.DOOR_OUTSIDE[weight]
+                result.append((place, orientation, (place[0] + var_x, place[1] + var_y)))
+        return result
+
+    def move_door(self, tile_map, place, orientation):
+        """
+        Move the (first) door of the room, once the doors are carved: the old door is a wall again
+        """
+        tile_map[self.doors[0][0]].floor_type = Tile.WALL
+        tile_map[place].floor_type = Tile.FLOOR
+        self.doors[0] = (place, orientation)
+
+    def add_deco(self, tile_map, max_x, max_y, rng=random):
+        """
+        Add the decorative object. Note that the decoration is a GameObject!
+        :param tile_map:
+        :param max_x:
+        :param max_y:
+        :param rng: the random generator of the decorations
+        :return: nothing
+        """
+        list_doors = [door_def[0] for door_def in self.doors]
+        for i in range(20):
+            place = rng.choice(self.places)
+            weight = self.compute_tile_weight(place[0], place[1], [Tile.FLOOR], tile_map, max_x, max_y)
+            near_door = (place[0], place[1] - 1) in list_doors or \
+                        (place[0], place[1] + 1) in list_doors or \
+                        (place[0] - 1, place[1]) in list_doors or \
+                        (place[0] + 1, place[1]) in list_doors
+            if not (near_door or not (tile_map[place].floor_type == Tile.FLOOR) or tile_map[
+                place].has_things) and weight == 15:
+                a_deco = rng.choice(self.building.decoration_list["1x1"])
+                decoration = GameObject(a_deco[0], GameObject.DECORATION,
+                                        town=self.town,
+                                        weight=rng.randint(1, 10),
+                                        volume=rng.randint(1, 5),
+                                        regular_value=rng.randint(2, 10),
+                                        displayable_object=DisplayableObject(movable=False, blocking=a_deco[1],
+                                                                             position_on_tile=place,
+                                                                             graphical_representation=
+                                                                             AnimatedSpriteObject(
+                                                                                 Constants.DAWNLIKE_STYLE,
+                                                                                 "Objects", "Decor",
+                                                                                 a_deco[2])))
+                decoration.id = self.town.thing_id("Decoration", "{}-{}".format(*place))
+                GameData.register_object(decoration)
+
+
+class RoomPlacer(object):
+    """
+    Finds where the rooms fit on a town map. A room fits if its footprint, grown by MARGIN tiles on each side, is on
+    the map and only covers free tiles: not blocking and not part of a room yet.
+    The occupied tiles are kept as a summed-area table, so that the number of occupied tiles of any rectangle is
+    read in O(1). The footprint of a room being a few rectangles, the positions where it fits are computed for all
+    the candidate positions at once, and the room is put on one of them.
+    """
+
+    MARGIN = 2  # Leave a two block path around the buildings
+
+    def __init__(self, tile_map, range_x, range_y):
+        """
+        :param range_x: the (min, max) x of the top left corner of the rooms, inclusive
+        :param range_y: the same in y
+        """
+        self.tile_map = tile_map
+        self.range_x = range_x
+        self.range_y = range_y
+        self.table = None
+        self.update()
+
+    def update(self):
+        """
+        Compute the summed-area table again: to be called when the map changed (rooms carved...)
+        """
+        occupied = (self.tile_map.blocking_layer > 0) | (self.tile_map.room_layer >= 0)
+        self.table = numpy.zeros((self.tile_map.max_x + 1, self.tile_map.max_y + 1), dtype=numpy.int32)
+        self.table[1:, 1:] = occupied.cumsum(axis=0).cumsum(axis=1)
+
+    def valid_origins(self, room):
+        """
+        :return: a boolean array indexed [x - range_x[0], y - range_y[0]], True where the room fits with its top
+        left corner on (x, y)
+        """
+        table = self.table
+        (max_x, max_y) = (self.tile_map.max_x, self.tile_map.max_y)
+        origin_x = numpy.arange(self.range_x[0], self.range_x[1] + 1)[:, None]
+        origin_y = numpy.arange(self.range_y[0], self.range_y[1] + 1)[None, :]
+        valid = numpy.ones((origin_x.shape[0], origin_y.shape[1]), dtype=bool)
+        for (x, y, width, height) in room.rects:
+            # The rectangle with its margin, as [start, end) bounds
+            start_x = origin_x + x - RoomPlacer.MARGIN
+            end_x = start_x + width + 2 * RoomPlacer.MARGIN
+            start_y = origin_y + y - RoomPlacer.MARGIN
+            end_y = start_y + height + 2 * RoomPlacer.MARGIN
+            valid &= (start_x >= 0) & (end_x <= max_x) & (start_y >= 0) & (end_y <= max_y)
+            (start_x, end_x) = (numpy.clip(start_x, 0, max_x), numpy.clip(end_x, 0, max_x))
+            (start_y, end_y) = (numpy.clip(start_y, 0, max_y), numpy.clip(end_y, 0, max_y))
+            valid &= (table[end_x, end_y] - table[start_x, end_y] - table[end_x, start_y] +
+                      table[start_x, start_y]) == 0
+        return valid
+
+    def find_place(self, room, rng=random):
+        """
+        :return: a random top left corner (x, y) where the room fits, None if it fits nowhere
+        """
+        valid = self.valid_origins(room)
+        candidates = numpy.flatnonzero(valid)
+        if not len(candidates):
+            return None
+        index = int(candidates[rng.randrange(len(candidates))])
+        return (self.range_x[0] + index // valid.shape[1], self.range_y[0] + index % valid.shape[1])
+
+
+class TileMapHandler(Util.SQ_MapHandler):
+    """
+    The map handler of the A* (see Util.AStar) for a tile map: the move costs are read from its blocking layer
+    """
+
+    def __init__(self, tile_map):
+        super().__init__(tile_map.map, tile_map.max_x, tile_map.max_y)
+        self.tile_map = tile_map
+
+    def getMoveCosts(self):
+        # The layers are indexed [x, y], the location ids are y * w + x
+        return (self.tile_map.blocking_layer == 0).astype(numpy.uint8).T.ravel().tolist()
+
+
+class CarvingMapHandler(TileMapHandler):
+    """
+    A map handler for the A* where the water and the rocks can be crossed, at a higher cost: the path is then carved
+    through them (see TownTileMap.repair_connection). The walls stay blocking.
+    """
+
+    CARVING_COST = 5
+
+    def getMoveCosts(self):
+        # Cost of each floor code
+        floor_costs = numpy.where(TileMap.BLOCKING_CODES > 0, CarvingMapHandler.CARVING_COST, 1).astype(numpy.uint8)
+        floor_costs[Tile.FLOOR_CODES[Tile.WALL]] = 0
+        return floor_costs[self.tile_map.floor_layer].T.ravel().tolist()
+
+
+class RegionMapHandler(TileMapHandler):
+    """
+    The map handler of the A* limited to one region of a tile map (see NavigationGraph)
+    """
+
+    def __init__(self, tile_map, region):
+        """
+        :param region: a boolean array, True for the tiles of the region that can be walked on
+        """
+        super().__init__(tile_map)
+        self.region = region
+
+    def getMoveCosts(self):
+        return self.region.astype(numpy.uint8).T.ravel().tolist()
+
+
+class NavigationGraph(object):
+    """
+    Hierarchical pathfinding (HPA*) over the rooms of a town map.
+    The map is cut in regions: the inside of each room, and the outdoor (the tiles in no room). The doors, which are
+    in two regions, are the nodes of a small abstract graph. Its edges are the walks between two doors of the same
+    region, whose cost is read out of the distances from each door to all the tiles of its regions (see
+    TileMap.grid_distances), computed once.
+    A path is searched on the abstract graph first, the start and the end being linked to the doors of their regions
+    with the same distances. Then only the edges of the abstract path are refined into tiles, by walking down the
+    distances to their door. Two tiles of the same region may also be joined directly, with an A* on that region.
+    The moves are in 4 directions, as with Util.AStar. The locked doors are left out of the abstract graph (see
+    set_door_locked). Same API as Util.AStar.
+    """
+
+    OUTDOOR = -1
+
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+        self.mh = TileMapHandler(tile_map)
+        self.version = None  # The static_blocking_version of the tile map the graph was built for
+        self.free = None  # The walkable tiles (see TileMap.static_blocking_layer)
+        self.door_regions = {}  # {door position: [region, ...]}
+        self.door_distances = {}  # {(door position, region): distances from the door in the region}
+        self.edges = {}  # {door position: {door position: (cost, region)}}
+        self.locked_doors = set()
+        self.segments = {}  # {(door position, door position, region): positions}, the refined edges
+        self.expanded = 0  # number of abstract nodes expanded by the last search
+
+    def update(self):
+        """
+        Build the graph again if the static blocking tiles changed
+        """
+        if self.version == self.tile_map.static_blocking_version:
+            return
+        self.version = self.tile_map.static_blocking_version
+        self.free = ~self.tile_map.static_blocking_layer()
+        self.door_regions = {}
+        self.door_distances = {}
+        self.edges = {}
+        self.segments = {}
+        self.locked_doors = set()
+        for room in self.tile_map.rooms:
+            for (place, orientation) in room.doors:
+                self.door_regions[place] = [self.region_of(place), NavigationGraph.OUTDOOR]
+                door_id = self.tile_map.map[place].get_object_id(Door)
+                if door_id and GameData.game_dict[door_id].locked:
+                    self.locked_doors.add(place)
+        for door, regions in self.door_regions.items():
+            self.edges[door] = {}
+            for region in regions:
+                self.door_distances[(door, region)] = TileMap.grid_distances(self.region_tiles(region), door)
+        for door, regions in self.door_regions.items():
+            for region in regions:
+                for other_door in self.doors_in(region):
+                    cost = int(self.door_distances[(door, region)][other_door])
+                    if other_door != door and cost >= 0 and cost < self.edges[door].get(other_door, (cost + 1,))[0]:
+                        self.edges[door][other_door] = (cost, region)
+
+    def region_of(self, position):
+        """
+        :return: the region of a tile that is not a door: the index of its room in the room list, or OUTDOOR
+        """
+        return int(self.tile_map.room_layer[position]) if self.tile_map.room_layer[position] >= 0 \
+            else NavigationGraph.OUTDOOR
+
+    def regions_of(self, position):
+        return self.door_regions.get(position) or [self.region_of(position)]
+
+    def region_tiles(self, region):
+        """
+        :return: a boolean array, True for the tiles of the region that can be walked on. The doors are in the
+        outdoor region and in the region of their room.
+        """
+        if region == NavigationGraph.OUTDOOR:
+            tiles = self.tile_map.room_layer < 0
+        else:
+            tiles = self.tile_map.room_layer == region
+        for door in self.door_regions:
+            tiles[door] = True
+        return tiles & self.free
+
+    def doors_in(self, region):
+        return [door for door, regions in self.door_regions.items() if region in regions]
+
+    def set_door_locked(self, place, locked):
+        """
+        A door was locked or unlocked: its edges are taken out of the abstract graph or back in
+        """
+        if locked:
+            self.locked_doors.add(place)
+        else:
+            self.locked_doors.discard(place)
+
+    def findPath(self, fromlocation, tolocation):
+        self.update()
+        start = (fromlocation.x, fromlocation.y)
+        end = (tolocation.x, tolocation.y)
+        if start not in self.tile_map.map or end not in self.tile_map.map or not self.free[end]:
+            return None
+
+        # Abstract search: Dijkstra from the start, on the unlocked doors and the end
+        links_to_end = {}  # {door: (cost, region)}
+        for region in self.regions_of(end):
+            for door in self.doors_in(region):
+                cost = int(self.door_distances[(door, region)][end])
+                if door not in self.locked_doors and cost >= 0:
+                    links_to_end[door] = (cost, region)
+        costs = {start: 0}
+        parents = {}
+        open_heap = []
+        if start in self.door_regions and start not in self.locked_doors:
+            open_heap.append((0, start))
+        for region in self.regions_of(start):
+            for door in self.doors_in(region):
+                cost = int(self.door_distances[(door, region)][start])
+                if door not in self.locked_doors and cost >= 0 and cost < costs.get(door, Util.AStar.UNREACHED):
+                    costs[door] = cost
+                    parents[door] = (start, region)
+                    heapq.heappush(open_heap, (cost, door))
+        self.expanded = 0
+        closed = set()
+        while open_heap:
+            (cost, node) = heapq.heappop(open_heap)
+            if node in closed or node == end:
+                continue
+            closed.add(node)
+            self.expanded += 1
+            next_nodes = [(other_door, edge) for other_door, edge in self.edges[node].items()
+                          if other_door not in self.locked_doors]
+            if node in links_to_end:
+                next_nodes.append((end, links_to_end[node]))
+            for (next_node, (edge_cost, region)) in next_nodes:
+                if cost + edge_cost < costs.get(next_node, Util.AStar.UNREACHED):
+                    costs[next_node] = cost + edge_cost
+                    parents[next_node] = (node, region)
+                    heapq.heappush(open_heap, (cost + edge_cost, next_node))
+
+        # Direct path, if the start and the end share a region and it may be shorter
+        direct = None
+        shared_regions = set(self.regions_of(start)) & set(self.regions_of(end))
+        if shared_regions and abs(start[0] - end[0]) + abs(start[1] - end[1]) < costs.get(end, Util.AStar.UNREACHED):
+            for region in shared_regions:
+                path = Util.AStar(RegionMapHandler(self.tile_map, self.region_tiles(region))).findPath(
+                    fromlocation, tolocation)
+                if path and path.getTotalMoveCost() < costs.get(end, Util.AStar.UNREACHED):
+                    costs[end] = path.getTotalMoveCost()
+                    direct = path
+        if direct or start == end:
+            return direct or Util.Path([], 0)
+        if end not in parents:
+            return None
+
+        # Refinement of the abstract path into tiles
+        abstract_path = [end]
+        while abstract_path[-1] != start:
+            abstract_path.append(parents[abstract_path[-1]][0])
+        abstract_path.reverse()
+        positions = []
+        for (node, next_node) in zip(abstract_path, abstract_path[1:]):
+            positions.extend(self.refine(node, next_node, parents[next_node][1]))
+        return self.make_path(positions)
+
+    def refine(self, from_position, to_position, region):
+        """
+        :return: the positions from from_position (excluded) to to_position, in the region. One of them is a door.
+        """
+        if (from_position, to_position, region) in self.segments:
+            return self.segments[(from_position, to_position, region)]
+        if (to_position, region) in self.door_distances:
+            positions = self.walk_down(self.door_distances[(to_position, region)], from_position)
+        else:
+            positions = self.walk_down(self.door_distances[(from_position, region)], to_position)
+            positions = positions[-2::-1] + [to_position]
+        if from_position in self.door_regions and to_position in self.door_regions:
+            self.segments[(from_position, to_position, region)] = positions
+        return positions
+
+    def walk_down(self, distances, position):
+        """
+        :return: the positions from position (excluded) down to the origin of the distances
+        """
+        positions = []
+        distance = distances[position]
+        while distance > 0:
+            for neighbour in ((position[0] + 1, position[1]), (position[0] - 1, position[1]),
+                              (position[0], position[1] + 1), (position[0], position[1] - 1)):
+                if neighbour in self.tile_map.map and distances[neighbour] == distance - 1:
+                    position = neighbour
+                    break
+            positions.append(position)
+            distance -= 1
+        return positions
+
+    def make_path(self, positions):
+        nodes = []
+        parent = None
+        for (x, y) in positions:
+            parent = Util.Node(Util.SQ_Location(x, y), len(nodes) + 1, y * self.tile_map.max_x + x, parent)
+            nodes.append(parent)
+        return Util.Path(nodes, len(nodes))
+
+
+class TilesetCache(object):
+    """
+    The autotile sets used to render the maps (16 tiles, one for each combination of neighbours of the same
+    terrain, see TileMap.compute_tile_weight). Each set is cut out of its source image and scaled once per process,
+    then shared by all the maps rendered. The sets can also be kept on disk (see Constants.TILESET_CACHE_FOLDER), so
+    that the next runs load them already scaled.
+    """
+
+    tilesets = {}  # {(style, source file, origin, destination tile size): [tiles]}
+
+    @staticmethod
+    def folder():
+        """
+        :return: where the sets are kept on disk, None to keep them in memory only. Read at each use, so that
+        Constants.TILESET_CACHE_FOLDER can be set after this module is imported.
+        """
+        return Constants.TILESET_CACHE_FOLDER
+
+    @classmethod
+    def get(cls, style, source_file, origin, destination_tile_size, build):
+        """
+        :param source_file: the image the tiles are cut out of
+        :param origin: the position of the set in the image
+        :param destination_tile_size: the size of the tiles on screen
+        :param build: the function cutting out the set (floor_tiles_dawnlike...), called when it is not cached
+        :return: the list of the 16 tiles
+        """
+        key = (style, source_file, tuple(origin), tuple(destination_tile_size))
+        if key not in cls.tilesets:
+            tiles = cls._load(key)
+            if tiles is None:
+                tiles = build(cls.source_image(source_file), origin[0], origin[1], destination_tile_size)
+                cls._store(key, tiles)
+            cls.tilesets[key] = tiles
+        return cls.tilesets[key]
+
+    @staticmethod
+    def source_image(source_file):
+        # Shared with the sprites
+        if source_file not in Util.PygAnimation.loaded_image:
+            Util.PygAnimation.loaded_image[source_file] = pygame.image.load(source_file).convert_alpha()
+        return Util.PygAnimation.loaded_image[source_file]
+
+    @classmethod
+    def _file_name(cls, key):
+        """
+        :return: where the set is kept on disk. The name changes with the source image, so that an old set is
+        not used once the image is modified.
+        """
+        source_stat = os.stat(key[1])
+        digest = hashlib.sha1(repr((key, source_stat.st_mtime_ns, source_stat.st_size)).encode()).hexdigest()
+        return os.path.join(cls.folder(), "tileset_{}.png".format(digest[:20]))
+
+    @classmethod
+    def _load(cls, key):
+        if not cls.folder():
+            return None
+        file_name = cls._file_name(key)
+        if not os.path.exists(file_name):
+            return None
+        strip = pygame.image.load(file_name).convert_alpha()
+        (width, height) = key[3]
+        return [strip.subsurface(pygame.Rect((index * width, 0), (width, height))).copy()
+                for index in range(strip.get_width() // width)]
+
+    @classmethod
+    def _store(cls, key, tiles):
+        # The tiles are saved side by side in one image
+        if not cls.folder():
+            return
+        (width, height) = key[3]
+        strip = pygame.Surface((width * len(tiles), height), pygame.SRCALPHA)
+        for index, tile in enumerate(tiles):
+            strip.blit(tile, (index * width, 0))
+        os.makedirs(cls.folder(), exist_ok=True)
+        pygame.image.save(strip, cls._file_name(key))
+
+    @staticmethod
+    def floor_tiles_dawnlike(source_file, origin_x, origin_y, destination_tile_size):
+        file_tile_size = (16, 16)
+        x_dev = file_tile_size[0]
+        y_dev = file_tile_size[1]
+        tile = [
+            source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 6 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy()
+        ]
+        scaled_tile = []
+        for a_tile in tile:
+            scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
+        return scaled_tile
+
+    @staticmethod
+    def wall_tiles_dawnlike(source_file, origin_x, origin_y, destination_tile_size):
+        file_tile_size = (16, 16)
+        x_dev = file_tile_size[0]
+        y_dev = file_tile_size[1]
+        tile = [
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(
+                pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(
+                pygame.Rect((origin_x + 0 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(
+                pygame.Rect((origin_x + 2 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy()
+        ]
+        scaled_tile = []
+        for a_tile in tile:
+            scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
+        return scaled_tile
+
+    @staticmethod
+    def floor_tiles_oryx(source_file, origin_x, origin_y, destination_tile_size):
+        file_tile_size = (24, 24)
+        x_dev = file_tile_size[0]
+        y_dev = file_tile_size[1]
+        tile = [
+            source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 6 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 9 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 7 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 14 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 10 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 15 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 8 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 13 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy()
+        ]
+        scaled_tile = []
+        for a_tile in tile:
+            scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
+        return scaled_tile
+
+    @staticmethod
+    def wall_tiles_oryx(source_file, origin_x, origin_y, destination_tile_size):
+        file_tile_size = (24, 24)
+        x_dev = file_tile_size[0]
+        tile = [
+            source_file.subsurface(pygame.Rect((origin_x + 9 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 15 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 10 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 18 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 13 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 14 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 16 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 23 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 12 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 19 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 11 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 24 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 17 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 22 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 21 * x_dev, origin_y), file_tile_size)).copy(),
+            source_file.subsurface(pygame.Rect((origin_x + 20 * x_dev, origin_y), file_tile_size)).copy()
+        ]
+        scaled_tile = []
+        for a_tile in tile:
+            scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
+        return scaled_tile
+
+
 class TownTileMap(TileMap):
 
-    def __init__(self, town, size, make_map=False, render_map=False, style=Constants.DAWNLIKE_STYLE):
+    # Ground generation algorithms (see make_map)
+    GROUND_CELLULAR = "cellular"  # Whole grid cellular automaton passes
+    GROUND_LEGACY = "legacy"  # Random single cell updates
+    GROUND_ALGORITHM = GROUND_CELLULAR  # The algorithm of the new maps
+    GROUND_GRASS_PERCENT = 55  # Initial share of grass
+    GROUND_CELLULAR_PASSES = 1  # One pass gives about the texture of the legacy updates
+    GROUND_LEGACY_UPDATES = 4000
+
+    def __init__(self, town, size, make_map=False, render_map=False, style=Constants.DAWNLIKE_STYLE,
+                 ground_algorithm=None):
+        """
+        :param ground_algorithm: GROUND_CELLULAR or GROUND_LEGACY, GROUND_ALGORITHM if not given
+        """
         super().__init__(size, make_map=False, render_map=False)
 
         self.town = town
         self.surface_memory = None
         self.rooms = []
         self.default_start_player_position = (0, 0)
+        self.ground_algorithm = ground_algorithm or TownTileMap.GROUND_ALGORITHM
 
         if make_map or render_map:
             self.make_map()
         if render_map:
             self.render(style)
 
-    def get_place_in_building(self, building_name):
+    @staticmethod
+    def count_neighbours(cells):
+        """
+        :param cells: a boolean array
+        :return: for each cell, the number of True cells in the 3x3 block around it (itself included). The cells
+        out of the array count as False.
+        """
+        padded = numpy.pad(cells.astype(numpy.uint8), 1)
+        (max_x, max_y) = cells.shape
+        count = numpy.zeros(cells.shape, dtype=numpy.uint8)
+        for var_x in (0, 1, 2):
+            for var_y in (0, 1, 2):
+                count += padded[var_x:var_x + max_x, var_y:var_y + max_y]
+        return count
+
+    def layout(self):
+        """
+        :return: the map without its decorations, in a compact form made of simple types (see load_layout): packed
+        layers (see packed_layers), room list (building indexes), rooms (building index, places, doors) and start
+        position
+        """
+        buildings = self.town.buildings
+        return {"packed_layers": self.packed_layers(),
+                "room_list": [buildings.index(building) for building in self.room_list],
+                "rooms": [(buildings.index(room.building), room.places, room.doors) for room in self.rooms],
+                "start": self.default_start_player_position}
+
+    def load_layout(self, layout):
+        """
+        Take a map made ahead (see layout and generate_town_layout), as make_map(decorate=False) would have made it
+        """
+        buildings = self.town.buildings
+        self.reset_tiles()
+        self.load_packed_layers(layout["packed_layers"])
+        self.restore_layers()
+        self.room_list = [buildings[index] for index in layout["room_list"]]
+        self.rooms = [Room.restore(self.town, buildings[index], places, doors)
+                      for (index, places, doors) in layout["rooms"]]
+        self.default_start_player_position = layout["start"]
+        self.generated = True
+
+    def regenerate_layers(self):
+        """
+        Generate the map again, without the decorations (they are game objects: they are still there). The rooms
+        and the start position are taken back too.
+        """
+        tile_map = TownTileMap(self.town, (self.max_x, self.max_y), ground_algorithm=self.ground_algorithm)
+        tile_map.make_map(decorate=False)
+        self.rooms = tile_map.rooms
+        self.room_list = tile_map.room_list
+        self.default_start_player_position = tile_map.default_start_player_position
+        return tile_map.floor_layer, tile_map.room_layer
+
+    def navigation_graph(self):
+        """
+        :return: the hierarchical pathfinder of the map (see NavigationGraph)
+        """
+        if self.navigation is None:
+            self.navigation = NavigationGraph(self)
+        return self.navigation
+
+    def get_place_in_building(self, building_name, rng=random):
+        """
+        :return: a random free floor tile of the building, that can be reached from its door
+        """
         default = (0, 0)
         for room in self.rooms:
             if room.building.name == building_name:
-                for trials in range(100):
-                    place = random.choice(room.places)
-                    if self.map[place].floor_type == Tile.FLOOR and not self.map[place].blocking:
-                        return place
-                return default
+                def tiles():
+                    return (self.room_layer == self.room_list.index(room.building)) & \
+                           (self.floor_layer == Tile.FLOOR_CODES[Tile.FLOOR])
+                return self.connectivity_index().random_place(tiles, room.doors[0][0], rng=rng,
+                                                              key=room.building) or default
         print("Warning: room type not found!!")
         return default
 
-    def make_map(self):
+    def repair_connection(self, room, other_room, rng):
+        """
+        Connect the door of other_room to the door of room, when no path joins them. First, the door of other_room is
+        moved to a wall that faces a tile reachable from the door of room. If there is none, a path is carved through
+        the water and rocks (see CarvingMapHandler).
+        :return: the path between the doors, None if they cannot be connected
+        """
+        start = Util.SQ_Location(*room.doors[0][0])
+        connectivity = self.connectivity_index()
+        door_places = [(place, orientation) for (place, orientation, outside) in
+                       other_room.door_places(self.map, self.max_x, self.max_y)
+                       if outside in self.map and connectivity.connected(room.doors[0][0], outside)]
+        if door_places:
+            print("Repairing: moving a door")
+            other_room.move_door(self.map, *rng.choice(door_places))
+            p = Util.AStar(TileMapHandler(self)).findPath(
+                start, Util.SQ_Location(*other_room.doors[0][0]))
+            if p:
+                return p
+        print("Repairing: carving a path")
+        return Util.AStar(CarvingMapHandler(self)).findPath(
+            start, Util.SQ_Location(*other_room.doors[0][0]))
+
+    def make_map(self, decorate=True):
+        """
+        Generate the map out of the town seed (see Town.random_stream). The decorations have their own random
+        generator, so that the layers do not depend on them.
+        :param decorate: False to leave the decorations out (see regenerate_layers)
+        """
+        rng = self.town.random_stream("map")
 
         def prepare_ground():
             # Reset all!
-            for x in range(self.max_x):
-                for y in range(self.max_y):
-                    self.map[(x, y)] = Tile((x, y), Tile.UNKNOWN, self)
+            self.reset_tiles()
 
             # First: prepare the land with Dirt and Grass
             # Use the IslandMaze algo... http://www.evilscience.co.uk/?p=53
+            if self.ground_algorithm == TownTileMap.GROUND_LEGACY:
+                prepare_ground_legacy()
+                return
+
+            # A grass cell stays (or becomes) grass if more than 4 of the 9 cells of its 3x3 block are grass. The
+            # passes are run on the whole grid at once.
+            grid_rng = numpy.random.default_rng(rng.getrandbits(64))
+            grass = grid_rng.random((self.max_x, self.max_y)) * 100 < TownTileMap.GROUND_GRASS_PERCENT
+            for a_pass in range(TownTileMap.GROUND_CELLULAR_PASSES):
+                grass = TownTileMap.count_neighbours(grass) > 4
+            self.set_floor_layer(numpy.where(grass, Tile.FLOOR_CODES[Tile.GRASS], Tile.FLOOR_CODES[Tile.DIRT]))
+
+        def prepare_ground_legacy():
+            grass_code = Tile.FLOOR_CODES[Tile.GRASS]
+            dirt_code = Tile.FLOOR_CODES[Tile.DIRT]
+            floor_layer = numpy.zeros((self.max_x, self.max_y), dtype=numpy.uint8)
 
             def check_cell(x_val, y_val):
                 if 0 <= x_val < self.max_x and 0 <= y_val < self.max_y:
-                    if self.map[(x_val, y_val)].floor_type == Tile.GRASS:
+                    if floor_layer[x_val, y_val] == grass_code:
                         return True
                 return False
 
@@ -370,160 +2045,39 @@ class TownTileMap(TileMap):
 
             for x in range(self.max_x):
                 for y in range(self.max_y):
-                    if random.randint(0, 100) < 55:
-                        self.map[(x, y)].floor_type = Tile.GRASS
+                    if rng.randint(0, 100) < TownTileMap.GROUND_GRASS_PERCENT:
+                        floor_layer[x, y] = grass_code
                     else:
-                        self.map[(x, y)].floor_type = Tile.DIRT
+                        floor_layer[x, y] = dirt_code
 
             # Pick random cells
-            for i in range(4000):
-                random_x = random.randint(0, self.max_x - 1)
-                random_y = random.randint(0, self.max_y - 1)
+            for i in range(TownTileMap.GROUND_LEGACY_UPDATES):
+                random_x = rng.randint(0, self.max_x - 1)
+                random_y = rng.randint(0, self.max_y - 1)
                 if examine_neighbours(random_x, random_y) > 4:
-                    self.map[(random_x, random_y)].floor_type = Tile.GRASS
+                    floor_layer[random_x, random_y] = grass_code
                 else:
-                    self.map[(random_x, random_y)].floor_type = Tile.DIRT
+                    floor_layer[random_x, random_y] = dirt_code
+
+            self.set_floor_layer(floor_layer)
 
         def add_shape(center_x, center_y, terrain_type):
             x = center_x
             y = center_y
             for an_iteration in range(100):
-                if random.randint(1, 4) == 1 and x-1 >= 0:
+                if rng.randint(1, 4) == 1 and x-1 >= 0:
                     x -= 1
                     self.map[(x, y)].floor_type = terrain_type
-                if random.randint(1, 4) == 1 and x+1 < self.max_x:
+                if rng.randint(1, 4) == 1 and x+1 < self.max_x:
                     x += 1
                     self.map[(x, y)].floor_type = terrain_type
-                if random.randint(1, 4) == 1 and y-1 >= 0:
+                if rng.randint(1, 4) == 1 and y-1 >= 0:
                     y -= 1
                     self.map[(x, y)].floor_type = terrain_type
-                if random.randint(1, 4) == 1 and y+1 < self.max_y:
+                if rng.randint(1, 4) == 1 and y+1 < self.max_y:
                     y += 1
                     self.map[(x, y)].floor_type = terrain_type
 
-        class Room(object):
-
-            def __init__(self, town, width, height, top_x, top_y, building):
-                self.town = town
-                self.connected_by_path = False
-                self.places = []
-                self.doors = []
-                self.building = building
-                for x_coord in range(top_x, width + top_x):
-                    for y_coord in range(top_y, height + top_y):
-                        self.places.append((x_coord, y_coord))
-                additions = random.randint(1, 4)
-                for i in range(additions):
-                    # Add an extra room: pick a coordinate, and build from that
-                    origin = random.choice(self.places)
-                    addition_width = max(width + random.randint(-3, 0), 3)
-                    addition_height = max(height + random.randint(-3, 0), 3)
-                    for x_coord in range(origin[0], addition_width + origin[0]):
-                        for y_coord in range(origin[1], addition_height + origin[1]):
-                            self.places.append((x_coord, y_coord))
-
-            def can_place(self, tile_map):
-                # Step 1: make sure the ground is not blocked
-                for place in self.places:
-                    if place not in tile_map.keys() or tile_map[place].blocking:
-                        return False
-                # Step 2: leave a two block path around the building
-                for place in self.places:
-                    (x, y) = place
-                    for x_var in (-2, -1, 0, 1, 2):
-                        for y_var in (-2, -1, 0, 1, 2):
-                            test_place = (x + x_var, y + y_var)
-                            if test_place not in self.places and (test_place not in tile_map.keys()
-                                                                  or tile_map[test_place].blocking):
-                                return False
-                return True
-
-            def compute_tile_weight(self, x, y, terrain_type_list, map, max_x, max_y):
-                count = 0
-                if y - 1 >= 0 and map[(x, y - 1)].floor_type in terrain_type_list:
-                    count += 1
-                if x + 1 < max_x and map[(x + 1, y)].floor_type in terrain_type_list:
-                    count += 2
-                if y + 1 < max_y and map[(x, y + 1)].floor_type in terrain_type_list:
-                    count += 4
-                if x - 1 >= 0 and map[(x - 1, y)].floor_type in terrain_type_list:
-                    count += 8
-                return count
-
-            def carve(self, tile_map, max_x, max_y):
-                for place in self.places:
-                    tile_map[place].floor_type = Tile.FLOOR
-                    tile_map[place].room = self.building
-                for place in self.places:
-                    if self.compute_tile_weight(place[0], place[1], (Tile.FLOOR, Tile.WALL),
-                                                tile_map, max_x, max_y) != 15:
-                        tile_map[place].floor_type = Tile.WALL
-
-            def smooth_walls(self, tile_map, max_x, max_y):
-                #TODO smooth wall is buggy
-                additional_walls = []
-                for place in self.places:
-                    if tile_map[place].floor_type == Tile.FLOOR and \
-                                    self.compute_tile_weight(place[0], place[1], (Tile.WALL),
-                                                             tile_map, max_x, max_y) == 3 and tile_map[
-                                place[0] + 1, place[1] - 1].floor_type == Tile.FLOOR:
-                        additional_walls.append(place)
-                    elif tile_map[place].floor_type == Tile.FLOOR and \
-                                    self.compute_tile_weight(place[0], place[1], (Tile.WALL),
-                                                             tile_map, max_x, max_y) == 6 and tile_map[
-                                place[0] + 1, place[1] + 1].floor_type == Tile.FLOOR:
-                        additional_walls.append(place)
-                #for place in additional_walls:
-                #    tile_map[place].floor_type = Tile.WALL
-
-            def place_door(self, tile_map, max_x, max_y):
-                #nb_doors = random.randint(1, 3)
-                nb_doors = 1
-                nb_placed = 0
-                while nb_placed < nb_doors:
-                    place = random.choice(self.places)
-                    weight = self.compute_tile_weight(place[0], place[1],
-                                                      (Tile.FLOOR, Tile.WALL), tile_map, max_x, max_y)
-                    if weight in (7, 11, 14, 13):
-                        orientation = Door.ORIENTATION_HORIZONTAL
-                        if weight in (7, 13):
-                            orientation = Door.ORIENTATION_VERTICAL
-                        self.doors.append((place, orientation))
-                        nb_placed += 1
-
-            def add_deco(self, tile_map, max_x, max_y):
-                """
-                Add the decorative object. Note that the decoration is a GameObject!
-                :param tile_map:
-                :param max_x:
-                :param max_y:
-                :return: nothing
-                """
-                list_doors = [door_def[0] for door_def in self.doors]
-                for i in range(20):
-                    place = random.choice(self.places)
-                    weight = self.compute_tile_weight(place[0], place[1], [Tile.FLOOR], tile_map, max_x, max_y)
-                    near_door = (place[0], place[1] - 1) in list_doors or \
-                                (place[0], place[1] + 1) in list_doors or \
-                                (place[0] - 1, place[1]) in list_doors or \
-                                (place[0] + 1, place[1]) in list_doors
-                    if not (near_door or not (tile_map[place].floor_type == Tile.FLOOR) or tile_map[
-                        place].has_things) and weight == 15:
-                        a_deco = random.choice(self.building.decoration_list["1x1"])
-                        decoration = GameObject(a_deco[0], GameObject.DECORATION,
-                                                town=self.town,
-                                                weight=random.randint(1, 10),
-                                                volume=random.randint(1, 5),
-                                                regular_value=random.randint(2, 10),
-                                                displayable_object=DisplayableObject(movable=False, blocking=a_deco[1],
-                                                                                     position_on_tile=place,
-                                                                                     graphical_representation=
-                                                                                     AnimatedSpriteObject(
-                                                                                         Constants.DAWNLIKE_STYLE,
-                                                                                         "Objects", "Decor",
-                                                                                         a_deco[2])))
-                        GameData.register_object(decoration)
-
         need_rebuild = True
 
         while need_rebuild:
@@ -534,25 +2088,29 @@ class TownTileMap(TileMap):
             prepare_ground()
             # Main process - Lake
             print("Generating lake and rocks")
-            for k in range(random.randint(1, 3)):
-                add_shape(random.randint(0, self.max_x - 1), random.randint(0, self.max_y - 1), Tile.WATER)
-                add_shape(random.randint(0, self.max_x - 1), random.randint(0, self.max_y - 1), Tile.ROCK)
+            for k in range(rng.randint(1, 3)):
+                add_shape(rng.randint(0, self.max_x - 1), rng.randint(0, self.max_y - 1), Tile.WATER)
+                add_shape(rng.randint(0, self.max_x - 1), rng.randint(0, self.max_y - 1), Tile.ROCK)
             # Main process - Room
             room_placed = []
             self.rooms = []
             trials = 0
             print("Placing rooms")
+            placer = RoomPlacer(self, (self.max_x // 5, self.max_x - self.max_x // 5),
+                                (self.max_y // 5, self.max_y - self.max_y // 5))
             while len(room_placed) < len(self.town.buildings) and trials < 100:
                 a_room = Room(self.town,
-                              10 + random.randint(-3, 1),
-                              10 + random.randint(-3, 1),
-                              random.randint(self.max_x // 5, self.max_x - self.max_x // 5),
-                              random.randint(self.max_y // 5, self.max_y - self.max_y // 5),
-                              self.town.buildings[len(room_placed)])
-                if a_room.can_place(self.map):
+                              10 + rng.randint(-3, 1),
+                              10 + rng.randint(-3, 1),
+                              self.town.buildings[len(room_placed)],
+                              rng=rng)
+                place = placer.find_place(a_room, rng=rng)
+                if place is not None:
+                    a_room.move_to(*place)
                     a_room.carve(self.map, self.max_x, self.max_y)
                     a_room.smooth_walls(self.map, self.max_x, self.max_y)
-                    a_room.place_door(self.map, self.max_x, self.max_y)
+                    a_room.place_door(self.map, self.max_x, self.max_y, rng=rng)
+                    placer.update()
                     room_placed.append(a_room)
                 trials += 1
 
@@ -569,14 +2127,20 @@ class TownTileMap(TileMap):
                     for door in room.doors:
                         self.map[door[0]].floor_type = Tile.FLOOR
 
-                random.shuffle(room_placed)
+                rng.shuffle(room_placed)
 
+                connectivity = self.connectivity_index()
                 for index, room in enumerate(room_placed[:-1]):
                     door1 = (room.doors[0])[0]
                     door2 = (room_placed[index + 1].doors[0])[0]
-                    astar = Util.AStar(Util.SQ_MapHandler(self.map, self.max_x, self.max_y))
-                    p = astar.findPath(Util.SQ_Location(door1[0], door1[1]), Util.SQ_Location(door2[0], door2[1]))
-
+                    p = None
+                    # No need to search if the doors are not in the same region
+                    if connectivity.connected(door1, door2):
+                        astar = Util.AStar(TileMapHandler(self))
+                        p = astar.findPath(Util.SQ_Location(door1[0], door1[1]),
+                                           Util.SQ_Location(door2[0], door2[1]))
+                    if not p:
+                        p = self.repair_connection(room, room_placed[index + 1], rng)
                     if not p:
                         # impossible to connect the room: reject and restart from scratch
                         print("One path not made... Regenerating".format(trials))
@@ -590,197 +2154,73 @@ class TownTileMap(TileMap):
                                 self.map[(n.location.x, n.location.y)].floor_type = Tile.PATH
                                 possible_starts.append((n.location.x, n.location.y))
                         if len(possible_starts) > 0:
-                            self.default_start_player_position = random.choice(possible_starts)
+                            self.default_start_player_position = rng.choice(possible_starts)
 
-                # finish building it - Now redecorating and carving really the door
-                for room in room_placed:
-                    room.add_deco(self.map, self.max_x, self.max_y)
-                # and adding the room to the official list of room
+                if need_rebuild:
+                    continue
+                # adding the room to the official list of room
                 for room in room_placed:
                     self.rooms.append(room)
+                self.generated = True
+                # finish building it - Now redecorating and carving really the door
+                if decorate:
+                    self.decorate()
 
-    def render(self, style):
+    def decorate(self):
+        """
+        Add the decorations in the rooms, with their own random generator
+        """
+        decoration_rng = self.town.random_stream("decoration")
+        for room in self.rooms:
+            room.add_deco(self.map, self.max_x, self.max_y, rng=decoration_rng)
 
-        def build_floor_tile_dawnlike(source_file, origin_x, origin_y, destination_tile_size):
-            file_tile_size = (16, 16)
-            x_dev = file_tile_size[0]
-            y_dev = file_tile_size[1]
-            tile = [
-                source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 6 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy()
-            ]
-            scaled_tile = []
-            for a_tile in tile:
-                scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
-            return scaled_tile
-
-        def build_wall_tile_dawnlike(source_file, origin_x, origin_y, destination_tile_size):
-            file_tile_size = (16, 16)
-            x_dev = file_tile_size[0]
-            y_dev = file_tile_size[1]
-            tile = [
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(
-                    pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(
-                    pygame.Rect((origin_x + 0 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(
-                    pygame.Rect((origin_x + 2 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 2 * y_dev), file_tile_size)).copy()
-            ]
-            scaled_tile = []
-            for a_tile in tile:
-                scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
-            return scaled_tile
-
-        def build_floor_tile_oryx(source_file, origin_x, origin_y, destination_tile_size):
-            file_tile_size = (24, 24)
-            x_dev = file_tile_size[0]
-            y_dev = file_tile_size[1]
-            tile = [
-                source_file.subsurface(pygame.Rect((origin_x + 0 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 6 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 9 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 4 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 5 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 7 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 14 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 3 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 10 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 15 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 8 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 13 * x_dev, origin_y + 1 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 2 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 1 * x_dev, origin_y + 0 * y_dev), file_tile_size)).copy()
-            ]
-            scaled_tile = []
-            for a_tile in tile:
-                scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
-            return scaled_tile
-
-        def build_wall_tile_oryx(source_file, origin_x, origin_y, destination_tile_size):
-            file_tile_size = (24, 24)
-            x_dev = file_tile_size[0]
-            tile = [
-                source_file.subsurface(pygame.Rect((origin_x + 9 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 15 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 10 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 18 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 13 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 14 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 16 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 23 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 12 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 19 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 11 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 24 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 17 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 22 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 21 * x_dev, origin_y), file_tile_size)).copy(),
-                source_file.subsurface(pygame.Rect((origin_x + 20 * x_dev, origin_y), file_tile_size)).copy()
-            ]
-            scaled_tile = []
-            for a_tile in tile:
-                scaled_tile.append(pygame.transform.smoothscale(a_tile, destination_tile_size))
-            return scaled_tile
+    def tile_sets(self, style):
+        """
+        :return: the autotile set of each floor type for the style (see TilesetCache)
+        """
+        if style == Constants.DAWNLIKE_STYLE:
+            wall_file = Constants.DAWNLIKE_IMAGE_RESOURCE_FOLDER + 'Objects/Wall.png'
+            floor_file = Constants.DAWNLIKE_IMAGE_RESOURCE_FOLDER + 'Objects/Floor.png'
+
+            def floor_tiles(origin):
+                return TilesetCache.get(style, floor_file, origin, Constants.TILE_SIZE,
+                                        TilesetCache.floor_tiles_dawnlike)
+
+            return {Tile.DIRT: floor_tiles((0, 288)),
+                    Tile.FLOOR: floor_tiles((112, 288)),
+                    Tile.GRASS: floor_tiles((112, 96)),
+                    Tile.WATER: floor_tiles((224, 288)),
+                    Tile.ROCK: floor_tiles((224, 96)),
+                    Tile.PATH: floor_tiles((0, 96)),
+                    Tile.WALL: TilesetCache.get(style, wall_file, (112, 48), Constants.TILE_SIZE,
+                                                TilesetCache.wall_tiles_dawnlike)}
+        else:
+            source_file_o = Constants.ORYX_IMAGE_RESOURCE_FOLDER + 'oryx_16bit_fantasy_world_trans.png'
+            floor_image = TilesetCache.get(style, source_file_o, (696, 384), Constants.TILE_SIZE,
+                                           TilesetCache.floor_tiles_oryx)
+            tile_sets = {floor_type: floor_image for floor_type in (Tile.GRASS, Tile.WATER, Tile.ROCK, Tile.PATH,
+                                                                    Tile.DIRT, Tile.FLOOR)}
+            tile_sets[Tile.WALL] = TilesetCache.get(style, source_file_o, (24, 336), Constants.TILE_SIZE,
+                                                    TilesetCache.wall_tiles_oryx)
+            return tile_sets
 
+    def render(self, style):
+        """
+        Draw the floor of the map on surface_memory, if it is not drawn yet. Each tile is drawn with the tile of the
+        autotile set of its floor type given by its weight (see tile_weights): the tiles are picked from a lookup
+        table indexed by floor code and weight, then drawn all at once.
+        """
         if not self.surface_memory:
 
             self.surface_memory = pygame.Surface((self.max_x * Constants.TILE_SIZE[0],
                                                   self.max_y * Constants.TILE_SIZE[1]))
 
-            if style == Constants.DAWNLIKE_STYLE:
-                wall_source_file_d = pygame.image.load(Constants.DAWNLIKE_IMAGE_RESOURCE_FOLDER + 'Objects/Wall.png').convert_alpha()
-                floor_source_file_d = pygame.image.load(Constants.DAWNLIKE_IMAGE_RESOURCE_FOLDER + 'Objects/Floor.png').convert_alpha()
-                door_closed_source_file = pygame.image.load(Constants.DAWNLIKE_IMAGE_RESOURCE_FOLDER + 'Objects/Door0.png').convert_alpha()
-
-                dirt_image = build_floor_tile_dawnlike(floor_source_file_d, 0, 288, Constants.TILE_SIZE)
-                floor_image = build_floor_tile_dawnlike(floor_source_file_d, 112, 288, Constants.TILE_SIZE)
-                grass_image = build_floor_tile_dawnlike(floor_source_file_d, 112, 96, Constants.TILE_SIZE)
-                water_image = build_floor_tile_dawnlike(floor_source_file_d, 224, 288, Constants.TILE_SIZE)
-                rock_image = build_floor_tile_dawnlike(floor_source_file_d, 224, 96, Constants.TILE_SIZE)
-                path_image = build_floor_tile_dawnlike(floor_source_file_d, 0, 96, Constants.TILE_SIZE)
-
-                wall_image = build_wall_tile_dawnlike(wall_source_file_d, 112, 48, Constants.TILE_SIZE)
-
-                for x in range(self.max_x):
-                    for y in range(self.max_y):
-                        destination_pos = (x * Constants.TILE_SIZE[0], y * Constants.TILE_SIZE[1])
-                        if self.map[(x, y)].floor_type == Tile.GRASS:
-                            self.surface_memory.blit(grass_image[self.compute_tile_weight(x, y, Tile.GRASS)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.WATER:
-                            self.surface_memory.blit(water_image[self.compute_tile_weight(x, y, Tile.WATER)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.ROCK:
-                            self.surface_memory.blit(rock_image[self.compute_tile_weight(x, y, Tile.ROCK)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.WALL:
-                            self.surface_memory.blit(wall_image[self.compute_tile_weight(x, y, Tile.WALL)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.PATH:
-                            self.surface_memory.blit(path_image[self.compute_tile_weight(x, y, Tile.PATH)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.DIRT:
-                            self.surface_memory.blit(dirt_image[self.compute_tile_weight(x, y, Tile.DIRT)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.FLOOR:
-                            self.surface_memory.blit(floor_image[self.compute_tile_weight(x, y, Tile.FLOOR)],
-                                                     destination_pos)
-
-            else:
-                source_file_o = pygame.image.load(Constants.ORYX_IMAGE_RESOURCE_FOLDER + 'oryx_16bit_fantasy_world_trans.png').convert_alpha()
-                water_image = rock_image = dirt_image = path_image = floor_image = grass_image = build_floor_tile_oryx(source_file_o, 696, 384, Constants.TILE_SIZE)
-                wall_image = build_wall_tile_oryx(source_file_o, 24, 336, Constants.TILE_SIZE)
-
-                for x in range(self.max_x):
-                    for y in range(self.max_y):
-                        destination_pos = (x * Constants.TILE_SIZE[0], y * Constants.TILE_SIZE[1])
-                        if self.map[(x, y)].floor_type == Tile.GRASS:
-                            self.surface_memory.blit(grass_image[self.compute_tile_weight(x, y, Tile.GRASS)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.WATER:
-                            self.surface_memory.blit(water_image[self.compute_tile_weight(x, y, Tile.WATER)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.ROCK:
-                            self.surface_memory.blit(rock_image[self.compute_tile_weight(x, y, Tile.ROCK)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.WALL:
-                            self.surface_memory.blit(wall_image[self.compute_tile_weight(x, y, Tile.WALL)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.PATH:
-                            self.surface_memory.blit(path_image[self.compute_tile_weight(x, y, Tile.PATH)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.DIRT:
-                            self.surface_memory.blit(dirt_image[self.compute_tile_weight(x, y, Tile.DIRT)],
-                                                     destination_pos)
-                        elif self.map[(x, y)].floor_type == Tile.FLOOR:
-                            self.surface_memory.blit(floor_image[self.compute_tile_weight(x, y, Tile.FLOOR)],
-                                                     destination_pos)
+            # {floor code * 16 + weight: tile}, None for the floor types without a tile set (unknown)
+            lookup_table = [None] * (len(Tile.FLOOR_TYPES) * 16)
+            for floor_type, tiles in self.tile_sets(style).items():
+                lookup_table[Tile.FLOOR_CODES[floor_type] * 16:Tile.FLOOR_CODES[floor_type] * 16 + 16] = tiles
+            indexes = (self.floor_layer.astype(numpy.intp) * 16 + self.tile_weights()).ravel().tolist()
+            (width, height) = Constants.TILE_SIZE
+            positions = [(x * width, y * height) for x in range(self.max_x) for y in range(self.max_y)]
+            self.surface_memory.blits([(lookup_table[index], position) for (index, position) in zip(indexes, positions)
+                                       if lookup_table[index] is not None], doreturn=False)
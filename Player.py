@@ -33,7 +33,7 @@ class Fighter(object):
             if not ignore_message:
                 Util.Event("Tried to move a non movable Fighter".format(self))
             return False
-        if not ignore_tile_blocking and self.town.tile_map.map[new_tile_position].blocking:
+        if not ignore_tile_blocking and self.town.tile_map.is_blocking(new_tile_position):
             if not ignore_message:
                 Util.Event("Illegal move to {}".format(new_tile_position))
             return False
@@ -90,8 +90,33 @@ class Player(Fighter):
         self.mercenaries = [m1, m2, m3]
 
 
-    def travel_to(self, other_town):
+    def travel_to(self, other_town, days=0):
+        """
+        Move the player to another town. The town left is frozen, the time spent on the road is fast forwarded
+        (only the daily update of the other towns runs), and the destination is caught up with the time it spent
+        off screen.
+        The destination is materialized if needed (see Places.Town.materialize).
+        :param other_town: the destination
+        :param days: the travel duration (see Places.Path)
+        """
+        if GameData.world_simulation:
+            GameData.world_simulation.leave_town(self.town)
+        self.town.tile_map.map[self.position_on_tile].unregister_thing(self)
+        if days:
+            GameData.time_ticker.advance(days * Constants.TICKS_PER_DAY)
         self.town = other_town
+        GameData.current_town = other_town
+        if GameData.town_prefetcher:
+            GameData.town_prefetcher.collect(other_town)
+        other_town.materialize()
+        self.displayable_object.position_on_tile = other_town.tile_map.default_start_player_position
+        other_town.tile_map.map[self.position_on_tile].register_thing(self)
+        if GameData.world_simulation:
+            GameData.world_simulation.enter_town(other_town)
+        if GameData.town_prefetcher:
+            GameData.town_prefetcher.prefetch_around(other_town)
+        if GameData.autosave:
+            GameData.autosave.save()
 
     def buy(self, money):
         if money > self.wealth:
@@ -195,20 +220,29 @@ class NonPlayableCharacter(Fighter):
         dy = GameData.player.position_on_tile[1] - self.position_on_tile[1]
         distance = math.sqrt(dx ** 2 + dy ** 2)
         if distance < 2 and isinstance(self.action_when_other_npc, list) and len(self.action_when_player) > 0:
-            random.choice(self.action_when_player)(source=self)
+            self.perform(random.choice(self.action_when_player))
         elif distance < 2 and self.action_when_player:
-            self.action_when_player(source=self)
+            self.perform(self.action_when_player)
         elif len(self.default_action_list) > 0:
-            random.choice(self.default_action_list)(source=self)
+            self.perform(random.choice(self.default_action_list))
         else:
-            self.wander(source=self)
+            self.perform(self.wander)
         # start by scheduling next action
         GameData.time_ticker.schedule_turn(self.speed, self)
 
+    def perform(self, action):
+        """
+        Run one of the actions, timing it if the turns are profiled
+        """
+        if GameData.time_ticker.profiler:
+            return GameData.time_ticker.profiler.time_call(action, source=self)
+        return action(source=self)
+
     def speak_garbage(self, **kwargs):
         Util.Event("Hello player!")
         self.action_when_player = self.do_nothing
         self.default_action_list.remove(self.get_close_to_player)
+        GameData.game_dict.mark_dirty(self)
         return [Constants.PREVENT_MOVEMENT]
 
     def wander(self, **kwargs):
@@ -220,6 +254,13 @@ class NonPlayableCharacter(Fighter):
         pass
 
     def get_close_to_player(self, **kwargs):
+        # Follow the distance map to the player, shared by all the NPCs of the town
+        step = self.town.tile_map.distances_to_player().next_step(self.position_on_tile)
+        if step:
+            self.move_to(step, ignore_message=True)
+            return
+
+        # Cannot get closer that way (the player is out of reach or the way is blocked): head straight to the player
         #vector from this object to the target, and distance
         dx = GameData.player.position_on_tile[0] - self.position_on_tile[0]
         dy = GameData.player.position_on_tile[1] - self.position_on_tile[1]
@@ -0,0 +1,759 @@
+__author__ = 'Tangil'
+"""
+Binary snapshot of the game (see Game.save_game / Game.load_game).
+The file is made of:
+- a header: MAGIC, format version
+- the string table: every string of the save (ids, names, sprite files...) is stored once, and referenced by its
+  index everywhere else
+- the body: time, seeds, towns (with their compressed layers if they were visited and changed since they were
+  generated), things, player and schedule, written with struct in a fixed order (little endian)
+No pygame object is stored: the sprites are stored as their definition (see Displayable.make_sprite) and the
+surfaces are rendered again. On load, only the current town is rendered and gets its sprites; the other towns keep
+their layers compressed and build their sprites on their next visit (see Places.Town.materialize).
+
+The autosave (see AutoSave) writes a full save, then appends the changes to a journal next to it (file name +
+JOURNAL_SUFFIX). The journal is a sequence of blocks (length, data), each one being a save of the changes only,
+with the same header and string table layout. The full save and the blocks carry a generation number: on load, only
+the blocks of the generation of the full save are applied, in order.
+"""
+
+import functools
+import os
+import queue
+import struct
+import threading
+
+import numpy
+
+import Constants
+import GameData
+import Places
+import Player
+import Simulation
+import Util
+from Displayable import DisplayableObject, make_sprite
+from GameObject import GameObject, Door
+
+MAGIC = b"MRSAVE"
+VERSION = 5  # 2: generation number, journal of changes. 3: seeds, generated maps. 4: ground algorithm. 5: room placement
+JOURNAL_SUFFIX = ".journal"
+
+NO_STRING = 0xFFFFFFFF  # The string index of None
+NO_TOWN = -1  # The town index of the things that are in no town
+
+# Kinds of the town maps records
+NO_MAP = 0
+STORED_MAP = 1  # The layers and rooms are stored
+GENERATED_MAP = 2  # The map is generated again out of the town seed, only its walkable layer is stored
+
+# Kinds of the things records
+NPC_RECORD = 1
+GAME_OBJECT_RECORD = 2
+DOOR_RECORD = 3
+
+NPC_CLASSES = {a_class.__name__: a_class for a_class in (Player.NonPlayableCharacter, Player.TraderNPC)}
+INVENTORY_CLASSES = {a_class.__name__: a_class for a_class in (Player.InventoryObject, Player.UnlimitedInventory)}
+
+
+class SaveFormatError(Exception):
+    def __init__(self, message=None):
+        if not message:
+            message = "This file is not a valid save"
+        super().__init__(message)
+        self.message = message
+
+
+class SaveWriter(object):
+    """
+    Builds the body of the save, interning the strings on the fly
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.strings = {}  # {string: index}
+
+    def pack(self, fmt, *values):
+        self.chunks.append(struct.pack("<" + fmt, *values))
+
+    def string(self, a_string):
+        if a_string is None:
+            self.pack("I", NO_STRING)
+            return
+        index = self.strings.get(a_string)
+        if index is None:
+            index = self.strings[a_string] = len(self.strings)
+        self.pack("I", index)
+
+    def blob(self, data):
+        self.pack("I", len(data))
+        self.chunks.append(data)
+
+    def deferred_blob(self, make_data):
+        """
+        A blob whose data is only made by to_bytes, possibly in another thread
+        :param make_data: a function returning the data, that must not depend on the game objects
+        """
+        self.chunks.append(make_data)
+
+    def sprite(self, definition):
+        """
+        :param definition: a sprite definition (see Displayable.make_sprite), or None
+        """
+        if not definition:
+            self.pack("B", 0)
+            return
+        (class_name, style, folder, file, coordinates) = definition
+        self.pack("B", 1)
+        self.string(class_name)
+        self.string(style)
+        self.string(folder)
+        self.string(file)
+        self.pack("hh", *coordinates)
+
+    def to_bytes(self):
+        header = [MAGIC, struct.pack("<HI", VERSION, len(self.strings))]
+        for a_string in self.strings:  # dicts keep the insertion order: the index order
+            encoded = a_string.encode("utf-8")
+            header.append(struct.pack("<H", len(encoded)))
+            header.append(encoded)
+        body = []
+        for chunk in self.chunks:
+            if callable(chunk):
+                chunk = chunk()
+                body.append(struct.pack("<I", len(chunk)))
+            body.append(chunk)
+        return b"".join(header + body)
+
+
+class SaveReader(object):
+    """
+    Reads back what a SaveWriter wrote
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+        self._structs = {}  # {fmt: struct.Struct}
+        if data[:len(MAGIC)] != MAGIC:
+            raise SaveFormatError()
+        self.offset = len(MAGIC)
+        (version, number_strings) = self.unpack("HI")
+        if version != VERSION:
+            raise SaveFormatError("Save format version {} not supported (expected {})".format(version, VERSION))
+        self.strings = []
+        for i in range(number_strings):
+            (length,) = self.unpack("H")
+            self.strings.append(bytes(self.data[self.offset:self.offset + length]).decode("utf-8"))
+            self.offset += length
+
+    def unpack(self, fmt):
+        a_struct = self._structs.get(fmt)
+        if not a_struct:
+            a_struct = self._structs[fmt] = struct.Struct("<" + fmt)
+        values = a_struct.unpack_from(self.data, self.offset)
+        self.offset += a_struct.size
+        return values
+
+    def string(self):
+        (index,) = self.unpack("I")
+        if index == NO_STRING:
+            return None
+        return self.strings[index]
+
+    def blob(self):
+        (length,) = self.unpack("I")
+        data = bytes(self.data[self.offset:self.offset + length])
+        self.offset += length
+        return data
+
+    def sprite(self):
+        (has_sprite,) = self.unpack("B")
+        if not has_sprite:
+            return None
+        return (self.string(), self.string(), self.string(), self.string(), self.unpack("hh"))
+
+
+# Save
+
+
+def save(file_name):
+    """
+    Write the GameData objects in a file
+    :param file_name: where to store the data
+    :return: nothing
+    """
+    write_file(file_name, snapshot().to_bytes())
+    return
+
+
+def write_file(file_name, data):
+    """
+    Replace the file content in one go: a failure while writing leaves the former file untouched
+    """
+    with open(file_name + ".tmp", "wb") as save_file:
+        save_file.write(data)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def snapshot(generation=0):
+    """
+    :param generation: the generation of the journal that goes with this save (see AutoSave), 0 if none
+    :return: the SaveWriter holding the whole game
+    """
+    writer = SaveWriter()
+    towns = GameData.town_graph.towns
+    town_index = {town: index for (index, town) in enumerate(towns)}
+
+    writer.pack("qI", GameData.time_ticker.ticks, generation)
+    writer.pack("QQ", GameData.world_seed or 0, GameData.world_simulation.seed)
+
+    writer.pack("H", len(towns))
+    for town in towns:
+        write_town(writer, town)
+        writer.pack("i", GameData.world_simulation.last_update_day.get(town, 0))
+    for town in towns:
+        writer.pack("B", len(town.available_paths))
+        for path in town.available_paths:
+            writer.pack("HH", town_index[path.destination_town], path.days)
+    writer.pack("H", town_index[GameData.current_town])
+
+    things = [a_thing for a_thing in GameData.game_dict.values() if is_saved_thing(a_thing)]
+    writer.pack("I", len(things))
+    for a_thing in things:
+        write_thing(writer, a_thing, town_index)
+
+    write_player(writer, GameData.player)
+    write_pending_actions(writer)
+    return writer
+
+
+def snapshot_changes(generation):
+    """
+    Take the changes since the last call (see GameData.EntityRegistry.take_changes, Places.Town.dirty and
+    Places.TileMap.layers_dirty)
+    :param generation: the generation of the journal
+    :return: the SaveWriter holding the changes
+    """
+    writer = SaveWriter()
+    towns = GameData.town_graph.towns
+    town_index = {town: index for (index, town) in enumerate(towns)}
+    (changed_ids, removed_ids) = GameData.game_dict.take_changes()
+
+    writer.pack("Iq", generation, GameData.time_ticker.ticks)
+    writer.pack("H", town_index[GameData.current_town])
+    writer.pack("H", len(towns))
+    for town in towns:
+        writer.pack("i", GameData.world_simulation.last_update_day.get(town, 0))
+
+    changed_towns = [town for town in towns if town.dirty or (town.tile_map and town.tile_map.layers_dirty)]
+    writer.pack("H", len(changed_towns))
+    for town in changed_towns:
+        writer.pack("H", town_index[town])
+        write_town(writer, town, with_map=bool(town.tile_map and town.tile_map.layers_dirty))
+    clear_town_changes()
+
+    writer.pack("I", len(removed_ids))
+    for an_id in removed_ids:
+        writer.string(an_id)
+    things = [GameData.game_dict[an_id] for an_id in changed_ids if is_saved_thing(GameData.game_dict[an_id])]
+    writer.pack("I", len(things))
+    for a_thing in things:
+        write_thing(writer, a_thing, town_index)
+
+    write_player(writer, GameData.player)
+    write_pending_actions(writer)
+    return writer
+
+
+def clear_town_changes():
+    for town in GameData.town_graph.towns:
+        town.dirty = False
+        if town.tile_map:
+            town.tile_map.layers_dirty = False
+
+
+def is_saved_thing(a_thing):
+    return isinstance(a_thing, (Player.NonPlayableCharacter, GameObject))
+
+
+def write_pending_actions(writer):
+    pending_actions = GameData.time_ticker.pending_actions()
+    writer.pack("I", len(pending_actions))
+    for (tick, object_id) in pending_actions:
+        writer.pack("q", tick)
+        writer.string(object_id)
+
+
+def write_town(writer, town, with_map=True):
+    """
+    :param with_map: False to leave the map out (it did not change)
+    """
+    writer.string(town.name)
+    writer.pack("HHQ", town.size[0], town.size[1], town.seed)
+
+    writer.pack("B", len(town.buildings))
+    for building in town.buildings:
+        writer.string(building.name)
+        if building.name == Places.Building.TRADING_POST:
+            writer.pack("iH", building.gold, len(building.goods_available))
+            for good in building.goods_available:
+                writer.string(good.name)
+                writer.string(good.object_type)
+                writer.pack("HHi", good.weight, good.volume, good.regular_value)
+
+    tile_map = town.tile_map if with_map else None
+    if not tile_map:
+        writer.pack("B", NO_MAP)
+        return
+    if tile_map.generated:
+        writer.pack("B", GENERATED_MAP)
+        writer.string(tile_map.ground_algorithm)
+        writer.pack("hh", *tile_map.default_start_player_position)
+        writer.blob(numpy.packbits(tile_map.walkable_layer()).tobytes())
+        return
+    writer.pack("B", STORED_MAP)
+    building_index = {building: index for (index, building) in enumerate(town.buildings)}
+    writer.pack("hh", *tile_map.default_start_player_position)
+    if tile_map.layers_loaded:
+        # The compression is left to to_bytes, on copies of the layers
+        writer.deferred_blob(functools.partial(Places.TileMap.pack_layers, tile_map.floor_layer.copy(),
+                                               tile_map.room_layer.copy()))
+    else:
+        writer.blob(tile_map.packed_layers())
+    writer.pack("B", len(tile_map.room_list))
+    for building in tile_map.room_list:
+        writer.pack("B", building_index[building])
+    writer.pack("B", len(tile_map.rooms))
+    for room in tile_map.rooms:
+        writer.pack("B", building_index[room.building])
+        writer.blob(numpy.array(room.places, dtype=numpy.int16).tobytes())
+        writer.pack("B", len(room.doors))
+        for (place, orientation) in room.doors:
+            writer.pack("hh", *place)
+            writer.string(orientation)
+
+
+def write_thing(writer, a_thing, town_index):
+    town = town_index.get(a_thing.town, NO_TOWN)
+    displayable_object = a_thing.displayable_object
+    if isinstance(a_thing, Player.NonPlayableCharacter):
+        writer.pack("B", NPC_RECORD)
+        writer.string(a_thing.__class__.__name__)
+        writer.string(a_thing.id)
+        writer.string(a_thing.name)
+        writer.pack("hhhh", town, displayable_object.position_on_tile[0], displayable_object.position_on_tile[1],
+                    a_thing.speed)
+        writer.sprite(displayable_object.sprite_definition)
+        writer.pack("b", getattr(a_thing, "friendliness_setting", 0))
+        write_actions(writer, a_thing.default_action_list)
+        write_actions(writer, a_thing.action_when_player)
+        write_actions(writer, a_thing.action_when_other_npc)
+    elif isinstance(a_thing, Door):
+        writer.pack("B", DOOR_RECORD)
+        writer.string(a_thing.id)
+        writer.pack("hhh", town, *displayable_object.position_on_tile)
+        writer.string(a_thing.orientation)
+        writer.string(a_thing.style)
+        writer.pack("BB", bool(a_thing.closed), bool(a_thing.locked))
+    else:
+        writer.pack("B", GAME_OBJECT_RECORD)
+        writer.string(a_thing.id)
+        writer.string(a_thing.name)
+        writer.string(a_thing.object_type)
+        writer.pack("hHHi", town, a_thing.weight, a_thing.volume, a_thing.regular_value)
+        writer.pack("B", displayable_object is not None)
+        if displayable_object:
+            writer.pack("BBhh", displayable_object.movable, displayable_object.blocking,
+                        *displayable_object.position_on_tile)
+            writer.sprite(displayable_object.sprite_definition)
+
+
+def write_actions(writer, actions):
+    """
+    The NPC actions are bound methods: only their names are stored. A single action is stored as a list of one.
+    """
+    if not actions:
+        actions = []
+    elif not isinstance(actions, list):
+        actions = [actions]
+    writer.pack("B", len(actions))
+    for action in actions:
+        writer.string(action.__name__)
+
+
+def write_player(writer, player):
+    writer.string(player.id)
+    writer.pack("hhi", player.position_on_tile[0], player.position_on_tile[1], player.wealth)
+    writer.sprite(player.displayable_object.sprite_definition)
+    writer.pack("B", len(player.inventory_list))
+    for container in player.inventory_list:
+        writer.string(container.__class__.__name__)
+        writer.string(container.name)
+        writer.pack("hhH", container.slots, container.container_weight, len(container.contains))
+        for (game_object, quantity) in container.contains.values():
+            writer.string(game_object.id)
+            writer.pack("H", quantity)
+    writer.pack("B", len(player.mercenaries))
+    for mercenary in player.mercenaries:
+        writer.string(mercenary.name)
+        writer.string(mercenary.category)
+        writer.pack("hhhh", mercenary.hp, mercenary.mp, mercenary.attack, mercenary.defense)
+
+
+# Load
+
+
+def load(file_name, simulation_workers=0, town_memory_budget=None):
+    """
+    Replace the GameData objects by the ones stored in a file, and apply its journal if there is one. Only the
+    current town is rendered.
+    :param file_name: where to load the data
+    :param simulation_workers: see Simulation.WorldSimulation
+    :param town_memory_budget: see Places.TownCache, the budget of the current cache if not given
+    :return: nothing
+    """
+    with open(file_name, "rb") as save_file:
+        reader = SaveReader(save_file.read())
+
+    if GameData.world_simulation:
+        GameData.world_simulation.shutdown()
+    if town_memory_budget is None:
+        town_memory_budget = GameData.town_cache.budget if GameData.town_cache else Places.TownCache().budget
+    GameData.game_dict = GameData.EntityRegistry()
+    GameData.time_ticker = Util.Ticker()
+    GameData.town_cache = Places.TownCache(budget=town_memory_budget)
+
+    (GameData.time_ticker.ticks, generation) = reader.unpack("qI")
+    (GameData.world_seed, seed) = reader.unpack("QQ")
+    GameData.world_simulation = Simulation.WorldSimulation(seed=seed, workers=simulation_workers)
+
+    (number_towns,) = reader.unpack("H")
+    towns = []
+    for i in range(number_towns):
+        town = read_town(reader)
+        (GameData.world_simulation.last_update_day[town],) = reader.unpack("i")
+        towns.append(town)
+    for town in towns:
+        (number_paths,) = reader.unpack("B")
+        for i in range(number_paths):
+            (destination, days) = reader.unpack("HH")
+            town.add_path(Places.Path(town, towns[destination], days))
+    GameData.town_graph = Places.TownGraph.restore(towns)
+    (current_town,) = reader.unpack("H")
+    GameData.current_town = towns[current_town]
+
+    (number_things,) = reader.unpack("I")
+    for i in range(number_things):
+        add_thing(read_thing(reader, towns))
+
+    GameData.player = read_player(reader, GameData.current_town)
+    GameData.game_dict.register(GameData.player)
+    GameData.game_dict.register(GameData.world_simulation)
+    pending_actions = read_pending_actions(reader)
+
+    if generation and os.path.exists(file_name + JOURNAL_SUFFIX):
+        for block in read_journal(file_name + JOURNAL_SUFFIX):
+            block_reader = SaveReader(block)
+            if block_reader.unpack("I")[0] == generation:
+                pending_actions = read_changes(block_reader, towns)
+
+    for (tick, object_id) in pending_actions:
+        GameData.time_ticker.schedule_turn(tick - GameData.time_ticker.ticks, object_id)
+
+    GameData.current_town.materialize()
+    GameData.current_town.tile_map.map[GameData.player.position_on_tile].register_thing(GameData.player)
+    if GameData.town_prefetcher:
+        GameData.town_prefetcher.cancel()
+        GameData.town_prefetcher.prefetch_around(GameData.current_town)
+    GameData.game_dict.take_changes()
+    clear_town_changes()
+    return
+
+
+def read_journal(file_name):
+    """
+    :return: the list of the blocks of a journal. An incomplete last block (interrupted write) is dropped.
+    """
+    with open(file_name, "rb") as journal:
+        data = journal.read()
+    blocks = []
+    offset = 0
+    while offset + 4 <= len(data):
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        if offset + length > len(data):
+            break
+        blocks.append(data[offset:offset + length])
+        offset += length
+    return blocks
+
+
+def read_changes(reader, towns):
+    """
+    Apply a block of the journal (after its generation)
+    :return: the pending actions of the block
+    """
+    (GameData.time_ticker.ticks,) = reader.unpack("q")
+    (current_town,) = reader.unpack("H")
+    GameData.current_town = towns[current_town]
+    (number_towns,) = reader.unpack("H")
+    for town in towns[:number_towns]:
+        (GameData.world_simulation.last_update_day[town],) = reader.unpack("i")
+
+    (number_towns,) = reader.unpack("H")
+    for i in range(number_towns):
+        (index,) = reader.unpack("H")
+        read_town(reader, towns[index])
+
+    (number_removed,) = reader.unpack("I")
+    for i in range(number_removed):
+        remove_thing(reader.string())
+    (number_things,) = reader.unpack("I")
+    for i in range(number_things):
+        a_thing = read_thing(reader, towns)
+        remove_thing(a_thing.id)
+        add_thing(a_thing)
+
+    GameData.game_dict.unregister(GameData.player)
+    GameData.player = read_player(reader, GameData.current_town)
+    GameData.game_dict.register(GameData.player)
+    return read_pending_actions(reader)
+
+
+def add_thing(a_thing):
+    GameData.game_dict.register(a_thing)
+    if a_thing.town:
+        a_thing.town.register_thing(a_thing)
+
+
+def remove_thing(an_id):
+    a_thing = GameData.game_dict.get(an_id)
+    if a_thing is None:
+        return
+    if a_thing.town:
+        a_thing.town.unregister_thing(a_thing)
+    GameData.game_dict.unregister(an_id)
+
+
+def read_pending_actions(reader):
+    (number_actions,) = reader.unpack("I")
+    return [(reader.unpack("q")[0], reader.string()) for i in range(number_actions)]
+
+
+def read_town(reader, town=None):
+    """
+    :param town: the town to update (a block of the journal), None to create it
+    :return: the town
+    """
+    (name, (size_x, size_y, seed)) = (reader.string(), reader.unpack("HHQ"))
+    if not town:
+        town = Places.Town.restore(name, (size_x, size_y), seed)
+
+    (number_buildings,) = reader.unpack("B")
+    for i in range(number_buildings):
+        name = reader.string()
+        (gold, goods) = (None, None)
+        if name == Places.Building.TRADING_POST:
+            (gold, number_goods) = reader.unpack("iH")
+            goods = []
+            for j in range(number_goods):
+                (good_name, object_type) = (reader.string(), reader.string())
+                (weight, volume, value) = reader.unpack("HHi")
+                goods.append(GameObject(good_name, object_type, weight=weight, volume=volume, regular_value=value,
+                                        displayable_object=None))
+        if i < len(town.buildings):
+            # Keep the building objects: the rooms refer to them
+            if goods is not None:
+                town.buildings[i].gold = gold
+                town.buildings[i].goods_available = goods
+        elif name == Places.Building.TRADING_POST:
+            town.buildings.append(Places.TradingPost(town, gold=gold, goods_available=goods))
+        else:
+            town.buildings.append(Places.Building(town))
+            town.buildings[i].name = name
+
+    (map_kind,) = reader.unpack("B")
+    if map_kind == NO_MAP:
+        return town
+    ground_algorithm = reader.string() if map_kind == GENERATED_MAP else None
+    tile_map = Places.TownTileMap(town, town.size, ground_algorithm=ground_algorithm)
+    tile_map.default_start_player_position = reader.unpack("hh")
+    if map_kind == GENERATED_MAP:
+        tile_map.load_walkable_bits(numpy.frombuffer(reader.blob(), dtype=numpy.uint8).copy())
+        set_town_map(town, tile_map)
+        return town
+    tile_map.load_packed_layers(reader.blob())
+    (number_rooms,) = reader.unpack("B")
+    tile_map.room_list = [town.buildings[reader.unpack("B")[0]] for i in range(number_rooms)]
+    (number_rooms,) = reader.unpack("B")
+    for i in range(number_rooms):
+        (building,) = reader.unpack("B")
+        places = [tuple(place) for place in numpy.frombuffer(reader.blob(), dtype=numpy.int16).reshape(-1, 2).tolist()]
+        (number_doors,) = reader.unpack("B")
+        doors = [(reader.unpack("hh"), reader.string()) for j in range(number_doors)]
+        tile_map.rooms.append(Places.Room.restore(town, town.buildings[building], places, doors))
+    set_town_map(town, tile_map)
+    return town
+
+
+def set_town_map(town, tile_map):
+    town.tile_map = tile_map
+    # The things already in the town move to the new map
+    for an_id in GameData.game_dict.in_town(town):
+        displayable_object = getattr(GameData.game_dict[an_id], "displayable_object", None)
+        if displayable_object and displayable_object.position_on_tile:
+            tile_map.register_thing_at(displayable_object.position_on_tile, an_id)
+
+
+def read_thing(reader, towns):
+    """
+    :return: the NPC, door or object, with its sprite definition but no sprite (see Places.Town.materialize)
+    """
+    (kind,) = reader.unpack("B")
+    if kind == NPC_RECORD:
+        (class_name, an_id, name) = (reader.string(), reader.string(), reader.string())
+        (town, x, y, speed) = reader.unpack("hhhh")
+        sprite_definition = reader.sprite()
+        (friendliness,) = reader.unpack("b")
+        npc_class = NPC_CLASSES[class_name]
+        if npc_class is Player.TraderNPC:
+            a_thing = Player.TraderNPC(None, position_on_tile=(x, y), speed=speed)
+            a_thing.friendliness_setting = friendliness
+        else:
+            a_thing = npc_class(None, name=name, speed=speed, position_on_tile=(x, y))
+        a_thing.name = name
+        a_thing.displayable_object.sprite_definition = sprite_definition
+        a_thing.default_action_list = read_actions(reader, a_thing)
+        action_when_player = read_actions(reader, a_thing)
+        if npc_class is Player.TraderNPC:
+            a_thing.action_when_player = action_when_player
+        else:
+            a_thing.action_when_player = action_when_player[0] if action_when_player else None
+        action_when_other_npc = read_actions(reader, a_thing)
+        a_thing.action_when_other_npc = action_when_other_npc[0] if action_when_other_npc else None
+    elif kind == DOOR_RECORD:
+        an_id = reader.string()
+        (town, x, y) = reader.unpack("hhh")
+        (orientation, style) = (reader.string(), reader.string())
+        (closed, locked) = reader.unpack("BB")
+        a_thing = Door(None, orientation, (x, y), closed=bool(closed), locked=bool(locked), style=style,
+                       lazy_graphics=True)
+    elif kind == GAME_OBJECT_RECORD:
+        (an_id, name, object_type) = (reader.string(), reader.string(), reader.string())
+        (town, weight, volume, value) = reader.unpack("hHHi")
+        (has_displayable_object,) = reader.unpack("B")
+        displayable_object = None
+        if has_displayable_object:
+            (movable, blocking, x, y) = reader.unpack("BBhh")
+            displayable_object = DisplayableObject(movable=bool(movable), blocking=bool(blocking),
+                                                   position_on_tile=(x, y), sprite_definition=reader.sprite())
+        a_thing = GameObject(name, object_type, weight=weight, volume=volume, regular_value=value,
+                             displayable_object=displayable_object)
+    else:
+        raise SaveFormatError("Unknown record kind {}".format(kind))
+    a_thing.id = an_id
+    a_thing.town = towns[town] if town != NO_TOWN else None
+    return a_thing
+
+
+def read_actions(reader, npc):
+    (number_actions,) = reader.unpack("B")
+    return [getattr(npc, reader.string()) for i in range(number_actions)]
+
+
+def read_player(reader, town):
+    an_id = reader.string()
+    (x, y, wealth) = reader.unpack("hhi")
+    player = Player.Player(town, position_on_tile=(x, y), graphical_representation=make_sprite(reader.sprite()))
+    player.id = an_id
+    player.wealth = wealth
+
+    (number_containers,) = reader.unpack("B")
+    player.inventory_list = []
+    for i in range(number_containers):
+        (class_name, name) = (reader.string(), reader.string())
+        (slots, container_weight, number_contents) = reader.unpack("hhH")
+        container = INVENTORY_CLASSES[class_name](name, slots=slots, container_weight=container_weight)
+        for j in range(number_contents):
+            game_object = GameData.game_dict.get(reader.string())
+            (quantity,) = reader.unpack("H")
+            if game_object:
+                container.contains[str(game_object)] = (game_object, quantity)
+        player.inventory_list.append(container)
+
+    (number_mercenaries,) = reader.unpack("B")
+    player.mercenaries = []
+    for i in range(number_mercenaries):
+        mercenary = Player.Mercenary(reader.string())
+        mercenary.category = reader.string()
+        (mercenary.hp, mercenary.mp, mercenary.attack, mercenary.defense) = reader.unpack("hhhh")
+        player.mercenaries.append(mercenary)
+    return player
+
+
+class AutoSave(object):
+    """
+    Saves the game without stalling the main loop. The first save is a full one; the next ones only append the
+    changes to the journal, until compaction_interval of them were written: the next save is a full one again,
+    starting a new generation (see the module documentation).
+    The game is captured in the calling thread (the records are encoded, the layers copied); the compression of the
+    layers and the writes are left to a writer thread.
+    """
+
+    FULL = "full"
+    CHANGES = "changes"
+
+    def __init__(self, file_name=Constants.AUTOSAVE_FILE, compaction_interval=Constants.AUTOSAVE_COMPACTION_INTERVAL):
+        self.file_name = file_name
+        self.journal_name = file_name + JOURNAL_SUFFIX
+        self.compaction_interval = compaction_interval
+        self.generation = None  # None until the first full save
+        self.changes_saved = 0  # Number of blocks in the journal
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._write_jobs, name="AutoSave", daemon=True)
+        self._thread.start()
+
+    def save(self):
+        if self.generation is None or self.changes_saved >= self.compaction_interval:
+            self.generation = int.from_bytes(os.urandom(4), "little") or 1
+            GameData.game_dict.take_changes()
+            clear_town_changes()
+            self._jobs.put((AutoSave.FULL, snapshot(self.generation)))
+            self.changes_saved = 0
+        else:
+            self._jobs.put((AutoSave.CHANGES, snapshot_changes(self.generation)))
+            self.changes_saved += 1
+        return
+
+    def flush(self):
+        """
+        Wait for the saves requested to be written
+        """
+        self._jobs.join()
+
+    def stop(self):
+        """
+        Write the saves requested and stop the writer thread
+        """
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _write_jobs(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                (kind, writer) = job
+                data = writer.to_bytes()
+                if kind == AutoSave.FULL:
+                    write_file(self.file_name, data)
+                    with open(self.journal_name, "wb"):
+                        pass
+                else:
+                    with open(self.journal_name, "ab") as journal:
+                        journal.write(struct.pack("<I", len(data)) + data)
+            except OSError as e:
+                print("Warning: autosave failed: {}".format(e))
+            finally:
+                self._jobs.task_done()
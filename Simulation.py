@@ -0,0 +1,255 @@
+__author__ = 'Tangil'
+"""
+Level of detail simulation of the world.
+The current town runs at full fidelity: each of its actors is scheduled in the Ticker and runs its take_action.
+The other towns are not scheduled at all: they are advanced once per game day by a cheap summary model, working
+on a compact state of the town (NPC positions, trading post gold and goods).
+When the player arrives in a town, the town is caught up to the current day and its actors are handed back to the
+Ticker; when the player leaves it, its actors are removed from the Ticker.
+The daily update of the towns may be run on a process pool: each day of each town uses its own random generator,
+seeded from the world seed, so the result is the same whatever the number of workers.
+"""
+
+import collections
+import concurrent.futures
+import random
+
+import Constants
+import GameData
+import Util
+from GameObject import GameObject
+
+# Summary model settings
+WANDER_STEPS_PER_DAY = 10  # Max number of tiles an NPC moves in a day when it is not simulated tick per tick
+GOLD_DRIFT = 0.1  # The trading post gold varies by +/- 10% a day
+MAX_GOODS = 5  # A trading post is restocked up to this number of goods
+RESTOCK_CHANCE = 30  # % chance per day to get a new good (if not full)
+SELL_CHANCE = 20  # % chance per day that a good is sold to somebody else
+
+MIN_TOWNS_FOR_POOL = 4  # Below this number of towns to update, the process pool is not worth it
+
+
+class WorldSimulation(object):
+    """
+    Drives the simulation of the towns that are not the current one. It is itself scheduled in the Ticker, once
+    per game day.
+    """
+
+    def __init__(self, seed=None, workers=0):
+        """
+        :param seed: the seed of the off screen simulation. Random if not given.
+        :param workers: number of worker processes for the daily update of the towns. 0 means serial.
+        """
+        self.id = "WorldSimulation"
+        self.name = "World Simulation"
+        self.last_update_day = {}  # {town: last day simulated}. Not present means day 0.
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.workers = workers
+        self._executor = None
+
+    @staticmethod
+    def current_day():
+        return GameData.time_ticker.ticks // Constants.TICKS_PER_DAY
+
+    def start(self):
+        """
+        Store the simulation in the game dictionary and schedule its first run at the beginning of the next day
+        """
+        GameData.game_dict.register(self)
+        GameData.time_ticker.schedule_turn(
+            Constants.TICKS_PER_DAY - GameData.time_ticker.ticks % Constants.TICKS_PER_DAY, self)
+
+    def take_action(self):
+        self.update_off_screen_towns()
+        GameData.time_ticker.schedule_turn(Constants.TICKS_PER_DAY, self)
+
+    def update_off_screen_towns(self):
+        towns = [town for town in GameData.town_graph.towns if town is not GameData.current_town]
+        if self.workers and len(towns) >= MIN_TOWNS_FOR_POOL:
+            self.catch_up_in_pool(towns)
+        else:
+            for town in towns:
+                self.catch_up(town)
+
+    def catch_up(self, town):
+        """
+        Advance the summary model of the town from its last update to the current day
+        """
+        day = self.current_day()
+        last_day = self.last_update_day.get(town, 0)
+        if day > last_day:
+            state = advance_town_state(extract_town_state(town), last_day, day, self.seed)
+            apply_town_state(town, state)
+        self.last_update_day[town] = day
+
+    def catch_up_in_pool(self, towns):
+        """
+        Same as catch_up for several towns, the summary models being run in parallel in the worker processes.
+        The results are merged back in the towns order.
+        """
+        day = self.current_day()
+        if not self._executor:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        futures = []
+        for town in towns:
+            last_day = self.last_update_day.get(town, 0)
+            if day > last_day:
+                futures.append((town, self._executor.submit(advance_town_state, extract_town_state(town),
+                                                             last_day, day, self.seed)))
+            self.last_update_day[town] = day
+        for (town, future) in futures:
+            apply_town_state(town, future.result())
+
+    def shutdown(self):
+        """
+        Stop the worker processes, if any
+        """
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    def enter_town(self, town):
+        """
+        Reconcile the town with the time spent off screen and hand its actors to the Ticker
+        """
+        self.catch_up(town)
+        for an_id in GameData.game_dict.actors(town):
+            GameData.time_ticker.schedule_turn(GameData.game_dict[an_id].speed, GameData.game_dict[an_id])
+
+    def leave_town(self, town):
+        """
+        Remove the actors of the town from the Ticker: the town was simulated tick per tick up to now
+        """
+        for an_id in GameData.game_dict.actors(town):
+            GameData.time_ticker.cancel_future_actions(an_id)
+        self.last_update_day[town] = self.current_day()
+
+
+# Summary model
+# The compact state only holds simple types (no pygame objects, no reference to the game objects) so that it is
+# cheap to build and can be shipped anywhere.
+
+
+def extract_town_state(town):
+    """
+    Build the compact state of a town
+    :param town: the town
+    :return: a dict: name, seed (the town seed: unlike the name, it tells the towns apart), size, walkable layer (one
+    byte per tile, column by column, without the static blocking tiles when the layers are loaded), blocked (the
+    positions of the other blocking things), npcs (id, x, y, speed) and trading posts (gold, list of goods (name,
+    weight, volume, value))
+    """
+    tile_map = town.tile_map
+    if not tile_map:
+        # Not visited yet: no map, no NPC
+        return {"name": town.name, "seed": town.seed, "size": (0, 0), "walkable": b"", "blocked": [], "npcs": [],
+                "trading_posts": extract_trading_posts(town)}
+
+    npcs = []
+    for an_id in GameData.game_dict.actors(town):
+        a_thing = GameData.game_dict[an_id]
+        npcs.append((an_id, a_thing.position_on_tile[0], a_thing.position_on_tile[1], a_thing.speed))
+    # The NPCs are blocking too, but they move: advance_town_state follows them
+    npc_ids = {npc[0] for npc in npcs}
+    blocked = [tuple(position) for (an_id, position) in tile_map.blocking_things() if an_id not in npc_ids]
+    walkable = ~tile_map.static_blocking_layer() if tile_map.layers_loaded else tile_map.walkable_layer()
+
+    return {"name": town.name,
+            "seed": town.seed,
+            "size": (tile_map.max_x, tile_map.max_y),
+            "walkable": walkable.astype("uint8").tobytes(),
+            "blocked": blocked,
+            "npcs": npcs,
+            "trading_posts": extract_trading_posts(town)}
+
+
+def extract_trading_posts(town):
+    trading_posts = []
+    for building in town.buildings:
+        if hasattr(building, "goods_available"):
+            trading_posts.append((building.gold, [(good.name, good.weight, good.volume, good.regular_value)
+                                                  for good in building.goods_available]))
+    return trading_posts
+
+
+def advance_town_state(state, from_day, to_day, seed):
+    """
+    Advance the compact state of a town by whole days. This is a pure function (it may run in another process).
+    :param state: the compact state, as given by extract_town_state
+    :param from_day: the last day the state was up to date
+    :param to_day: the day to reach
+    :param seed: the simulation seed. Each day of each town gets its own random generator out of it.
+    :return: the new state
+    """
+    (max_x, max_y) = state["size"]
+    walkable = state["walkable"]
+    npcs = list(state["npcs"])
+    # The tiles an NPC cannot move to, besides the ones that are not walkable: the blocking things and the NPCs
+    # (a count, as NPCs may start on the same tile)
+    occupied = collections.Counter(tuple(position) for position in state["blocked"])
+    occupied.update((x, y) for (an_id, x, y, speed) in npcs)
+    trading_posts = [(gold, list(goods)) for (gold, goods) in state["trading_posts"]]
+    good_names = Util.MName()  # Builds the Markov tables: once, not for each good restocked
+
+    for day in range(from_day, to_day):
+        rng = random.Random(Util.derive_seed(seed, state["seed"], day))
+
+        # NPC: a random walk of a few steps on the walkable tiles that are not occupied
+        for index, (an_id, x, y, speed) in enumerate(npcs):
+            for step in range(min(Constants.TICKS_PER_DAY // max(speed, 1), WANDER_STEPS_PER_DAY)):
+                new_x = x + rng.randint(-1, 1)
+                new_y = y + rng.randint(-1, 1)
+                if 0 <= new_x < max_x and 0 <= new_y < max_y and walkable[new_x * max_y + new_y] and \
+                        not occupied[(new_x, new_y)]:
+                    occupied[(x, y)] -= 1
+                    occupied[(new_x, new_y)] += 1
+                    (x, y) = (new_x, new_y)
+            npcs[index] = (an_id, x, y, speed)
+
+        # Trading posts: gold and price drift, goods sold and restocked
+        for index, (gold, goods) in enumerate(trading_posts):
+            gold = max(1, int(gold * (1 + rng.uniform(-GOLD_DRIFT, GOLD_DRIFT))))
+            goods = [(name, weight, volume, max(1, value + rng.randint(-1, 1)))
+                     for (name, weight, volume, value) in goods]
+            if goods and rng.randint(0, 99) < SELL_CHANCE:
+                goods.pop(rng.randrange(len(goods)))
+            if len(goods) < MAX_GOODS and rng.randint(0, 99) < RESTOCK_CHANCE:
+                goods.append((good_names.new(rng=rng), rng.randint(1, 10), rng.randint(1, 5), rng.randint(2, 10)))
+            trading_posts[index] = (gold, goods)
+
+    new_state = dict(state)
+    new_state["npcs"] = npcs
+    new_state["trading_posts"] = trading_posts
+    return new_state
+
+
+def apply_town_state(town, state):
+    """
+    Merge a compact state back into the town and its game objects
+    """
+    for (an_id, x, y, speed) in state["npcs"]:
+        if an_id not in GameData.game_dict:
+            continue
+        npc = GameData.game_dict[an_id]
+        if npc.position_on_tile != (x, y):
+            # Off screen: no graphical move
+            town.tile_map.map[npc.position_on_tile].unregister_thing(npc)
+            npc.displayable_object.position_on_tile = (x, y)
+            town.tile_map.map[(x, y)].register_thing(npc)
+
+    town.dirty = True
+    trading_posts = [building for building in town.buildings if hasattr(building, "goods_available")]
+    for (building, (gold, goods)) in zip(trading_posts, state["trading_posts"]):
+        building.gold = gold
+        existing_goods = {good.name: good for good in building.goods_available}
+        building.goods_available = []
+        for (name, weight, volume, value) in goods:
+            if name in existing_goods:
+                good = existing_goods.pop(name)
+                good.regular_value = value
+            else:
+                good = GameObject(name, GameObject.JUNK, weight=weight, volume=volume, regular_value=value,
+                                  displayable_object=None)
+            building.goods_available.append(good)
@@ -1,9 +1,15 @@
 __author__ = 'Tangil'
 
+import collections
+import csv
+import hashlib
+import heapq
+import json
 import random
 import sys
 import time
 
+import numpy
 import pygame
 
 import Constants
@@ -18,30 +24,89 @@ import GameData
 class Ticker(object):
     """Adapted time for Roguelike game"""
 
+    # Position of the fields in a schedule entry
+    ENTRY_TICK = 0
+    ENTRY_SEQUENCE = 1
+    ENTRY_OBJECT_ID = 2
+
     def __init__(self):
         self.ticks = 0  # current ticks--sys.maxint is 2147483647
-        self.schedule = {}  # this is the dict of things to do {ticks: [obj1, obj2, ...], ticks+1: [...], ...}
+        # The schedule is a heap of entries [tick, sequence, object_id]. The sequence number is unique and growing,
+        # so that objects scheduled for the same tick are run in the order they were scheduled.
+        # A cancelled entry keeps its place in the heap but its object_id is set to None (tombstone); it is
+        # simply dropped when it reaches the top of the heap.
+        self.schedule = []
+        self._sequence = 0
+        # Handle index: {object_id: [entry1, entry2...]} - the live entries of each object, so that cancelling
+        # or rescheduling an object never needs to scan the whole schedule.
+        self._handles = {}
+        self.profiler = None  # A TurnProfiler when the actions are profiled
         return
 
     def schedule_turn(self, interval, obj):
         """
         Schedule the next turn for this object in {interval} time
+        :return: the schedule entry, that can be given to cancel_action
         """
-        if isinstance(obj, str):
-            self.schedule.setdefault(self.ticks + interval, []).append(obj)
-        else:
-            self.schedule.setdefault(self.ticks + interval, []).append(obj.id)
-        return
+        if not isinstance(obj, str):
+            obj = obj.id
+        entry = [self.ticks + interval, self._sequence, obj]
+        self._sequence += 1
+        heapq.heappush(self.schedule, entry)
+        self._handles.setdefault(obj, []).append(entry)
+        return entry
+
+    def reschedule_turn(self, interval, obj):
+        """
+        Cancel all the future actions of this object and schedule a single one in {interval} time
+        """
+        self.cancel_future_actions(obj)
+        return self.schedule_turn(interval, obj)
 
     def next_turn(self):
         self.ticks += 1
         # print("Tick {} - Future Actions: {}".format(self.ticks, self.schedule))
-        actions = self.schedule.pop(self.ticks, [])
-        for object_id in actions:
-            if GameData.object_exist(object_id):
-                GameData.game_dict[object_id].take_action()
+        self._run_due_actions()
         return
 
+    def advance(self, number_ticks):
+        """
+        Fast forward the time by {number_ticks} ticks, see advance_until
+        """
+        return self.advance_until(self.ticks + number_ticks)
+
+    def advance_until(self, tick):
+        """
+        Fast forward the time up to {tick} (included). The ticks without any scheduled action are jumped over, so
+        the cost is proportional to the number of actions run, not to the elapsed time (travel, rest...).
+        The actions are run in the same order as with successive next_turn calls.
+        :param tick: the tick to reach
+        :return: a dict of counters: elapsed ticks, skipped (empty) ticks, batches (ticks with actions) and actions run
+        """
+        counters = {"ticks": max(tick - self.ticks, 0), "skipped": 0, "batches": 0, "actions": 0}
+        while True:
+            next_tick = self.next_scheduled_tick()
+            if next_tick is None or next_tick > tick:
+                break
+            # an action scheduled in the past (interval 0) is run at the next tick, exactly like next_turn does
+            next_tick = max(next_tick, self.ticks + 1)
+            if next_tick > tick:
+                break
+            self.ticks = next_tick
+            counters["batches"] += 1
+            counters["actions"] += self._run_due_actions()
+        self.ticks = max(self.ticks, tick)
+        counters["skipped"] = counters["ticks"] - counters["batches"]
+        return counters
+
+    def cancel_action(self, entry):
+        """
+        Cancel a single scheduled action, as returned by schedule_turn
+        """
+        if entry[Ticker.ENTRY_OBJECT_ID] is not None:
+            self._forget_entry(entry)
+            entry[Ticker.ENTRY_OBJECT_ID] = None
+        return
 
     def cancel_future_actions(self, obj):
         """
@@ -49,10 +114,206 @@ class Ticker(object):
         """
         if not isinstance(obj, str):
             obj = obj.id
-        for actions in self.schedule:
-            actions[:] = [anobj for anobj in actions if anobj != obj]
+        for entry in self._handles.pop(obj, []):
+            entry[Ticker.ENTRY_OBJECT_ID] = None
+        return
+
+    def is_scheduled(self, obj):
+        if not isinstance(obj, str):
+            obj = obj.id
+        return obj in self._handles
+
+    def next_scheduled_tick(self):
+        """
+        :return: the tick of the next (non cancelled) action, None if nothing is scheduled
+        """
+        while self.schedule and self.schedule[0][Ticker.ENTRY_OBJECT_ID] is None:
+            heapq.heappop(self.schedule)
+        if self.schedule:
+            return self.schedule[0][Ticker.ENTRY_TICK]
+        return None
+
+    def pending_actions(self):
+        """
+        :return: the list of (tick, object_id) of the scheduled actions, in the order they will be run
+        """
+        return [(entry[Ticker.ENTRY_TICK], entry[Ticker.ENTRY_OBJECT_ID]) for entry in sorted(self.schedule)
+                if entry[Ticker.ENTRY_OBJECT_ID] is not None]
+
+    def _run_due_actions(self):
+        """
+        Run all the actions scheduled up to the current tick, in schedule order. The actions scheduled while the
+        batch runs (interval 0) are left for the next tick, so an actor always rescheduling itself with 0 cannot
+        run twice in the same tick, nor loop forever.
+        :return: the number of actions run
+        """
+        actions_run = 0
+        batch_end = self._sequence
+        while self.schedule and self.schedule[0][Ticker.ENTRY_TICK] <= self.ticks and \
+                self.schedule[0][Ticker.ENTRY_SEQUENCE] < batch_end:
+            entry = heapq.heappop(self.schedule)
+            object_id = entry[Ticker.ENTRY_OBJECT_ID]
+            if object_id is None:
+                continue  # cancelled
+            self._forget_entry(entry)
+            if GameData.object_exist(object_id):
+                if self.profiler:
+                    self.profiler.time_actor(GameData.game_dict[object_id])
+                else:
+                    GameData.game_dict[object_id].take_action()
+                actions_run += 1
+        return actions_run
+
+    def enable_profiling(self, profiler=None):
+        """
+        Start recording the time spent in the actions (see TurnProfiler)
+        :param profiler: the profiler to use, a new one if not given
+        :return: the profiler
+        """
+        if not profiler:
+            profiler = TurnProfiler()
+        self.profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        """
+        Stop recording the time spent in the actions
+        :return: the profiler that was used, None if the profiling was not enabled
+        """
+        profiler = self.profiler
+        self.profiler = None
+        return profiler
+
+    def _forget_entry(self, entry):
+        object_id = entry[Ticker.ENTRY_OBJECT_ID]
+        entries = self._handles.get(object_id)
+        if entries:
+            entries.remove(entry)
+            if not entries:
+                del self._handles[object_id]
         return
 
+
+class TurnProfiler(object):
+    """
+    Records the wall time and number of calls of what runs during the turns, per actor class (the whole take_action)
+    and per action function (wander, get_close_to_player...).
+    Each entry keeps a histogram since the beginning, and the last durations to build a histogram of the recent turns.
+    """
+
+    ACTOR = "actor"
+    ACTION = "action"
+
+    # Upper bounds of the histogram buckets, in milliseconds. The last bucket holds everything above.
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50)
+
+    def __init__(self, window=1000):
+        """
+        :param window: number of durations kept per entry for the recent (rolling) histogram
+        """
+        self.window = window
+        self.stats = {}  # {(kind, name): {"calls", "total", "max", "histogram", "recent"}}, durations in ms
+
+    def record(self, kind, name, duration):
+        """
+        Record a duration
+        :param kind: ACTOR or ACTION
+        :param name: the actor class name or the action function name
+        :param duration: in seconds
+        """
+        duration *= 1000
+        key = (kind, name)
+        if key not in self.stats:
+            self.stats[key] = {"calls": 0, "total": 0.0, "max": 0.0,
+                               "histogram": [0] * (len(TurnProfiler.BUCKETS) + 1),
+                               "recent": collections.deque(maxlen=self.window)}
+        entry = self.stats[key]
+        entry["calls"] += 1
+        entry["total"] += duration
+        entry["max"] = max(entry["max"], duration)
+        entry["histogram"][TurnProfiler.bucket(duration)] += 1
+        entry["recent"].append(duration)
+
+    @staticmethod
+    def bucket(duration):
+        for index, upper_bound in enumerate(TurnProfiler.BUCKETS):
+            if duration <= upper_bound:
+                return index
+        return len(TurnProfiler.BUCKETS)
+
+    def time_actor(self, actor):
+        start = time.perf_counter()
+        actor.take_action()
+        self.record(TurnProfiler.ACTOR, actor.__class__.__name__, time.perf_counter() - start)
+
+    def time_call(self, function, **kwargs):
+        """
+        Call the action function and record its duration
+        :return: what the function returns
+        """
+        start = time.perf_counter()
+        result = function(**kwargs)
+        self.record(TurnProfiler.ACTION, function.__name__, time.perf_counter() - start)
+        return result
+
+    def reset(self):
+        self.stats = {}
+
+    def report(self):
+        """
+        :return: a list of dicts (one per entry, the most expensive first) with kind, name, calls, total_ms,
+        mean_ms, max_ms, histogram, recent_histogram
+        """
+        result = []
+        for (kind, name), entry in self.stats.items():
+            recent_histogram = [0] * (len(TurnProfiler.BUCKETS) + 1)
+            for duration in entry["recent"]:
+                recent_histogram[TurnProfiler.bucket(duration)] += 1
+            result.append({"kind": kind,
+                           "name": name,
+                           "calls": entry["calls"],
+                           "total_ms": entry["total"],
+                           "mean_ms": entry["total"] / entry["calls"],
+                           "max_ms": entry["max"],
+                           "histogram": list(entry["histogram"]),
+                           "recent_histogram": recent_histogram})
+        result.sort(key=lambda line: line["total_ms"], reverse=True)
+        return result
+
+    def dump_json(self, file_name):
+        with open(file_name, "w") as report_file:
+            json.dump({"buckets_ms": list(TurnProfiler.BUCKETS), "entries": self.report()}, report_file, indent=2)
+
+    def dump_csv(self, file_name):
+        bucket_names = ["<={}ms".format(upper_bound) for upper_bound in TurnProfiler.BUCKETS] + \
+                       [">{}ms".format(TurnProfiler.BUCKETS[-1])]
+        with open(file_name, "w", newline="") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["kind", "name", "calls", "total_ms", "mean_ms", "max_ms"] + bucket_names)
+            for line in self.report():
+                writer.writerow([line["kind"], line["name"], line["calls"], "{:.3f}".format(line["total_ms"]),
+                                 "{:.3f}".format(line["mean_ms"]), "{:.3f}".format(line["max_ms"])] +
+                                line["histogram"])
+
+    def overlay_lines(self, number_lines=5):
+        """
+        :return: a short text version of the report (the most expensive entries), to be shown in game
+        """
+        return ["{} {}: {} calls, {:.2f} ms avg, {:.2f} ms max".format(line["kind"], line["name"], line["calls"],
+                                                                     line["mean_ms"], line["max_ms"])
+                for line in self.report()[:number_lines]]
+
+
+def derive_seed(*parts):
+    """
+    Build a seed out of several parts (a world seed, a town name, a day...). Unlike the built-in hash of strings,
+    the result does not change from one process to another.
+    :return: a 64 bits integer
+    """
+    digest = hashlib.sha1("/".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
 # http://www.roguebasin.com/index.php?title=Markov_chains_name_generator_in_Python
 
 # from http://www.geocities.com/anvrill/names/cc_goth.html
@@ -93,9 +354,9 @@ class Mdict:
         else:
             self.d[prefix] = [suffix]
 
-    def get_suffix(self, prefix):
+    def get_suffix(self, prefix, rng=random):
         l = self[prefix]
-        return random.choice(l)
+        return rng.choice(l)
 
 
 class MName:
@@ -123,15 +384,16 @@ class MName:
                 self.mcd.add_key(s[n:n + chainlen], s[n + chainlen])
             self.mcd.add_key(s[len(l):len(l) + chainlen], "\n")
 
-    def new(self):
+    def new(self, rng=random):
         """
         New name from the Markov chain
+        :param rng: the random generator to use (default: the random module)
         """
         prefix = " " * self.chainlen
         name = ""
         suffix = ""
         while True:
-            suffix = self.mcd.get_suffix(prefix)
+            suffix = self.mcd.get_suffix(prefix, rng=rng)
             if suffix == "\n" or len(name) > 9:
                 break
             else:
@@ -153,11 +415,16 @@ class DebugEvent(object):
 
 
 # A STAR Algo
-# Version 1.1
+# Version 2.0
 #
 # Changes in 1.1:
 # In order to optimize the list handling I implemented the location id (lid) attribute.
 # This will make the all list serahces to become extremely more optimized.
+#
+# Changes in 2.0:
+# The open list is a binary heap, the closed list and the move costs are arrays indexed by lid, and the map handler
+# gives all the move costs at once (getMoveCosts): no node is made during the search, only for the path found.
+# The map handler must be a grid (w, h attributes, lid = y * w + x).
 
 class Path:
     def __init__(self, nodes, totalCost):
@@ -187,83 +454,212 @@ class Node:
 
 
 class AStar:
+    UNREACHED = sys.maxsize
+
     def __init__(self, maphandler):
         self.mh = maphandler
+        self.expanded = 0  # number of nodes expanded by the last search
 
-    def _getBestOpenNode(self):
-        bestNode = None
-        for n in self.on:
-            if not bestNode:
-                bestNode = n
-            else:
-                if n.score <= bestNode.score:
-                    bestNode = n
-        return bestNode
-
-    def _tracePath(self, n):
-        nodes = [];
-        totalCost = n.mCost;
-        p = n.parent;
-        nodes.insert(0, n);
-
-        while 1:
-            if p.parent is None:
-                break
+    def _tracePath(self, parents, costs, start, end):
+        """
+        :return: the Path from start (excluded) to end, with its nodes
+        """
+        lids = []
+        lid = end
+        while lid != start:
+            lids.append(lid)
+            lid = parents[lid]
+        nodes = []
+        parent = None
+        for lid in reversed(lids):
+            (y, x) = divmod(lid, self.mh.w)
+            parent = Node(SQ_Location(x, y), costs[lid], lid, parent)
+            nodes.append(parent)
+        return Path(nodes, costs[end])
+
+    def findPath(self, fromlocation, tolocation):
+        w = self.mh.w
+        h = self.mh.h
+        move_costs = self.mh.getMoveCosts()
+        start = fromlocation.y * w + fromlocation.x
+        end = tolocation.y * w + tolocation.x
+        (end_x, end_y) = (tolocation.x, tolocation.y)
+
+        closed = bytearray(w * h)
+        costs = [AStar.UNREACHED] * (w * h)
+        parents = [-1] * (w * h)
+        costs[start] = 0
+        # (score, order, lid): on a tie, the last node added comes first
+        open_heap = [(abs(fromlocation.x - end_x) + abs(fromlocation.y - end_y), 0, start)]
+        order = 0
+        self.expanded = 0
+
+        while open_heap:
+            lid = heapq.heappop(open_heap)[2]
+            if closed[lid]:
+                continue
+            if lid == end:
+                return self._tracePath(parents, costs, start, end)
+            closed[lid] = 1
+            self.expanded += 1
+            (y, x) = divmod(lid, w)
+            cost = costs[lid]
+            for next_lid in (lid + 1 if x + 1 < w else -1,
+                             lid - 1 if x > 0 else -1,
+                             lid + w if y + 1 < h else -1,
+                             lid - w if y > 0 else -1):
+                if next_lid < 0 or closed[next_lid] or not move_costs[next_lid]:
+                    continue
+                next_cost = cost + move_costs[next_lid]
+                if next_cost < costs[next_lid]:
+                    costs[next_lid] = next_cost
+                    parents[next_lid] = lid
+                    (next_y, next_x) = divmod(next_lid, w)
+                    order -= 1
+                    heapq.heappush(open_heap, (next_cost + abs(next_x - end_x) + abs(next_y - end_y), order, next_lid))
 
-            nodes.insert(0, p)
-            p = p.parent
+        return None
 
-        return Path(nodes, totalCost)
 
-    def _handleNode(self, node, end):
-        i = self.o.index(node.lid)
-        self.on.pop(i)
-        self.o.pop(i)
-        self.c.append(node.lid)
+class JumpPointSearch(AStar):
+    """
+    Jump Point Search, for 4-connected grids where every location that is not blocked costs 1 (the move costs of
+    the map handler are only used to know what is blocked). Same API as AStar.
+    Only the canonical paths are searched: a horizontal move may turn vertical anywhere, a vertical move only turns
+    horizontal when the location behind the turn is blocked (a forced neighbour). The straight lines are scanned
+    without going through the open list: only the jump points, where the path may turn, are put in it.
+    """
 
-        nodes = self.mh.getAdjacentNodes(node, end)
+    def __init__(self, maphandler):
+        super().__init__(maphandler)
+        self._verticalStopsCache = None  # (walkable grid, vertical stops), see _verticalStops
 
-        for n in nodes:
-            if n.location == end:
-                # reached the destination
-                return n
-            elif n.lid in self.c:
-                # already in close, skip this
+    def findPath(self, fromlocation, tolocation):
+        w = self.mh.w
+        h = self.mh.h
+        # The grid with a blocked border, so that the scans need no bound checks: a location is (y + 1) * row + x + 1
+        row = w + 2
+        walkable = bytearray(row * (h + 2))
+        move_costs = self.mh.getMoveCosts()
+        for y in range(h):
+            walkable[(y + 1) * row + 1:(y + 1) * row + 1 + w] = bytes(move_costs[y * w:(y + 1) * w])
+        start = (fromlocation.y + 1) * row + fromlocation.x + 1
+        end = (tolocation.y + 1) * row + tolocation.x + 1
+        if not walkable[end]:
+            return None
+        (end_x, end_y) = (tolocation.x + 1, tolocation.y + 1)
+
+        # The vertical scans are done again and again from the horizontal ones: where each of them stops is computed
+        # once for the whole grid, and kept as long as the grid does not change
+        if self._verticalStopsCache is None or self._verticalStopsCache[0] != walkable:
+            grid = numpy.frombuffer(bytes(walkable), dtype=numpy.uint8).reshape((h + 2, row)) > 0
+            self._verticalStopsCache = (walkable, {row: self._verticalStops(grid, 1),
+                                                   -row: self._verticalStops(grid, -1)})
+        vertical_stops = self._verticalStopsCache[1]
+
+        def jump_vertical(lid, step):
+            # step is +/- row. A jump point has a forced horizontal neighbour.
+            stop = vertical_stops[step][lid]
+            if lid % row == end_x and (end - lid) * step > 0 and (stop - end) * step >= 0:
+                return end
+            return stop if walkable[stop] else -1
+
+        def jump_horizontal(lid, step):
+            # step is +/- 1. A jump point has a jump point above or below.
+            while True:
+                lid += step
+                if not walkable[lid]:
+                    return -1
+                if lid == end or jump_vertical(lid, row) >= 0 or jump_vertical(lid, -row) >= 0:
+                    return lid
+
+        closed = bytearray(len(walkable))
+        costs = {start: 0}
+        parents = {start: -1}
+        open_heap = [(abs(fromlocation.x - tolocation.x) + abs(fromlocation.y - tolocation.y), 0, start)]
+        order = 0
+        self.expanded = 0
+
+        while open_heap:
+            lid = heapq.heappop(open_heap)[2]
+            if closed[lid]:
                 continue
-            elif n.lid in self.o:
-                # already in open, check if better score
-                i = self.o.index(n.lid)
-                on = self.on[i];
-                if n.mCost < on.mCost:
-                    self.on.pop(i);
-                    self.o.pop(i);
-                    self.on.append(n);
-                    self.o.append(n.lid);
+            if lid == end:
+                return self._traceJumps(parents, start, end, row)
+            closed[lid] = 1
+            self.expanded += 1
+
+            parent = parents[lid]
+            if parent < 0:
+                jumps = (jump_horizontal(lid, 1), jump_horizontal(lid, -1),
+                         jump_vertical(lid, row), jump_vertical(lid, -row))
+            elif abs(lid - parent) < row:
+                step = 1 if lid > parent else -1
+                jumps = (jump_horizontal(lid, step), jump_vertical(lid, row), jump_vertical(lid, -row))
             else:
-                # new node, append to open list
-                self.on.append(n);
-                self.o.append(n.lid);
+                step = row if lid > parent else -row
+                jumps = [jump_vertical(lid, step)]
+                for side in (1, -1):
+                    if walkable[lid + side] and not walkable[lid + side - step]:
+                        jumps.append(jump_horizontal(lid, side))
+
+            (y, x) = divmod(lid, row)
+            for next_lid in jumps:
+                if next_lid < 0 or closed[next_lid]:
+                    continue
+                (next_y, next_x) = divmod(next_lid, row)
+                next_cost = costs[lid] + abs(next_x - x) + abs(next_y - y)
+                if next_cost < costs.get(next_lid, AStar.UNREACHED):
+                    costs[next_lid] = next_cost
+                    parents[next_lid] = lid
+                    order -= 1
+                    heapq.heappush(open_heap, (next_cost + abs(next_x - end_x) + abs(next_y - end_y), order,
+                                               next_lid))
 
         return None
 
-    def findPath(self, fromlocation, tolocation):
-        self.o = []
-        self.on = []
-        self.c = []
-
-        end = tolocation
-        fnode = self.mh.getNode(fromlocation)
-        self.on.append(fnode)
-        self.o.append(fnode.lid)
-        nextNode = fnode
-
-        while nextNode is not None:
-            finish = self._handleNode(nextNode, end)
-            if finish:
-                return self._tracePath(finish)
-            nextNode = self._getBestOpenNode()
+    @staticmethod
+    def _verticalStops(grid, direction):
+        """
+        :param grid: the walkable locations, as a boolean array indexed [y, x], with a blocked border
+        :param direction: 1 to scan down (y increasing), -1 to scan up
+        :return: for each location id, the first location id after it in the direction that is blocked or has a
+        forced neighbour (see findPath), as a list
+        """
+        (rows, row) = grid.shape
+        behind = numpy.roll(grid, direction, axis=0)
+        forced = grid & ((numpy.roll(grid, -1, axis=1) & ~numpy.roll(behind, -1, axis=1)) |
+                         (numpy.roll(grid, 1, axis=1) & ~numpy.roll(behind, 1, axis=1)))
+        stops = forced | ~grid
+        y_index = numpy.arange(rows)[:, None]
+        next_y = numpy.empty(grid.shape, dtype=numpy.int64)
+        if direction > 0:
+            first_stop = numpy.minimum.accumulate(numpy.where(stops, y_index, rows - 1)[::-1], axis=0)[::-1]
+            next_y[:-1] = first_stop[1:]
+            next_y[-1] = rows - 1
+        else:
+            first_stop = numpy.maximum.accumulate(numpy.where(stops, y_index, 0), axis=0)
+            next_y[1:] = first_stop[:-1]
+            next_y[0] = 0
+        return (next_y * row + numpy.arange(row)[None, :]).ravel().tolist()
 
-        return None
+    def _traceJumps(self, parents, start, end, row):
+        """
+        :return: the Path from start (excluded) to end, with all the locations between the jump points
+        """
+        jump_points = [end]
+        while jump_points[-1] != start:
+            jump_points.append(parents[jump_points[-1]])
+        jump_points.reverse()
+        nodes = []
+        parent = None
+        for (from_lid, to_lid) in zip(jump_points, jump_points[1:]):
+            step = (1 if abs(to_lid - from_lid) < row else row) * (1 if to_lid > from_lid else -1)
+            for lid in range(from_lid + step, to_lid + step, step):
+                (y, x) = divmod(lid, row)
+                parent = Node(SQ_Location(x - 1, y - 1), len(nodes) + 1, (y - 1) * self.mh.w + x - 1, parent)
+                nodes.append(parent)
+        return Path(nodes, len(nodes))
 
 
 class SQ_Location:
@@ -304,6 +700,14 @@ class SQ_MapHandler:
         d = 1
         return Node(location, d, ((y * self.w) + x));
 
+    def getMoveCosts(self):
+        """
+        :return: the cost to move onto each location, indexed by location id (y * w + x). 0 means blocked.
+        Read straight from the blocking flag of the tiles (the same costs as getNode), without making any node.
+        """
+        m = self.m
+        return [0 if m[(x, y)].blocking else 1 for y in range(self.h) for x in range(self.w)]
+
     def getAdjacentNodes(self, curnode, dest):
         """MUST BE IMPLEMENTED"""
         result = []
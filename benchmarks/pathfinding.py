@@ -0,0 +1,93 @@
+__author__ = 'Tangil'
+"""
+Compare the A*, the Jump Point Search and the hierarchical search over the doors (see Util.AStar,
+Util.JumpPointSearch, Places.NavigationGraph) on generated towns of each size: number of nodes expanded, time per
+path and extra length compared to the A*, between random walkable tiles.
+Headless: run it from anywhere, e.g. python benchmarks/pathfinding.py --towns 10 --queries 50
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Places
+import Util
+
+# Number of buildings giving each town size (see Places.Town)
+BUILDING_NUMBERS = {(50, 50): 3, (65, 65): 5, (80, 80): 7}
+
+# {name: function building the search for a tile map}. The first one is the reference for the path lengths.
+SEARCHES = {
+    "AStar": lambda tile_map: Util.AStar(Places.TileMapHandler(tile_map)),
+    "JumpPointSearch": lambda tile_map: Util.JumpPointSearch(Places.TileMapHandler(tile_map)),
+    "NavigationGraph": lambda tile_map: Places.NavigationGraph(tile_map),
+}
+
+
+def make_tile_map(size, seed):
+    town = Places.Town(BUILDING_NUMBERS[size], seed=seed)
+    tile_map = Places.TownTileMap(town, town.size)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tile_map.make_map(decorate=False)
+    return tile_map
+
+
+def run_search(search, start, end):
+    """
+    :return: (path, nodes expanded, time in seconds)
+    """
+    start_time = time.perf_counter()
+    path = search.findPath(Util.SQ_Location(*start), Util.SQ_Location(*end))
+    return path, search.expanded, time.perf_counter() - start_time
+
+
+def benchmark(size, towns, queries, seed):
+    """
+    :return: {search name: (mean nodes expanded, mean ms, number of paths longer than the reference)}
+    """
+    rng = random.Random(seed)
+    totals = {name: [0, 0.0, 0] for name in SEARCHES}
+    for town_number in range(towns):
+        tile_map = make_tile_map(size, Util.derive_seed(seed, size, town_number))
+        walkable = [place for place in tile_map.map if not tile_map.is_blocking(place)]
+        # One search per town: the searches may keep what they computed out of the map
+        searches = {name: make_search(tile_map) for name, make_search in SEARCHES.items()}
+        for query in range(queries):
+            (start, end) = (rng.choice(walkable), rng.choice(walkable))
+            reference = None
+            for name, total in totals.items():
+                (path, expanded, duration) = run_search(searches[name], start, end)
+                total[0] += expanded
+                total[1] += duration
+                length = path.getTotalMoveCost() if path else None
+                if reference is None:
+                    reference = length
+                elif length != reference:
+                    total[2] += 1
+    number = towns * queries
+    return {name: (total[0] / number, total[1] / number * 1000, total[2]) for name, total in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--towns", type=int, default=5, help="number of towns per size")
+    parser.add_argument("--queries", type=int, default=50, help="number of paths per town")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("{:>7} {:>16} {:>10} {:>10} {:>10}".format("size", "search", "expanded", "ms/path", "longer"))
+    for size in sorted(BUILDING_NUMBERS):
+        for name, (expanded, milliseconds, longer) in benchmark(size, args.towns, args.queries, args.seed).items():
+            print("{:>7} {:>16} {:>10.1f} {:>10.3f} {:>10}".format("{}x{}".format(*size), name, expanded,
+                                                                    milliseconds, longer))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+__author__ = 'Tangil'
+"""
+Time the generation of the towns on fixed seeds, stage by stage: ground, lakes and rocks, room placement, door
+pathing (see Places.TownTileMap.make_map), decoration and rendering. For each town size: mean time of each stage,
+towns per second, and the number of retries (maps generated again from scratch) and of repaired connections.
+The stages are told apart by the messages make_map prints when it starts them.
+Headless: run it from anywhere, e.g. python benchmarks/worldgen.py --towns 20
+Two revisions of the code can be compared on the same seeds: python benchmarks/worldgen.py --compare HEAD~3 HEAD
+("." is the working tree). Each revision is run in its own process, out of a copy made with git archive.
+The decoration and the rendering need the image resources: they are looked for in the resources folder of --resources
+(the root of the code by default), and left out if they are not there.
+"""
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Number of buildings giving each town size (see Places.Town)
+BUILDING_NUMBERS = {(50, 50): 3, (65, 65): 5, (80, 80): 7}
+
+# The stages of make_map, with the message printed when each one starts
+MAKE_MAP_STAGES = [("ground", "Generating ground"), ("lakes", "Generating lake and rocks"),
+                   ("rooms", "Placing rooms"), ("doors", "Settings doors in rooms")]
+STAGES = [name for (name, message) in MAKE_MAP_STAGES] + ["decoration", "render"]
+RETRY_MESSAGE = "Regenerating"
+REPAIR_MESSAGE = "Repairing"
+
+
+class StageClock(object):
+    """
+    Stands for stdout while make_map runs: each stage message stops the clock of the stage in progress and starts
+    the one of the new stage. A stage run several times (retries) adds up.
+    """
+
+    def __init__(self):
+        self.times = {}  # {stage: seconds}
+        self.retries = 0
+        self.repairs = 0
+        self._stage = None
+        self._start = None
+
+    def write(self, text):
+        now = time.perf_counter()
+        for line in text.splitlines():
+            for (stage, message) in MAKE_MAP_STAGES:
+                if line.startswith(message):
+                    self.stop(now)
+                    (self._stage, self._start) = (stage, now)
+            self.retries += RETRY_MESSAGE in line
+            self.repairs += line.startswith(REPAIR_MESSAGE)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def stop(self, now=None):
+        if self._stage:
+            now = now or time.perf_counter()
+            self.times[self._stage] = self.times.get(self._stage, 0.0) + now - self._start
+            self._stage = None
+
+
+def generate_town(modules, size, seed, graphics):
+    """
+    Generate and render one town
+    :param modules: the game modules (see load_modules)
+    :param graphics: False to leave out the decoration and the rendering
+    :return: (times {stage: seconds}, retries, repairs)
+    """
+    (Constants, GameData, Places) = modules
+    # Older revisions keep the game objects in a plain dict, and draw the towns from the global random generator
+    GameData.game_dict = GameData.EntityRegistry() if hasattr(GameData, "EntityRegistry") else {}
+    if "seed" in inspect.signature(Places.Town).parameters:
+        town = Places.Town(BUILDING_NUMBERS[size], seed=seed)
+    else:
+        random.seed(seed)
+        town = Places.Town(BUILDING_NUMBERS[size])
+    tile_map = Places.TownTileMap(town, size)
+    town.tile_map = tile_map
+    clock = StageClock()
+    with contextlib.redirect_stdout(clock):
+        # Older revisions always decorate the rooms at the end of make_map: the decoration is then counted in the
+        # doors, and is done even without graphics
+        if "decorate" in inspect.signature(tile_map.make_map).parameters:
+            tile_map.make_map(decorate=graphics and not hasattr(tile_map, "decorate"))
+        else:
+            tile_map.make_map()
+        clock.stop()
+        if graphics:
+            for (stage, step) in (("decoration", getattr(tile_map, "decorate", None)),
+                                  ("render", lambda: tile_map.render(Constants.DAWNLIKE_STYLE))):
+                if step:
+                    start = time.perf_counter()
+                    step()
+                    clock.times[stage] = time.perf_counter() - start
+    return clock.times, clock.retries, clock.repairs
+
+
+def load_modules(tree, resources):
+    """
+    Import the game modules of a copy of the code
+    :param tree: the root of the code
+    :param resources: the folder holding the resources folder
+    :return: (Constants, GameData, Places), and True if the images are there (see generate_town)
+    """
+    sys.path.insert(0, tree)
+    os.chdir(resources)
+    import pygame
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    import Constants
+    import GameData
+    import Places
+    return (Constants, GameData, Places), os.path.isdir(Constants.DAWNLIKE_IMAGE_RESOURCE_FOLDER)
+
+
+def benchmark(modules, size, towns, seed, graphics, per_seed=False):
+    """
+    :return: {"stages": {stage: mean ms}, "towns_per_second", "retries", "repairs"}
+    """
+    totals = dict.fromkeys(STAGES, 0.0)
+    (retries, repairs, elapsed) = (0, 0, 0.0)
+    for town_number in range(towns):
+        town_seed = seed * 1000003 + size[0] * 1009 + town_number
+        start = time.perf_counter()
+        (times, town_retries, town_repairs) = generate_town(modules, size, town_seed, graphics)
+        elapsed += time.perf_counter() - start
+        for stage, seconds in times.items():
+            totals[stage] += seconds
+        (retries, repairs) = (retries + town_retries, repairs + town_repairs)
+        if per_seed:
+            print("{:>7} {:>20} ".format("{}x{}".format(*size), town_seed) +
+                  " ".join("{:>10.2f}".format(times.get(stage, 0.0) * 1000) for stage in STAGES) +
+                  " {:>8} {:>8}".format(town_retries, town_repairs))
+    return {"stages": {stage: seconds / towns * 1000 for stage, seconds in totals.items()},
+            "towns_per_second": towns / elapsed if elapsed else 0.0,
+            "retries": retries,
+            "repairs": repairs}
+
+
+def print_results(results, title=None):
+    if title:
+        print(title)
+    print("{:>7} ".format("size") + " ".join("{:>10}".format(stage) for stage in STAGES) +
+          " {:>10} {:>8} {:>8} {:>8}".format("total", "towns/s", "retries", "repairs"))
+    for size, result in results.items():
+        stages = result["stages"]
+        print("{:>7} ".format(size) + " ".join("{:>10.2f}".format(stages[stage]) for stage in STAGES) +
+              " {:>10.2f} {:>8.1f} {:>8} {:>8}".format(sum(stages.values()), result["towns_per_second"],
+                                                      result["retries"], result["repairs"]))
+
+
+def export_tree(revision, destination):
+    """
+    Copy the code of a git revision ("." for the working tree) in destination
+    :return: the root of the copy
+    """
+    if revision == ".":
+        return ROOT
+    archive = subprocess.run(["git", "-C", ROOT, "archive", "--format=tar", revision], check=True,
+                             stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(destination)
+    return destination
+
+
+def compare(revisions, arguments):
+    """
+    Run the benchmark on two revisions, each one in its own process, and print the results side by side
+    """
+    all_results = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        for index, revision in enumerate(revisions):
+            tree = export_tree(revision, os.path.join(work_folder, str(index)))
+            output = os.path.join(work_folder, "{}.json".format(index))
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--tree", tree, "--json", output,
+                            "--resources", arguments.resources or ROOT] + arguments.forwarded, check=True,
+                           stdout=subprocess.DEVNULL)
+            with open(output) as results_file:
+                all_results.append(json.load(results_file))
+    for revision, results in zip(revisions, all_results):
+        print_results(results, title="Revision {}".format(revision))
+        print()
+    print("{:>7} {:>12} {:>12} {:>8}".format("size", revisions[0][:12], revisions[1][:12], "speedup"))
+    for size in all_results[0]:
+        (before, after) = (sum(all_results[0][size]["stages"].values()),
+                           sum(all_results[1][size]["stages"].values()))
+        print("{:>7} {:>12.2f} {:>12.2f} {:>8}".format(size, before, after,
+                                                       "{:.2f}x".format(before / after) if after else "-"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--towns", type=int, default=10, help="number of towns per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-graphics", action="store_true", help="leave out the decoration and the rendering")
+    parser.add_argument("--per-seed", action="store_true", help="print the timings of each town")
+    parser.add_argument("--resources", help="the folder holding the resources folder (default: the code root)")
+    parser.add_argument("--compare", nargs=2, metavar="REVISION", help="compare two git revisions")
+    parser.add_argument("--tree", default=ROOT, help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="also write the results in this file")
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        arguments.forwarded = ["--towns", str(arguments.towns), "--seed", str(arguments.seed)] + \
+                              (["--no-graphics"] if arguments.no_graphics else [])
+        compare(arguments.compare, arguments)
+        return
+
+    (modules, images) = load_modules(arguments.tree, arguments.resources or arguments.tree)
+    graphics = images and not arguments.no_graphics
+    if not images and "decorate" not in inspect.signature(modules[2].TownTileMap.make_map).parameters:
+        sys.exit("Error: the towns of {} are decorated by make_map, which needs the image resources "
+                 "(see --resources)".format(arguments.tree))
+    if images is False and not arguments.no_graphics:
+        print("Warning: no image resources, the decoration and the rendering are left out")
+    if arguments.per_seed:
+        print("{:>7} {:>20} ".format("size", "seed") + " ".join("{:>10}".format(stage) for stage in STAGES) +
+              " {:>8} {:>8}".format("retries", "repairs"))
+    results = {"{}x{}".format(*size): benchmark(modules, size, arguments.towns, arguments.seed, graphics,
+                                                per_seed=arguments.per_seed)
+               for size in sorted(BUILDING_NUMBERS)}
+    print_results(results)
+    if arguments.json:
+        with open(arguments.json, "w") as results_file:
+            json.dump(results, results_file)
+
+
+if __name__ == "__main__":
+    main()
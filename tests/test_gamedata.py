@@ -0,0 +1,40 @@
+__author__ = 'Tangil'
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import GameData
+
+
+class Thing(object):
+    def __init__(self, name, speed=None):
+        self.id = self.name = name
+        if speed:
+            self.speed = speed
+
+
+def test_actors_by_town_follow_the_moves():
+    registry = GameData.EntityRegistry()
+    (actor, other_actor, thing) = (Thing("actor", speed=10), Thing("other actor", speed=5), Thing("thing"))
+    for an_object in (actor, other_actor, thing):
+        registry.register(an_object)
+        registry.set_town(an_object, "town")
+    assert sorted(registry.actors("town")) == ["actor", "other actor"]
+
+    registry.set_town(actor, "other town")
+    assert registry.actors("town") == ["other actor"]
+    assert registry.actors("other town") == ["actor"]
+
+    registry.unregister(other_actor)
+    assert registry.actors("town") == []
+    assert sorted(registry.actors()) == ["actor"]
+
+
+def test_actor_placed_in_a_town_before_being_registered():
+    registry = GameData.EntityRegistry()
+    actor = Thing("actor", speed=10)
+    registry.set_town(actor, "town")
+    registry.register(actor)
+    assert registry.actors("town") == ["actor"]
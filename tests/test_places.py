@@ -0,0 +1,119 @@
+__author__ = 'Tangil'
+
+import os
+import random
+import sys
+import weakref
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import Constants
+import GameData
+import Places
+import Util
+from Displayable import DisplayableObject, SpriteObject
+
+
+def make_town(seed):
+    """
+    A town with its map generated, without the graphics (no image resources needed)
+    """
+    town = Places.Town(3, seed=seed)
+    town.tile_map = Places.TownTileMap(town, (50, 50))
+    town.tile_map.make_map(decorate=False)
+    town.tile_map.surface_memory = pygame.Surface((1, 1))
+    return town
+
+
+class Thing(object):
+    """
+    A thing with a sprite (without image, so that no resource is needed)
+    """
+
+    def __init__(self, name, town, position_on_tile):
+        self.id = self.name = name
+        self.town = town
+        self.displayable_object = DisplayableObject(
+            position_on_tile=position_on_tile,
+            graphical_representation=SpriteObject(Constants.DAWNLIKE_STYLE, "", None, None))
+        GameData.register_object(self)
+
+
+def setup_function(function):
+    GameData.game_dict = GameData.EntityRegistry()
+    GameData.current_town = None
+
+
+def test_evict_releases_the_surfaces():
+    town = make_town(1)
+    things = [Thing("thing {}".format(index), town, (index, index)) for index in range(3)]
+    surface_to_draw = pygame.Surface((1, 1))
+    for a_thing in things:
+        a_thing.displayable_object.set_graphical_surface(surface_to_draw, town.tile_map.surface_memory)
+    (draw_reference, memory_reference) = (weakref.ref(surface_to_draw), weakref.ref(town.tile_map.surface_memory))
+    del surface_to_draw
+
+    town.evict()
+    assert town.tile_map.surface_memory is None
+    assert draw_reference() is None
+    assert memory_reference() is None
+
+
+def test_things_by_position():
+    town = make_town(1)
+    Thing("thing", town, (3, 4))
+    assert GameData.game_dict.at_position(town, (3, 4)) == ["thing"]
+    assert GameData.game_dict.at_position(town, (4, 3)) == []
+
+
+def test_connectivity_follows_the_tile_changes():
+    town = make_town(2)
+    tile_map = town.tile_map
+    connectivity = tile_map.connectivity_index()
+    connectivity.compute()
+    rng = random.Random(0)
+    positions = [(x, y) for x in range(tile_map.max_x) for y in range(tile_map.max_y)]
+    for change in range(300):
+        tile_map.set_floor_type(rng.choice(positions), rng.choice((Places.Tile.WALL, Places.Tile.GRASS)))
+        if change % 30 == 0:
+            fresh = Places.ConnectivityIndex(tile_map)
+            for (position, other_position) in ((rng.choice(positions), rng.choice(positions)) for _ in range(200)):
+                assert connectivity.connected(position, other_position) == fresh.connected(position, other_position)
+
+
+def test_random_place_in_building():
+    town = make_town(3)
+    tile_map = town.tile_map
+    rng = random.Random(0)
+    for room in tile_map.rooms:
+        name = room.building.name
+        places = [tile_map.get_place_in_building(name, rng=rng) for _ in range(20)]
+        for place in places:
+            assert not tile_map.is_blocking(place)
+            assert tile_map.get_room(place).name == name
+            assert tile_map.connectivity_index().connected(place, places[0])
+
+
+def test_default_move_costs_match_the_blocking_layer():
+    tile_map = make_town(4).tile_map
+    handler = Util.SQ_MapHandler(tile_map.map, tile_map.max_x, tile_map.max_y)
+    assert handler.getMoveCosts() == Places.TileMapHandler(tile_map).getMoveCosts()
+
+
+def test_evicted_layers_are_restored():
+    tile_map = make_town(5).tile_map
+    (floor_layer, room_layer) = (tile_map.floor_layer.copy(), tile_map.room_layer.copy())
+    assert tile_map.generated
+    tile_map.evict_layers()
+    tile_map.restore_layers()
+    assert (tile_map.floor_layer == floor_layer).all() and (tile_map.room_layer == room_layer).all()
+
+    tile_map.set_floor_type((0, 0), Places.Tile.WALL)
+    floor_layer = tile_map.floor_layer.copy()
+    tile_map.evict_layers()
+    assert tile_map.walkable_layer()[0, 0] == False
+    tile_map.restore_layers()
+    assert (tile_map.floor_layer == floor_layer).all() and (tile_map.room_layer == room_layer).all()
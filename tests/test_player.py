@@ -0,0 +1,41 @@
+__author__ = 'Tangil'
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import GameData
+import Places
+import Player
+
+
+def make_town(seed):
+    """
+    A town with its map generated, without the graphics (no image resources needed)
+    """
+    town = Places.Town(3, seed=seed)
+    town.tile_map = Places.TownTileMap(town, (50, 50))
+    town.tile_map.make_map(decorate=False)
+    town.tile_map.surface_memory = pygame.Surface((1, 1))
+    return town
+
+
+def setup_function(function):
+    GameData.game_dict = GameData.EntityRegistry()
+
+
+def test_travel_registers_the_player_on_the_destination_tile():
+    (town, other_town) = (make_town(1), make_town(2))
+    player = Player.Player(town, position_on_tile=town.tile_map.default_start_player_position)
+    GameData.register_object(player)
+    start = player.position_on_tile
+    assert player.id in town.tile_map.map[start].name_of_things_on_tile
+
+    player.travel_to(other_town)
+    assert player.position_on_tile == other_town.tile_map.default_start_player_position
+    assert player.id in other_town.tile_map.map[player.position_on_tile].name_of_things_on_tile
+    assert player.id not in town.tile_map.map[start].name_of_things_on_tile
@@ -0,0 +1,171 @@
+__author__ = 'Tangil'
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+
+import Constants
+import GameData
+import Places
+import Player
+import SaveGame
+import Simulation
+import Util
+from Displayable import AnimatedSpriteObject
+from GameObject import Door
+
+
+@pytest.fixture(autouse=True)
+def blank_images(monkeypatch):
+    """
+    The image resources are not part of the code: the missing images are replaced by blank ones
+    """
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    load = pygame.image.load
+    monkeypatch.setattr(pygame.image, "load",
+                        lambda file_name, *args: load(file_name, *args) if os.path.exists(file_name) else
+                        pygame.Surface((1024, 1024)))
+
+
+def show(town):
+    """
+    Give the surfaces to the things of the town, as Game.assign_surface_to_displayable_objects
+    """
+    for a_thing in [GameData.player] + [GameData.game_dict[an_id] for an_id in GameData.game_dict.in_town(town)]:
+        displayable_object = getattr(a_thing, "displayable_object", None)
+        if displayable_object and displayable_object.graphical_representation:
+            displayable_object.set_graphical_surface(town.tile_map.surface_memory.copy(), town.tile_map.surface_memory)
+
+
+def make_world(seed, number_towns=3):
+    """
+    A new game on a fixed seed, as Game.start_new_game makes it (without the display)
+    """
+    GameData.game_dict = GameData.EntityRegistry()
+    GameData.world_seed = seed
+    GameData.time_ticker = Util.Ticker()
+    GameData.town_cache = Places.TownCache()
+    GameData.town_prefetcher = None
+    GameData.autosave = None
+    towns = [Places.Town(3, seed=Util.derive_seed(seed, "town", index)) for index in range(number_towns)]
+    GameData.town_graph = Places.TownGraph(towns, rng=random.Random(Util.derive_seed(seed, "graph")))
+    GameData.current_town = towns[0]
+    towns[0].materialize()
+    GameData.player = Player.Player(towns[0], position_on_tile=towns[0].tile_map.default_start_player_position,
+                                    graphical_representation=AnimatedSpriteObject(Constants.DAWNLIKE_STYLE,
+                                                                                  "Characters", "Player", (16, 112)))
+    GameData.game_dict.register(GameData.player)
+    towns[0].tile_map.map[GameData.player.position_on_tile].register_thing(GameData.player)
+    GameData.world_simulation = Simulation.WorldSimulation(seed=Util.derive_seed(seed, "simulation"))
+    GameData.world_simulation.start()
+    GameData.world_simulation.enter_town(towns[0])
+    show(towns[0])
+    return towns
+
+
+def play(towns):
+    """
+    Visit a second town and change it, so that the save holds a generated map (the first town), a stored map (the
+    second one, changed) and a town never visited
+    """
+    GameData.time_ticker.advance(10)
+    GameData.player.travel_to(towns[1], days=1)
+    show(towns[1])
+    GameData.time_ticker.advance(5)
+    towns[1].tile_map.set_floor_type((0, 0), Places.Tile.WALL)
+    door = GameData.game_dict[GameData.game_dict.instances_of(Door)[0]]
+    door.closed = True
+    door.set_locked(True)
+    return door
+
+
+def game_state():
+    """
+    The records of the game, each one encoded on its own: unlike a whole save, the result does not depend on the
+    order of the things in GameData.game_dict (a journal replay registers the changed things again, at the end)
+    """
+    towns = GameData.town_graph.towns
+    town_index = {town: index for (index, town) in enumerate(towns)}
+
+    def encode(write, *args):
+        writer = SaveGame.SaveWriter()
+        write(writer, *args)
+        return writer.to_bytes()
+
+    return {"ticks": GameData.time_ticker.ticks,
+            "current_town": town_index[GameData.current_town],
+            "towns": [encode(SaveGame.write_town, town) for town in towns],
+            "things": {an_id: encode(SaveGame.write_thing, GameData.game_dict[an_id], town_index)
+                       for an_id in GameData.game_dict if SaveGame.is_saved_thing(GameData.game_dict[an_id])},
+            "player": encode(SaveGame.write_player, GameData.player),
+            "pending_actions": GameData.time_ticker.pending_actions()}
+
+
+def test_save_load_save(tmp_path):
+    towns = make_world(1)
+    door = play(towns)
+    assert towns[0].tile_map.generated and not towns[1].tile_map.generated and not towns[2].materialized
+    pending_actions = GameData.time_ticker.pending_actions()
+    assert pending_actions
+    file_name = str(tmp_path / "game.sav")
+    SaveGame.save(file_name)
+    data = SaveGame.snapshot().to_bytes()
+
+    SaveGame.load(file_name)
+    assert SaveGame.snapshot().to_bytes() == data
+    assert GameData.time_ticker.pending_actions() == pending_actions
+    (loaded_towns, current_town) = (GameData.town_graph.towns, GameData.current_town)
+    assert current_town is loaded_towns[1]
+    assert loaded_towns[0].tile_map.generated and not loaded_towns[2].materialized
+    assert current_town.tile_map.map[(0, 0)].floor_type == Places.Tile.WALL
+    loaded_door = GameData.game_dict[door.id]
+    assert loaded_door.locked and loaded_door.closed
+    assert GameData.player.id in current_town.tile_map.map[GameData.player.position_on_tile].name_of_things_on_tile
+
+    loaded_towns[0].materialize()
+    assert (loaded_towns[0].tile_map.floor_layer == towns[0].tile_map.floor_layer).all()
+
+
+def test_autosave_journal(tmp_path):
+    towns = make_world(2)
+    file_name = str(tmp_path / "autosave.sav")
+    autosave = SaveGame.AutoSave(file_name, compaction_interval=2)
+    states = []
+
+    def save():
+        autosave.save()
+        states.append(game_state())
+
+    save()  # full
+    GameData.time_ticker.advance(10)
+    save()  # changes
+    door = play(towns)
+    save()  # changes
+    GameData.time_ticker.advance(7)
+    save()  # full again: compaction
+    towns[1].tile_map.set_floor_type((1, 0), Places.Tile.WALL)
+    door.set_locked(False)
+    GameData.time_ticker.advance(3)
+    save()  # changes
+    GameData.time_ticker.advance(4)
+    save()  # changes
+    autosave.stop()
+    assert len(SaveGame.read_journal(file_name + SaveGame.JOURNAL_SUFFIX)) == 2
+
+    SaveGame.load(file_name)
+    assert game_state() == states[-1]
+    assert not GameData.game_dict[door.id].locked
+
+    # An interrupted write: the last block is dropped, the game is the one of the save before
+    with open(file_name + SaveGame.JOURNAL_SUFFIX, "r+b") as journal:
+        journal.truncate(os.path.getsize(file_name + SaveGame.JOURNAL_SUFFIX) - 3)
+    assert len(SaveGame.read_journal(file_name + SaveGame.JOURNAL_SUFFIX)) == 1
+    SaveGame.load(file_name)
+    assert game_state() == states[-2]
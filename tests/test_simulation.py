@@ -0,0 +1,39 @@
+__author__ = 'Tangil'
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import Simulation
+
+
+def make_state(name, seed, blocked=(), npcs=(("npc", 5, 5, 10),)):
+    return {"name": name, "seed": seed, "size": (10, 10), "walkable": bytes([1]) * 100, "blocked": list(blocked),
+            "npcs": list(npcs), "trading_posts": [(100, [("Good", 1, 1, 5)])]}
+
+
+def test_towns_with_the_same_name_get_their_own_random_streams():
+    state = Simulation.advance_town_state(make_state("Ada", 1), 0, 10, 7)
+    other_state = Simulation.advance_town_state(make_state("Ada", 2), 0, 10, 7)
+    assert state["npcs"] != other_state["npcs"] or state["trading_posts"] != other_state["trading_posts"]
+
+
+def test_the_random_streams_do_not_depend_on_the_name():
+    state = Simulation.advance_town_state(make_state("Ada", 1), 0, 10, 7)
+    other_state = Simulation.advance_town_state(make_state("Kala", 1), 0, 10, 7)
+    assert (state["npcs"], state["trading_posts"]) == (other_state["npcs"], other_state["trading_posts"])
+
+
+def test_the_npcs_do_not_walk_onto_blocked_tiles():
+    blocked = [(x, y) for x in range(10) for y in range(10) if (x + y) % 3 == 0]
+    npcs = [("npc {}".format(index), x, y, 1) for (index, (x, y)) in
+            enumerate((x, y) for x in range(10) for y in range(10) if (x + y) % 3 and x % 2)]
+    state = make_state("Ada", 1, blocked=blocked, npcs=npcs)
+    for day in range(20):
+        state = Simulation.advance_town_state(state, day, day + 1, 7)
+        positions = [(x, y) for (an_id, x, y, speed) in state["npcs"]]
+        assert len(set(positions)) == len(positions)
+        assert not set(positions) & set(blocked)
+    assert positions != [(x, y) for (an_id, x, y, speed) in npcs]
@@ -0,0 +1,54 @@
+__author__ = 'Tangil'
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import GameData
+import Util
+
+
+class Actor(object):
+    """
+    An actor rescheduling itself with a fixed interval each time it acts
+    """
+
+    def __init__(self, name, ticker, interval):
+        self.id = self.name = name
+        self.speed = interval
+        self.ticker = ticker
+        self.town = None
+        self.ticks_run = []
+        GameData.register_object(self)
+
+    def take_action(self):
+        self.ticks_run.append(self.ticker.ticks)
+        self.ticker.schedule_turn(self.speed, self)
+
+
+def setup_function(function):
+    GameData.game_dict = GameData.EntityRegistry()
+
+
+def test_reschedule_with_interval_0_runs_once_per_tick():
+    ticker = Util.Ticker()
+    actor = Actor("eager", ticker, 0)
+    ticker.schedule_turn(1, actor)
+    for _ in range(3):
+        ticker.next_turn()
+    assert actor.ticks_run == [1, 2, 3]
+
+
+def test_advance_with_interval_0_runs_once_per_tick():
+    ticker = Util.Ticker()
+    actor = Actor("eager", ticker, 0)
+    other = Actor("slow", ticker, 2)
+    ticker.schedule_turn(1, actor)
+    ticker.schedule_turn(2, other)
+    counters = ticker.advance(4)
+    assert actor.ticks_run == [1, 2, 3, 4]
+    assert other.ticks_run == [2, 4]
+    assert counters["actions"] == 6
+    assert ticker.ticks == 4